@@ -0,0 +1,94 @@
+"""
+Equivalence and timing of backfill_user_features against one run of the single-date
+features per reference date.
+
+For each date, the single-date run is create_temporal_engagement_df_optimized and
+create_user_topic_enrichment with reference_date=date, on the interactions before the
+date. The rows of the date in the backfill must be identical.
+
+Usage (after pip install -e .): python benchmarks/bench_backfill.py [--events 5000000] [--dates 12]
+"""
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from etreprof.data_processing.interactions import PreparedInteractions
+from etreprof.data_processing.user_frequency import create_temporal_engagement_df_optimized
+from etreprof.data_processing.user_contents import create_user_topic_enrichment
+from etreprof.data_processing.backfill import backfill_user_features
+
+LAST_DATE = datetime(2025, 7, 10, 15, 53, 58)
+N_USERS = 200_000
+N_CONTENTS = 20_000
+
+
+def synthetic_data(n_events, seed=0):
+    """Interactions over 5 years as read from the CSV, contents with topics."""
+    rng = np.random.default_rng(seed)
+    valid_ids = np.arange(1, N_CONTENTS + 1, 2)
+    df_content_valid = pd.DataFrame({'id': valid_ids, 'reduced topics': rng.integers(-1, 16, len(valid_ids))})
+
+    content_ids = ((rng.zipf(1.2, n_events) % (N_CONTENTS + 2000)) + 1).astype(str).astype(object)
+    content_ids[rng.random(n_events) < 0.1] = np.nan
+    seconds = rng.integers(0, 5 * 365 * 86400, n_events)
+    created_at = pd.Series(np.datetime64(LAST_DATE) - seconds.astype('timedelta64[s]'))
+    df_interactions = pd.DataFrame({
+        'user_id': (rng.zipf(1.3, n_events) % N_USERS) + 1,
+        'content_id': content_ids,
+        'created_at': created_at.dt.strftime('%Y-%m-%d %H:%M:%S')
+    })
+    return df_interactions, df_content_valid
+
+
+def single_date_features(df_interactions, df_content_valid, date):
+    """The features as of date, from the interactions before it."""
+    before = df_interactions[pd.to_datetime(df_interactions['created_at']) < date]
+    interactions = PreparedInteractions(before)
+    df_engagement = create_temporal_engagement_df_optimized(interactions, reference_date=date)
+    return create_user_topic_enrichment(interactions, df_engagement, df_content_valid, reference_date=date)
+
+
+def check_date(df_backfill, df_single, date):
+    df_date = df_backfill[df_backfill['as_of_date'] == date].drop(columns='as_of_date').reset_index(drop=True)
+    df_single = df_single.reset_index(drop=True)
+    for column in df_single.columns:
+        if column.startswith('topic_'):
+            df_single[column] = df_single[column].astype(np.int64)
+    # Topics only consulted at other dates are all zeros
+    others = [column for column in df_date.columns if column not in df_single.columns]
+    assert all((df_date[column] == 0).all() for column in others), others
+    pd.testing.assert_frame_equal(df_date[df_single.columns], df_single)
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--events', type=int, default=5_000_000, help="Number of interactions")
+    parser.add_argument('--dates', type=int, default=12, help="Number of monthly reference dates")
+    args = parser.parse_args()
+
+    df_interactions, df_content_valid = synthetic_data(args.events)
+    dates = list(pd.date_range(end=LAST_DATE, periods=args.dates, freq='30D'))
+
+    df_backfill, backfill_seconds = timed(backfill_user_features, df_interactions, dates, df_content_valid)
+
+    single_seconds = 0
+    for date in dates:
+        df_single, seconds = timed(single_date_features, df_interactions, df_content_valid, date)
+        single_seconds += seconds
+        check_date(df_backfill, df_single, date)
+
+    print(f"✅ Identical to the single-date features at {len(dates)} dates "
+          f"({len(df_backfill):,} rows x {df_backfill.shape[1]} columns, {args.events:,} interactions)")
+    print(f"⏱️  One run per date {single_seconds:.2f} s - backfill {backfill_seconds:.2f} s "
+          f"(x{single_seconds / backfill_seconds:.1f})")
+
+
+if __name__ == "__main__":
+    main()
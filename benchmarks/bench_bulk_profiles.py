@@ -0,0 +1,108 @@
+"""
+Latency of POST /users/profiles at 1k and 50k ids per call, against one
+GET /user/{user_id}/profile request per id.
+
+Synthetic cluster assignments are written to a temporary file (USER_ASSIGNMENTS_PATH),
+with the materialized recommendation table built from them (RECO_TABLE_DIR). A tenth of
+the requested ids are unknown. The per-id endpoint is measured on a sample of ids and
+extrapolated, and its cost before the assignments became a loaded artifact (one CSV read
+and scan per id) is measured on a few ids.
+
+Usage (after pip install -e .): python benchmarks/bench_bulk_profiles.py [--users 300000]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+
+NIVEAUX = ['maternelle', 'elementaire', 'college', 'lycee', 'lycee_pro']
+ACADEMIES = ['Paris', 'Versailles', 'Lyon', 'Bordeaux', 'La Réunion', None]
+
+
+def synthetic_assignments(n_users, rng):
+    df = pd.DataFrame({
+        'id': rng.permutation(n_users * 2)[:n_users] + 1,
+        'cluster': rng.integers(0, 5, n_users),
+        'anciennete': np.where(rng.random(n_users) < 0.1, np.nan, rng.integers(0, 30, n_users)),
+        'degre': rng.choice([1.0, 2.0, np.nan], n_users),
+        'academie': rng.choice(np.array(ACADEMIES, dtype=object), n_users)
+    })
+    for niveau in NIVEAUX:
+        df[niveau] = (rng.random(n_users) < 0.3).astype(int)
+    return df
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--users', type=int, default=300_000, help="Number of users in the assignments")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    directory = tempfile.mkdtemp()
+    assignments_path = os.path.join(directory, 'user_cluster_assignments.csv')
+    df_assignments = synthetic_assignments(args.users, rng)
+    df_assignments.to_csv(assignments_path, index=False)
+
+    os.environ["USER_ASSIGNMENTS_PATH"] = assignments_path
+    os.environ["RECO_TABLE_DIR"] = os.path.join(directory, 'reco_table')
+    os.environ.setdefault("SERVING_PROFILE", "lite")
+    from fastapi.testclient import TestClient
+    from etreprof.ml_package.recommender import load_recommendations_csv
+    from etreprof.ml_package.reco_table import build_reco_table
+    from etreprof.api.main import app
+
+    build_reco_table(df_assignments, load_recommendations_csv(), output_dir=os.environ["RECO_TABLE_DIR"])
+    client = TestClient(app)
+    known_ids = df_assignments['id'].values
+
+    # Load the artifacts once, as a running API would have
+    client.post("/users/profiles", json=[int(known_ids[0])])
+
+    def requested_ids(n_ids):
+        ids = rng.choice(known_ids, n_ids, replace=False)
+        unknown = rng.random(n_ids) < 0.1
+        ids[unknown] = -ids[unknown]
+        return [int(i) for i in ids]
+
+    # Per-id endpoint, before (CSV read + scan per id) and after the assignments artifact
+    sample = requested_ids(200)
+    start = time.perf_counter()
+    for user_id in sample[:5]:
+        df = pd.read_csv(assignments_path)
+        df[df['id'] == user_id]
+    csv_per_id = (time.perf_counter() - start) / 5
+    start = time.perf_counter()
+    for user_id in sample:
+        client.get(f"/user/{user_id}/profile")
+    per_id = (time.perf_counter() - start) / len(sample)
+    print(f"📦 {args.users:,} users - per-id profile: {per_id * 1000:.2f} ms per request "
+          f"(+{csv_per_id * 1000:.0f} ms of CSV read before the assignments artifact)")
+
+    for n_ids in [1_000, 50_000]:
+        ids = requested_ids(n_ids)
+        latencies = []
+        for _ in range(5):
+            response, seconds = timed(client.post, "/users/profiles", json=ids)
+            latencies.append(seconds)
+        body = response.json()
+        assert len(body["data"]) + len(body["not_found"]) == n_ids, "every id is either found or not found"
+        _, without_reco = timed(client.post, "/users/profiles?recommendations=false", json=ids)
+        p50 = np.median(latencies)
+        print(f"✅ {n_ids:,} ids: {len(body['data']):,} profiles, {len(body['not_found']):,} not found, "
+              f"{len(response.content) / 1e6:.1f} MB")
+        print(f"⏱️  bulk p50 {p50 * 1000:.0f} ms ({p50 / n_ids * 1e6:.1f} µs per id), "
+              f"without recommendations {without_reco * 1000:.0f} ms - "
+              f"per-id requests ~{per_id * n_ids:.1f} s, with the CSV read ~{(per_id + csv_per_id) * n_ids:.0f} s")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
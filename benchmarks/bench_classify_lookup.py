@@ -0,0 +1,94 @@
+"""
+Latency of the classification of contents already in the corpus, answered from the topic
+index instead of the encoder and BERTopic.
+
+A synthetic corpus of --contents markdown contents is written as a content_with_topics
+table with the hash of each cleaned markdown (as reclassify writes it). Measured:
+- the stored topic of an id (GET /classify/{content_id})
+- classify_content with the id and the unchanged markdown (defi and theme classifiers
+  only): the topic model must never be loaded
+The lookup status of unknown ids, edited contents and formatting-only edits is checked.
+
+Usage (after pip install -e .): python benchmarks/bench_classify_lookup.py [--contents 50000]
+"""
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+
+WORDS = ['élèves', 'classe', 'gestion', 'émotions', 'lecture', 'maths', 'projet', 'parents', 'bruit',
+         'attention', 'évaluation', 'coopération', 'autonomie', 'rituels', 'stress', 'inclusion']
+
+
+def synthetic_corpus(n_contents, rng):
+    markdowns = [f"# Titre {i}\n\n**{' '.join(rng.choice(WORDS, 6))}**\n\n{' '.join(rng.choice(WORDS, 120))}"
+                 for i in range(n_contents)]
+    return pd.DataFrame({'id': np.arange(1, n_contents + 1) * 3, 'markdown': markdowns})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--contents', type=int, default=50_000, help="Contents of the corpus")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    os.environ["CONTENT_TOPICS_PATH"] = os.path.join(directory, 'content_with_topics.csv')
+    os.environ["SERVING_PROFILE"] = "lite"
+    from etreprof.ml_package.preprocessing import clean_markdown
+    from etreprof.ml_package.topic_index import document_hash, lookup_content_topic, load_topic_index
+    from etreprof.ml_package.models import classify_content
+    from etreprof.ml_package.artifacts import artifact_manager
+
+    rng = np.random.default_rng(0)
+    df_contents = synthetic_corpus(args.contents, rng)
+    pd.DataFrame({
+        'id': df_contents['id'],
+        'reduced topics': rng.integers(-1, 16, args.contents),
+        'confidence': rng.random(args.contents).astype(np.float32),
+        'markdown_hash': [f'{document_hash(clean_markdown(m)):016x}' for m in df_contents['markdown']]
+    }).to_csv(os.environ["CONTENT_TOPICS_PATH"], index=False)
+
+    start = time.perf_counter()
+    load_topic_index()
+    print(f"✅ Topic index of {args.contents:,} contents loaded in {time.perf_counter() - start:.2f} s")
+
+    sample = df_contents.sample(2000, random_state=0)
+    latencies = []
+    for content_id in sample['id']:
+        start = time.perf_counter()
+        lookup = lookup_content_topic(int(content_id))
+        latencies.append(time.perf_counter() - start)
+        assert lookup["status"] == "hit"
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1e6
+    print(f"⏱️  stored topic by id: p50 {p50:.1f} µs, p99 {p99:.1f} µs")
+
+    latencies = []
+    for content_id, markdown in zip(sample['id'], sample['markdown']):
+        start = time.perf_counter()
+        result = classify_content(markdown, int(content_id))
+        latencies.append(time.perf_counter() - start)
+        assert result["classification_path"] == "index" and result["index_lookup"] == "hit", result
+    assert not artifact_manager.stats()["topic_model"]["loaded"]
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1e3
+    print(f"⏱️  classify_content with id, unchanged markdown: p50 {p50:.2f} ms, p99 {p99:.2f} ms "
+          f"(topic model never loaded)")
+
+    content_id, markdown = int(sample['id'].iloc[0]), sample['markdown'].iloc[0]
+    assert lookup_content_topic(content_id + 1, markdown)["status"] == "unknown_id"
+    assert lookup_content_topic(content_id, markdown + " nouvelle section ajoutée")["status"] == "edited"
+    assert lookup_content_topic(content_id, markdown.replace('**', '*').replace('\n\n', '\n'))["status"] == "hit"
+    print("✅ Unknown ids and edited contents go to the model, formatting-only edits keep the stored topic")
+
+    from fastapi.testclient import TestClient
+    from etreprof.api.main import app
+    client = TestClient(app)
+    response = client.get(f"/classify/{content_id}").json()
+    assert response["success"] and response["data"]["classification_path"] == "index", response
+    assert not client.get(f"/classify/{content_id + 1}").json()["success"]
+    print(f"✅ GET /classify/{content_id} on a lite instance: {response['data']['topic_principal']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Import time of the API module and cold start to first response for each serving profile.
+
+Each measure runs in a fresh interpreter:
+- import: time to import etreprof.api.main (and which heavy modules got imported)
+- cold start: time from launching uvicorn to the first successful response of GET /recommend/0
+
+Usage (after pip install -e .): python benchmarks/bench_cold_start.py
+"""
+import os
+import sys
+import time
+import json
+import socket
+import subprocess
+import urllib.request
+
+HEAVY_MODULES = ['torch', 'bertopic', 'sentence_transformers', 'umap', 'hdbscan']
+
+IMPORT_SCRIPT = f"""
+import json, sys, time
+start = time.perf_counter()
+import etreprof.api.main
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "heavy": [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def measure_import(profile):
+    env = {**os.environ, "SERVING_PROFILE": profile}
+    output = subprocess.run([sys.executable, '-c', IMPORT_SCRIPT], env=env, capture_output=True, text=True)
+    if output.returncode != 0:
+        return None, output.stderr.strip().splitlines()[-1]
+    return json.loads(output.stdout.strip().splitlines()[-1]), None
+
+
+def measure_cold_start(profile, path='/recommend/0', timeout=600):
+    env = {**os.environ, "SERVING_PROFILE": profile}
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'etreprof.api.main:app', '--port', str(port)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if server.poll() is not None:
+                return None
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}{path}', timeout=5) as response:
+                    response.read()
+                return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.05)
+        return None
+    finally:
+        server.terminate()
+        server.wait()
+
+
+for profile in ['lite', 'full']:
+    result, error = measure_import(profile)
+    if result is None:
+        print(f"❌ {profile}: import failed - {error}")
+        continue
+    print(f"📦 {profile}: import {result['seconds'] * 1000:.0f} ms - heavy modules imported: {result['heavy'] or 'none'}")
+
+    cold_start = measure_cold_start(profile)
+    if cold_start is None:
+        print(f"❌ {profile}: server did not answer")
+    else:
+        print(f"🚀 {profile}: cold start to first response {cold_start:.2f} s")
@@ -0,0 +1,106 @@
+"""
+Size, build time and lookup latency of the consumed contents index, and recommendations
+filtered through it.
+
+Synthetic interactions of --users users are indexed (build_consumed_index). The
+consumed contents of a sample of users are checked against a pandas groupby of the
+consultations, the memory-mapped lookup is timed, and generate_simple_recommendations
+with the consumed contents excluded is checked never to return one of them.
+
+Usage (after pip install -e .): python benchmarks/bench_consumed_index.py [--users 1000000] [--events 10000000]
+"""
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+
+N_CONTENTS = 20_000
+EVENT_TYPES = ['page_view', 'download', 'opened_mail', 'click_mail', 'contenu_vote', 'comment_posted', 'login']
+CONTENT_TYPES = ['contenu', 'guide-pratique', 'fiche-outils', 'newsletter', None]
+
+
+def synthetic_interactions(n_users, n_events, rng):
+    """Interactions as read from the CSV: string dates and content ids, unsorted users."""
+    content_ids = ((rng.zipf(1.2, n_events) % N_CONTENTS) + 1).astype(str).astype(object)
+    content_ids[rng.random(n_events) < 0.1] = np.nan
+    return pd.DataFrame({
+        'user_id': rng.integers(1, n_users + 1, n_events),
+        'type': rng.choice(EVENT_TYPES, n_events, p=[.4, .2, .15, .1, .05, .05, .05]),
+        'content_type': rng.choice(np.array(CONTENT_TYPES, dtype=object), n_events, p=[.5, .15, .15, .1, .1]),
+        'content_id': content_ids,
+        'created_at': '2025-01-01 10:00:00'
+    })
+
+
+def synthetic_mapping(rng):
+    df = pd.DataFrame({
+        'id': np.arange(1, N_CONTENTS + 1),
+        'title': [f'Contenu {i}' for i in range(N_CONTENTS)],
+        'type': rng.choice(['article', 'fiche_outils', 'guide_pratique'], N_CONTENTS),
+        'priority_challenge': np.where(rng.random(N_CONTENTS) < 0.05, 'sante_mentale', None)
+    })
+    for k in range(5):
+        df[f'cluster_{k}'] = rng.random(N_CONTENTS) < 0.01
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--users', type=int, default=1_000_000, help="Number of users")
+    parser.add_argument('--events', type=int, default=10_000_000, help="Number of interactions")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    directory = tempfile.mkdtemp()
+    os.environ["CONSUMED_INDEX_DIR"] = os.path.join(directory, 'consumed_index')
+    from etreprof.ml_package import recommender
+    from etreprof.ml_package.consumed_index import build_consumed_index, consumed_contents
+
+    df_interactions = synthetic_interactions(args.users, args.events, rng)
+    start = time.perf_counter()
+    meta = build_consumed_index(df_interactions)
+    build_seconds = time.perf_counter() - start
+    print(f"✅ {meta['n_users']:,} users, {meta['n_pairs']:,} consumed (user, content) pairs "
+          f"({meta['n_pairs'] / meta['n_users']:.1f} per user), built in {build_seconds:.1f} s")
+    print(f"📦 {meta['bytes'] / 1e6:.1f} MB - {meta['bytes'] / meta['n_users']:.1f} MB per million users")
+
+    # Same contents as the consultations grouped by user
+    consultations = df_interactions[
+        ((df_interactions['type'] == 'page_view') & (df_interactions['content_type'] == 'contenu'))
+        | ((df_interactions['type'] == 'download') & df_interactions['content_type'].isin(['guide-pratique', 'fiche-outils']))
+    ].dropna(subset=['content_id'])
+    sample = rng.choice(np.arange(1, args.users + 1), 1000, replace=False)
+    sampled = consultations[consultations['user_id'].isin(sample)]
+    expected = sampled.groupby('user_id')['content_id'].agg(lambda ids: sorted(set(int(i) for i in ids)))
+    for user_id in sample:
+        assert consumed_contents(int(user_id)).tolist() == expected.get(user_id, []), user_id
+    print(f"✅ Consumed contents of {len(sample)} users identical to the consultations grouped by user")
+
+    latencies = []
+    for user_id in rng.integers(1, args.users + 1, 10_000):
+        start = time.perf_counter()
+        consumed_contents(int(user_id))
+        latencies.append(time.perf_counter() - start)
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1e6
+    print(f"⏱️  lookup p50 {p50:.1f} µs, p99 {p99:.1f} µs")
+
+    # Recommendations never include consumed contents (pools of about 200 contents per cluster)
+    mapping_path = os.path.join(directory, 'content_recommendations_mapping.csv')
+    synthetic_mapping(rng).to_csv(mapping_path, index=False)
+    recommender.RECOMMENDATIONS_CSV_PATH = mapping_path
+    heavy_users = consultations['user_id'].value_counts().index[:200]
+    excluded = 0
+    for user_id in heavy_users:
+        consumed = consumed_contents(int(user_id))
+        result = recommender.generate_simple_recommendations(int(user_id) % 5, exclude_ids=consumed)
+        ids = [r['id'] for r in result['recommendations']]
+        assert len(ids) == 5 and not np.isin(ids, consumed).any(), user_id
+        excluded += len(consumed)
+    print(f"✅ Recommendations of the {len(heavy_users)} heaviest users avoid their "
+          f"{excluded / len(heavy_users):.0f} consumed contents on average")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Throughput and memory of the streaming export of recommendations (GET /export/recommendations).
+
+Synthetic cluster assignments are written to a temporary file (USER_ASSIGNMENTS_PATH) with
+the materialized recommendation table built from them (RECO_TABLE_DIR), a few users being
+left out of the table. The export is consumed chunk by chunk in NDJSON and CSV: rows per
+second, then in a second pass the peak memory allocated while exporting (tracemalloc, the
+loaded assignments excluded), which slows the export down too much to time it. A sample of the NDJSON rows is checked against GET /user/{user_id}/profile.
+
+Usage (after pip install -e .): python benchmarks/bench_export_recommendations.py [--users 1000000]
+"""
+import os
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+NIVEAUX = ['maternelle', 'elementaire', 'college', 'lycee', 'lycee_pro']
+ACADEMIES = ['Paris', 'Versailles', 'Créteil', 'Lyon', 'Bordeaux', 'La Réunion', None]
+
+
+def synthetic_assignments(n_users, rng):
+    df = pd.DataFrame({
+        'id': rng.permutation(n_users * 2)[:n_users] + 1,
+        'cluster': rng.integers(0, 5, n_users),
+        'anciennete': np.where(rng.random(n_users) < 0.1, np.nan, rng.integers(0, 30, n_users)),
+        'degre': rng.choice([1.0, 2.0, np.nan], n_users),
+        'academie': rng.choice(np.array(ACADEMIES, dtype=object), n_users)
+    })
+    for niveau in NIVEAUX:
+        df[niveau] = (rng.random(n_users) < 0.3).astype(int)
+    return df
+
+
+def consume(rows):
+    """Exported rows and bytes, as a client reading the stream would get them."""
+    n_bytes = n_lines = 0
+    for chunk in rows:
+        n_bytes += len(chunk.encode('utf-8'))
+        n_lines += chunk.count('\n')
+    return n_lines, n_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--users', type=int, default=1_000_000, help="Number of users in the assignments")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    directory = tempfile.mkdtemp()
+    assignments_path = os.path.join(directory, 'user_cluster_assignments.csv')
+    df_assignments = synthetic_assignments(args.users, rng)
+    df_assignments.to_csv(assignments_path, index=False)
+
+    os.environ["USER_ASSIGNMENTS_PATH"] = assignments_path
+    os.environ["RECO_TABLE_DIR"] = os.path.join(directory, 'reco_table')
+    from etreprof.ml_package.models import load_user_assignments, get_user_profile
+    from etreprof.ml_package.recommender import load_recommendations_csv
+    from etreprof.ml_package.reco_table import build_reco_table
+    from etreprof.ml_package.reco_export import recommendation_export
+
+    build_reco_table(df_assignments.iloc[:-1000], load_recommendations_csv(), output_dir=os.environ["RECO_TABLE_DIR"])
+    load_user_assignments()
+
+    for export_format in ['ndjson', 'csv']:
+        for filters in [{}, {'cluster_id': 2, 'academie': 'Créteil', 'degre': 2}]:
+            start = time.perf_counter()
+            n_lines, n_bytes = consume(recommendation_export(export_format, **filters))
+            seconds = time.perf_counter() - start
+
+            tracemalloc.start()
+            consume(recommendation_export(export_format, **filters))
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            n_rows = n_lines - (export_format == 'csv')
+            print(f"✅ {export_format} {filters or 'all users'}: {n_rows:,} rows, {n_bytes / 1e6:.0f} MB")
+            print(f"⏱️  {seconds:.2f} s - {n_rows / seconds:,.0f} rows/s, peak memory {peak / 1e6:.1f} MB")
+
+    # Rows match the recommendations of the profile endpoint
+    sample = set(rng.choice(df_assignments['id'].values, 200, replace=False).tolist())
+    in_table = set(df_assignments['id'].values[:-1000].tolist())
+    checked = 0
+    for chunk in recommendation_export('ndjson'):
+        for line in chunk.splitlines():
+            row = json.loads(line)
+            if row['user_id'] in sample:
+                profile = get_user_profile(row['user_id'])
+                if row['user_id'] in in_table:
+                    assert row['recommendations'] == profile['recommendations']['recommendations'], row
+                assert row['niveaux_enseignes'] == profile['profile']['niveaux_enseignes'], row
+                assert row['cluster_id'] == profile['cluster']['id'], row
+                checked += 1
+    print(f"✅ {checked} sampled rows identical to GET /user/{{user_id}}/profile")
+
+
+if __name__ == "__main__":
+    main()
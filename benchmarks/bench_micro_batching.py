@@ -0,0 +1,95 @@
+"""
+Throughput and latency of single-content classification, with and without micro-batching.
+
+N concurrent clients send single contents in a closed loop for a fixed duration. Without
+batching every request is one classification call; with batching the MicroBatcher merges
+the requests of a window into one call. Classification runs in a single thread, like one
+worker of the pool.
+
+By default classification is simulated with a cost model (fixed cost per call plus a
+cost per document, the shape of a CPU encoder forward pass); use --real to run
+classify_contents with the real models.
+
+Usage (after pip install -e .): python benchmarks/bench_micro_batching.py [--real]
+"""
+import time
+import asyncio
+import argparse
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from etreprof.api.micro_batcher import MicroBatcher
+
+CONCURRENCY_LEVELS = [1, 4, 16, 64]
+CONTENT = ("Cette fiche propose des activités pour développer les compétences psychosociales "
+           "des élèves en classe, avec des exemples de séances et des conseils de mise en œuvre. ") * 8
+
+
+def simulated_classify(contents, call_ms=40.0, document_ms=6.0):
+    time.sleep((call_ms + document_ms * len(contents)) / 1000)
+    return {"results": [{"topic_principal": None} for _ in contents], "timings_ms": {}}
+
+
+async def run_clients(classify_one, concurrency, duration):
+    latencies = []
+    deadline = time.perf_counter() + duration
+
+    async def client():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            await classify_one(CONTENT)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    return len(latencies) / elapsed, np.percentile(latencies, 50) * 1000, np.percentile(latencies, 99) * 1000
+
+
+async def bench(classify, concurrency, duration, window_ms, max_batch_size):
+    # One thread: a single model instance, as in a classification worker
+    executor = ThreadPoolExecutor(max_workers=1)
+    loop = asyncio.get_running_loop()
+
+    async def classify_batch(contents):
+        return await loop.run_in_executor(executor, classify, contents)
+
+    async def unbatched(content):
+        return (await classify_batch([content]))["results"][0]
+
+    batcher = MicroBatcher(classify_batch, window_ms=window_ms, max_batch_size=max_batch_size)
+
+    unbatched_stats = await run_clients(unbatched, concurrency, duration)
+    batched_stats = await run_clients(batcher.classify, concurrency, duration)
+    executor.shutdown()
+    return unbatched_stats, batched_stats, batcher.stats()["mean_batch_size"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--real', action='store_true', help="Use classify_contents instead of the cost model")
+    parser.add_argument('--duration', type=float, default=5.0, help="Seconds per measure")
+    parser.add_argument('--window-ms', type=float, default=10.0)
+    parser.add_argument('--max-batch', type=int, default=16)
+    args = parser.parse_args()
+
+    if args.real:
+        from etreprof.ml_package.models import classify_contents, warmup_classification
+        print(f"Models loaded in {warmup_classification():.1f} s")
+        print("Classification: classify_contents with the real models")
+        classify = classify_contents
+    else:
+        print("Classification: cost model (40 ms per call + 6 ms per content), use --real for the real models")
+        classify = simulated_classify
+
+    print(f"{'clients':>8} | {'unbatched req/s':>15} {'p50 ms':>8} {'p99 ms':>8} | "
+          f"{'batched req/s':>13} {'p50 ms':>8} {'p99 ms':>8} {'batch':>6}")
+    for concurrency in CONCURRENCY_LEVELS:
+        (u_rate, u_p50, u_p99), (b_rate, b_p50, b_p99), batch_size = asyncio.run(
+            bench(classify, concurrency, args.duration, args.window_ms, args.max_batch)
+        )
+        print(f"{concurrency:>8} | {u_rate:>15.1f} {u_p50:>8.1f} {u_p99:>8.1f} | "
+              f"{b_rate:>13.1f} {b_p50:>8.1f} {b_p99:>8.1f} {batch_size:>6.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Per-stage timing of main_process_users on synthetic interactions: preparation of the
+shared interactions frame, temporal engagement, contents usage (with topic enrichment).
+
+The interactions are parsed, coded and sorted by user once (PreparedInteractions) and
+every stage reads the prepared frame, so the string dates and content ids are parsed once.
+
+Usage (after pip install -e .): python benchmarks/bench_pipeline_stages.py [--events 5000000]
+"""
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from etreprof.data_processing.interactions import PreparedInteractions
+from etreprof.data_processing.user_frequency import main_frequency_users
+from etreprof.data_processing.user_contents import main_contents_usage
+
+REFERENCE_DATE = datetime(2025, 7, 10, 15, 53, 58)
+N_USERS = 200_000
+N_CONTENTS = 20_000
+CHALLENGES = ['transition_ecologique', 'sante_mentale', 'ecole_inclusive', 'cps', 'reussite_tous_eleves']
+EVENT_TYPES = ['page_view', 'download', 'opened_mail', 'click_mail', 'contenu_vote', 'comment_posted', 'login']
+CONTENT_TYPES = ['contenu', 'guide-pratique', 'fiche-outils', 'newsletter', None]
+
+
+def synthetic_data(n_events, seed=0):
+    """Interactions as read from the CSV: string dates and content ids, unsorted users."""
+    rng = np.random.default_rng(seed)
+    df_users = pd.DataFrame({'id': np.arange(1, N_USERS + 1), 'degre': rng.integers(1, 3, N_USERS)})
+    df_contents = pd.DataFrame({'id': np.arange(1, N_CONTENTS + 1), 'type': 'article',
+                                **{c: (rng.random(N_CONTENTS) < 0.2).astype(int) for c in CHALLENGES}})
+    valid_ids = np.arange(1, N_CONTENTS + 1, 2)
+    df_content_valid = pd.DataFrame({'id': valid_ids, 'reduced topics': rng.integers(-1, 16, len(valid_ids))})
+
+    content_ids = ((rng.zipf(1.2, n_events) % (N_CONTENTS + 2000)) + 1).astype(str).astype(object)
+    content_ids[rng.random(n_events) < 0.1] = np.nan
+    seconds = rng.integers(0, 5 * 365 * 86400, n_events)
+    created_at = pd.Series(np.datetime64(REFERENCE_DATE) - seconds.astype('timedelta64[s]'))
+    df_interactions = pd.DataFrame({
+        'user_id': (rng.zipf(1.3, n_events) % N_USERS) + 1,
+        'type': rng.choice(EVENT_TYPES, n_events, p=[.4, .2, .15, .1, .05, .05, .05]),
+        'content_type': rng.choice(np.array(CONTENT_TYPES, dtype=object), n_events, p=[.5, .15, .15, .1, .1]),
+        'content_id': content_ids,
+        'created_at': created_at.dt.strftime('%Y-%m-%d %H:%M:%S')
+    })
+    return df_users, df_contents, df_content_valid, df_interactions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--events', type=int, default=5_000_000, help="Number of interactions")
+    args = parser.parse_args()
+
+    df_users, df_contents, df_content_valid, df_interactions = synthetic_data(args.events)
+    timings = {}
+
+    start = time.perf_counter()
+    interactions = PreparedInteractions(df_interactions)
+    timings['prepare interactions'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    df_users_enriched = main_frequency_users(interactions, df_users)
+    timings['temporal engagement'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    df_final = main_contents_usage(df_contents, interactions, df_users_enriched, df_content_valid,
+                                   reference_date=REFERENCE_DATE)
+    timings['contents usage'] = time.perf_counter() - start
+
+    total = sum(timings.values())
+    print(f"📊 {args.events:,} interactions -> {df_final.shape[0]:,} users x {df_final.shape[1]} columns")
+    for stage, seconds in timings.items():
+        print(f"   {stage:<22} {seconds:6.2f} s ({seconds / total:.0%})")
+    print(f"⏱️  Total {total:.2f} s ({args.events / total / 1e6:.1f}M interactions/s)")
+
+
+if __name__ == "__main__":
+    main()
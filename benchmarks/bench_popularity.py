@@ -0,0 +1,122 @@
+"""
+Incremental popularity counters and popularity-weighted draws.
+
+- Counters: a year of synthetic interactions arrives in daily batches. Each batch is added
+  to the counters (update_counters), against recomputing them from the whole log so far.
+  The final counters must match the full recomputation.
+- Alias tables: frequencies of 1M draws against the popularity weights.
+- generate_simple_recommendations on a synthetic mapping of 20k contents, uniform draws
+  (no counters) against popularity-weighted draws.
+
+Usage (after pip install -e .): python benchmarks/bench_popularity.py [--events 5000000]
+"""
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+
+N_USERS = 200_000
+N_CONTENTS = 20_000
+N_DAYS = 365
+EVENT_TYPES = ['page_view', 'download', 'opened_mail', 'click_mail']
+
+
+def synthetic_interactions(n_events, rng):
+    seconds = np.sort(rng.integers(0, N_DAYS * 86400, n_events))
+    content_ids = ((rng.zipf(1.3, n_events) % N_CONTENTS) + 1).astype(str).astype(object)
+    content_ids[rng.random(n_events) < 0.05] = None
+    return pd.DataFrame({
+        'user_id': rng.integers(1, int(N_USERS * 1.1), n_events),
+        'type': rng.choice(EVENT_TYPES, n_events, p=[.5, .2, .2, .1]),
+        'content_id': content_ids,
+        'created_at': np.datetime64('2024-07-10') + seconds.astype('timedelta64[s]'),
+    })
+
+
+def synthetic_mapping(rng):
+    df = pd.DataFrame({
+        'id': np.arange(1, N_CONTENTS + 1),
+        'title': [f'Contenu {i}' for i in range(N_CONTENTS)],
+        'type': rng.choice(['article', 'fiche_outils', 'guide_pratique'], N_CONTENTS),
+        'priority_challenge': np.where(rng.random(N_CONTENTS) < 0.05, 'sante_mentale', None)
+    })
+    for k in range(5):
+        df[f'cluster_{k}'] = rng.random(N_CONTENTS) < 0.4
+    return df
+
+
+def time_calls(function, n_calls, *args):
+    start = time.perf_counter()
+    for _ in range(n_calls):
+        function(*args)
+    return (time.perf_counter() - start) / n_calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--events', type=int, default=5_000_000, help="Number of interactions over the year")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    directory = tempfile.mkdtemp()
+    os.environ["POPULARITY_DIR"] = os.path.join(directory, 'popularity')
+    from etreprof.ml_package import recommender
+    from etreprof.ml_package.artifacts import artifact_manager
+    from etreprof.ml_package.popularity import (
+        AliasTable, empty_counters, update_counters, write_counters, popularity_weights, ALL_USERS
+    )
+
+    df_interactions = synthetic_interactions(args.events, rng)
+    user_ids = np.arange(1, N_USERS + 1)
+    user_clusters = rng.integers(0, 5, N_USERS)
+
+    days = ((df_interactions['created_at'] - df_interactions['created_at'].min()).dt.days).to_numpy()
+    batch_starts = np.searchsorted(days, np.arange(N_DAYS + 1))
+    counters = empty_counters()
+    incremental_seconds = 0
+    for day in range(N_DAYS):
+        batch = df_interactions.iloc[batch_starts[day]:batch_starts[day + 1]]
+        start = time.perf_counter()
+        counters = update_counters(counters, batch, user_ids, user_clusters)
+        incremental_seconds += time.perf_counter() - start
+
+    start = time.perf_counter()
+    recomputed = update_counters(empty_counters(), df_interactions, user_ids, user_clusters)
+    full_seconds = time.perf_counter() - start
+
+    np.testing.assert_array_equal(counters["content_ids"], recomputed["content_ids"])
+    for name in ['views', 'downloads']:
+        np.testing.assert_allclose(counters[name], recomputed[name], rtol=1e-9, atol=1e-12)
+    print(f"✅ {N_DAYS} daily batches ({args.events:,} interactions) give the counters of the whole log")
+    print(f"⏱️  update per daily batch {incremental_seconds / N_DAYS * 1000:.1f} ms - "
+          f"recomputation from the whole log {full_seconds * 1000:.0f} ms "
+          f"(the last day, x{full_seconds / (incremental_seconds / N_DAYS):.0f})")
+
+    weights = popularity_weights(counters, np.arange(1, N_CONTENTS + 1), ALL_USERS)
+    start = time.perf_counter()
+    table = AliasTable(weights)
+    build_seconds = time.perf_counter() - start
+    draws = table.draw(rng, 1_000_000)
+    frequencies = np.bincount(draws, minlength=N_CONTENTS) / len(draws)
+    error = np.abs(frequencies - weights / weights.sum()).max()
+    print(f"✅ Alias table of {N_CONTENTS:,} contents built in {build_seconds * 1000:.0f} ms, "
+          f"largest frequency error over 1M draws {error:.5f} (top weight {weights.max() / weights.sum():.4f})")
+
+    # Requests: uniform draws without counters, weighted once they are written
+    mapping_path = os.path.join(directory, 'content_recommendations_mapping.csv')
+    synthetic_mapping(rng).to_csv(mapping_path, index=False)
+    recommender.RECOMMENDATIONS_CSV_PATH = mapping_path
+    uniform = time_calls(recommender.generate_simple_recommendations, 200, 2)
+    write_counters(counters)
+    artifact_manager.reload("popularity")
+    recommender.generate_simple_recommendations(2)
+    weighted = time_calls(recommender.generate_simple_recommendations, 200, 2)
+    result = recommender.generate_simple_recommendations(2)
+    print(f"✅ {result['reasoning']['strategy']}")
+    print(f"⏱️  generate_simple_recommendations uniform {uniform * 1000:.2f} ms - weighted {weighted * 1000:.2f} ms per call")
+
+
+if __name__ == "__main__":
+    main()
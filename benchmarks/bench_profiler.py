@@ -0,0 +1,131 @@
+"""
+Overhead of the sampling profiler on the pipeline stages, and a profiled API request.
+
+The stages of main_process_users run on the synthetic interactions of
+bench_pipeline_stages without profiling, inside a disabled profiled() context and under
+the profiler at several sampling intervals (best of --repeat runs). The written
+speedscope files are read back: the functions with the most samples are printed. A
+GET /stats request carrying PROFILE_TOKEN must return the name of its profile file, and
+its profile must not hold the work of another thread running meanwhile. A request without
+the token, or with a wrong one, must not be profiled.
+
+Usage (after pip install -e .): python benchmarks/bench_profiler.py [--events 2000000] [--repeat 3]
+"""
+import os
+import json
+import time
+import argparse
+import tempfile
+import threading
+from collections import Counter
+import numpy as np
+
+STAGE_NAMES = ['prepare_interactions', 'frequency_users', 'contents_usage']
+
+
+def run_stages(data, profiled, enabled, interval_ms=5):
+    from etreprof.data_processing.interactions import PreparedInteractions
+    from etreprof.data_processing.user_frequency import main_frequency_users
+    from etreprof.data_processing.user_contents import main_contents_usage
+    from bench_pipeline_stages import REFERENCE_DATE
+
+    df_users, df_contents, df_content_valid, df_interactions = data
+    start = time.perf_counter()
+    with profiled(STAGE_NAMES[0], enabled, interval_ms=interval_ms):
+        interactions = PreparedInteractions(df_interactions)
+    with profiled(STAGE_NAMES[1], enabled, interval_ms=interval_ms):
+        df_users_enriched = main_frequency_users(interactions, df_users)
+    with profiled(STAGE_NAMES[2], enabled, interval_ms=interval_ms):
+        main_contents_usage(df_contents, interactions, df_users_enriched, df_content_valid, reference_date=REFERENCE_DATE)
+    return time.perf_counter() - start
+
+
+def busy_elsewhere(stop):
+    """Work of another request, running while the profiled one is served."""
+    while not stop.is_set():
+        sum(range(10_000))
+
+
+def frame_names(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        profile = json.load(f)
+    return {frame['name'] for frame in profile["shared"]["frames"]}
+
+
+def top_functions(path, n=3):
+    with open(path, 'r', encoding='utf-8') as f:
+        profile = json.load(f)
+    frames = profile["shared"]["frames"]
+    self_time = Counter()
+    for thread_profile in profile["profiles"]:
+        for stack, weight in zip(thread_profile["samples"], thread_profile["weights"]):
+            self_time[stack[-1]] += weight
+    total = sum(self_time.values())
+    return [f"{frames[i]['name']} ({os.path.basename(frames[i]['file'])}) {ms / total:.0%}"
+            for i, ms in self_time.most_common(n)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--events', type=int, default=2_000_000, help="Number of interactions")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs of every configuration")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    os.environ["PROFILE_DIR"] = os.path.join(directory, 'profiles')
+    os.environ["PROFILE_TOKEN"] = "secret"
+    os.environ["STATS_CUBE_DIR"] = os.path.join(directory, 'stats_cube')
+    os.environ.setdefault("SERVING_PROFILE", "lite")
+    from etreprof.data_processing.profiling import profiled, PROFILE_PATH
+    from bench_pipeline_stages import synthetic_data
+
+    data = synthetic_data(args.events)
+    baseline = min(run_stages(data, profiled, False) for _ in range(args.repeat))
+    print(f"⏱️  stages of {args.events:,} interactions, profiling disabled: {baseline:.2f} s")
+
+    start = time.perf_counter()
+    for _ in range(100_000):
+        with profiled("disabled", False):
+            pass
+    print(f"⏱️  disabled profiled() context: {(time.perf_counter() - start) * 10:.2f} µs")
+
+    for interval_ms in [1, 5, 10]:
+        seconds = min(run_stages(data, profiled, True, interval_ms) for _ in range(args.repeat))
+        print(f"🔬 sampling every {interval_ms} ms: {seconds:.2f} s ({seconds / baseline - 1:+.1%})")
+
+    paths = sorted(os.listdir(PROFILE_PATH))
+    for stage in STAGE_NAMES:
+        path = os.path.join(PROFILE_PATH, [p for p in paths if f'-{stage}-' in p][-1])
+        print(f"   {stage}: {', '.join(top_functions(path))}")
+
+    # A profiled API request
+    from fastapi.testclient import TestClient
+    from etreprof.ml_package.stats_cube import build_stats_cube
+    from bench_stats_cube import synthetic_users
+    from etreprof.api.main import app
+
+    build_stats_cube(synthetic_users(200_000, np.random.default_rng(0)))
+    client = TestClient(app)
+    n_profiles = len(os.listdir(PROFILE_PATH))
+    response = client.get("/stats", params={"group_by": "cluster,academie"})
+    assert response.json()["success"] and "X-Profile-File" not in response.headers
+    assert len(os.listdir(PROFILE_PATH)) == n_profiles
+    response = client.get("/stats", params={"group_by": "cluster,academie", "profile": "wrong"})
+    assert response.json()["success"] and "X-Profile-File" not in response.headers
+    assert len(os.listdir(PROFILE_PATH)) == n_profiles
+    response = client.get("/stats", params={"group_by": "cluster,academie", "profile": "secret"})
+    assert response.json()["success"] and "X-Profile-File" in response.headers
+
+    stop = threading.Event()
+    other_request = threading.Thread(target=busy_elsewhere, args=(stop,))
+    other_request.start()
+    response = client.get("/stats", params={"group_by": "cluster,academie"}, headers={"X-Profile": "secret"})
+    stop.set()
+    other_request.join()
+    path = os.path.join(PROFILE_PATH, response.headers["X-Profile-File"])
+    assert 'busy_elsewhere' not in frame_names(path) and 'get_stats' in frame_names(path)
+    print(f"✅ profiled GET /stats -> {response.headers['X-Profile-File']}: {', '.join(top_functions(path))}")
+
+
+if __name__ == "__main__":
+    main()
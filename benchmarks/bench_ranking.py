@@ -0,0 +1,61 @@
+"""
+Latency of the personalized ranking (user preference vector x topic vectors, then a weighted draw
+of at most MAX_CONTENTS_PER_TOPIC contents per topic) on a synthetic catalogue of 100k contents, and number of
+different lists served to users with the same topic history.
+
+Usage (after pip install -e .): python benchmarks/bench_ranking.py
+"""
+import time
+import numpy as np
+import pandas as pd
+from etreprof.ml_package.ranking import (
+    MAX_CONTENTS_PER_TOPIC, TOPIC_IDS, build_ranking_index, load_topic_embeddings, rank_contents,
+    user_preference_vector
+)
+
+N_CONTENTS = 100_000
+N_REQUESTS = 1_000
+LATENCY_BUDGET_MS = 5.0
+
+rng = np.random.default_rng(42)
+ids = np.arange(1, N_CONTENTS + 1)
+df_reco = pd.DataFrame({
+    'id': ids,
+    'title': [f'Contenu {i}' for i in ids],
+    'type': rng.choice(['article', 'fiche_outils', 'guide_pratique'], N_CONTENTS),
+    **{f'cluster_{k}': rng.random(N_CONTENTS) < 0.5 for k in range(5)},
+    'priority_challenge': np.where(rng.random(N_CONTENTS) < 0.2, 'sante_mentale', None)
+})
+df_content_topics = pd.DataFrame({'id': ids, 'reduced topics': rng.choice(TOPIC_IDS, N_CONTENTS)})
+
+start = time.perf_counter()
+index = build_ranking_index(df_reco, df_content_topics, load_topic_embeddings())
+print(f"📦 Index built for {N_CONTENTS} contents in {time.perf_counter() - start:.2f} s")
+
+# Popularity weights of the contents in the cluster (prior 1 + views)
+weights = 1 + rng.poisson(3, N_CONTENTS).astype(np.float64)
+
+user_topics = rng.poisson(0.5, size=(N_REQUESTS, len(TOPIC_IDS)))
+user_topics[:, 0] += 1
+latencies = []
+for counts in user_topics:
+    start = time.perf_counter()
+    preference = user_preference_vector(counts)
+    rank_contents(index, preference, k=5, candidate_mask=index["cluster_masks"][2],
+                  max_per_topic=MAX_CONTENTS_PER_TOPIC, rng=rng, weights=weights)
+    latencies.append((time.perf_counter() - start) * 1000)
+
+# Users who only read topic 3: without the draw within topics they would all get the same list
+preference = user_preference_vector(np.eye(len(TOPIC_IDS))[TOPIC_IDS.index(3)])
+lists = [tuple(rank_contents(index, preference, k=5, candidate_mask=index["cluster_masks"][2],
+                             max_per_topic=MAX_CONTENTS_PER_TOPIC, rng=rng, weights=weights))
+         for _ in range(100)]
+topic_of = np.repeat(np.arange(len(TOPIC_IDS)), np.diff(index["topic_offsets"]))[np.argsort(index["topic_contents"])]
+topics = np.array([topic_of[list(top)] for top in lists])
+print(f"🎲 100 requests of the same user: {len(set(lists))} different lists, "
+      f"at most {max(np.bincount(row).max() for row in topics)} contents of a topic per list")
+
+p50, p99 = np.percentile(latencies, [50, 99])
+status = "✅" if p99 <= LATENCY_BUDGET_MS else "⚠️"
+print(f"{status} Ranking latency over {N_REQUESTS} requests: p50 {p50:.2f} ms, p99 {p99:.2f} ms "
+      f"(budget {LATENCY_BUDGET_MS} ms)")
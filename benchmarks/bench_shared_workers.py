@@ -0,0 +1,147 @@
+"""
+Memory of 1, 4 and 8 API workers, each loading its own serving data or sharing the data
+preloaded by the master before the fork (gunicorn --preload with PRELOAD_ARTIFACTS).
+
+Synthetic serving data is written to a temporary directory: user assignments and topic
+counts of --users users, the consumed contents index and the statistics cube. Workers
+are forked from a master process, as gunicorn does, and answer --requests lookups
+(assignment, topic counts, consumed contents, statistics query) before reporting their
+memory from /proc: USS (pages only the worker holds, what an extra worker costs) and
+PSS (shared pages divided among the processes, their sum is the memory of the group).
+
+Usage (after pip install -e .): python benchmarks/bench_shared_workers.py [--users 1000000] [--requests 20000]
+"""
+import os
+import argparse
+import tempfile
+import multiprocessing as mp
+import numpy as np
+import pandas as pd
+
+ACADEMIES = ['Paris', 'Créteil', 'Versailles', 'Lyon', 'Grenoble', 'Bordeaux', 'Lille', 'Nantes', None]
+NAMES = ['user_assignments', 'user_topics', 'consumed_index', 'stats_cube']
+
+
+def memory_kb():
+    """USS and PSS of the current process, in kB."""
+    values = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                values[parts[0].rstrip(':')] = int(parts[1])
+    return values['Private_Clean'] + values['Private_Dirty'], values['Pss']
+
+
+def write_synthetic_data(directory, n_users, rng):
+    from etreprof.ml_package.reco_table import NIVEAUX
+    from etreprof.ml_package.ranking import TOPIC_COLUMNS
+    from etreprof.ml_package.consumed_index import build_consumed_index
+    from etreprof.ml_package.stats_cube import build_stats_cube
+
+    df_users = pd.DataFrame({
+        'id': np.arange(1, n_users + 1),
+        'cluster': rng.integers(0, 5, n_users),
+        'anciennete': rng.gamma(2, 5, n_users).round(1),
+        'degre': rng.choice([1.0, 2.0, np.nan], n_users),
+        'academie': np.array(ACADEMIES, dtype=object)[rng.integers(0, len(ACADEMIES), n_users)],
+        'departement': rng.integers(1, 96, n_users).astype(str)
+    })
+    for niveau in NIVEAUX:
+        df_users[niveau] = (rng.random(n_users) < 0.25).astype(int)
+    df_users.to_csv(os.environ["USER_ASSIGNMENTS_PATH"], index=False)
+
+    topics = pd.DataFrame(rng.poisson(0.5, (n_users, len(TOPIC_COLUMNS))), columns=TOPIC_COLUMNS)
+    pd.concat([df_users[['id']], topics], axis=1).to_csv(os.path.join(directory, 'users_final_with_clusters.csv'), index=False)
+
+    n_events = 3 * n_users
+    build_consumed_index(pd.DataFrame({
+        'user_id': rng.integers(1, n_users + 1, n_events),
+        'type': 'page_view',
+        'content_type': 'contenu',
+        'content_id': rng.integers(1, 20_000, n_events).astype(str),
+        'created_at': '2025-01-01 10:00:00'
+    }))
+    build_stats_cube(df_users.assign(total_interactions=rng.gamma(1.5, 10, n_users)))
+
+
+def serve(preloaded, n_requests, seed, barrier, results):
+    """A worker: load the data unless preloaded, answer lookups, report its memory."""
+    from etreprof.api.preload import preload
+    from etreprof.ml_package.models import load_user_assignments, find_user_positions
+    from etreprof.ml_package.ranking import load_user_topics
+    from etreprof.ml_package.consumed_index import consumed_contents
+    from etreprof.ml_package.stats_cube import load_stats_cube, query_stats_cube
+
+    if not preloaded:
+        preload(NAMES)
+    rng = np.random.default_rng(seed)
+    assignments, users, cube = load_user_assignments(), load_user_topics(), load_stats_cube()
+    for user_id in rng.integers(1, len(assignments["ids"]) + 1, n_requests):
+        position = int(find_user_positions(assignments, [user_id])[0][0])
+        _ = (assignments["clusters"][position], assignments["academie"][position], assignments["degre"][position])
+        _ = users["topics"][int(np.searchsorted(users["ids"], user_id))].sum()
+        consumed_contents(int(user_id))
+    for cluster in range(5):
+        query_stats_cube(cube, {'cluster': [str(cluster)]}, ['academie'])
+    barrier.wait()
+    results.put(memory_kb())
+    barrier.wait()
+
+
+def run(preloaded, n_workers, n_requests):
+    """Fork the workers from a master with or without the data, return the memory of each process."""
+    context = mp.get_context('fork')
+    barrier, results = context.Barrier(n_workers + 1), context.Queue()
+
+    def master(report):
+        if preloaded:
+            from etreprof.api.preload import preload
+            preload(NAMES)
+        workers = [context.Process(target=serve, args=(preloaded, n_requests, seed, barrier, results))
+                   for seed in range(n_workers)]
+        for worker in workers:
+            worker.start()
+        barrier.wait()
+        report.put(memory_kb())
+        barrier.wait()
+        for worker in workers:
+            worker.join()
+
+    # The master itself runs in a fresh fork, so each run starts without loaded data
+    report = context.Queue()
+    process = context.Process(target=master, args=(report,))
+    process.start()
+    master_memory = report.get()
+    workers_memory = [results.get() for _ in range(n_workers)]
+    process.join()
+    return master_memory, workers_memory
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--users', type=int, default=1_000_000, help="Number of users")
+    parser.add_argument('--requests', type=int, default=20_000, help="Lookups answered by every worker")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    os.environ["USER_ASSIGNMENTS_PATH"] = os.path.join(directory, 'user_cluster_assignments.csv')
+    os.environ["CONSUMED_INDEX_DIR"] = os.path.join(directory, 'consumed_index')
+    os.environ["STATS_CUBE_DIR"] = os.path.join(directory, 'stats_cube')
+    from etreprof.ml_package import ranking
+    ranking.DATA_PATH = directory
+
+    write_synthetic_data(directory, args.users, np.random.default_rng(0))
+    print(f"✅ Synthetic serving data of {args.users:,} users written")
+
+    for n_workers in [1, 4, 8]:
+        for preloaded in [False, True]:
+            (master_uss, master_pss), workers = run(preloaded, n_workers, args.requests)
+            uss = np.mean([w[0] for w in workers]) / 1024
+            total_pss = (master_pss + sum(w[1] for w in workers)) / 1024
+            print(f"📦 {n_workers} worker(s), {'preloaded by the master' if preloaded else 'loaded by each worker'}: "
+                  f"USS {uss:.0f} MB per worker, master USS {master_uss / 1024:.0f} MB, total PSS {total_pss:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Query latency of GET /content/{id}/similar on synthetic indexes of 10k and 100k contents,
+exact scan of the float16 memory map versus the approximate (IVF) index, with the recall@10
+of the approximate results.
+
+Usage (after pip install -e .): python benchmarks/bench_similar.py
+"""
+import time
+import tempfile
+import numpy as np
+from etreprof.ml_package.content_index import (
+    build_ivf, find_similar_contents, load_content_index, search_index, write_content_index
+)
+
+DIM = 1024
+N_TOPICS = 40
+N_QUERIES = 200
+K = 10
+
+rng = np.random.default_rng(42)
+
+for n_contents in [10_000, 100_000]:
+    with tempfile.TemporaryDirectory() as index_dir:
+        # Clustered embeddings, closer to real contents than uniform noise
+        centers = rng.normal(size=(N_TOPICS, DIM))
+        embeddings = centers[rng.integers(0, N_TOPICS, n_contents)] + rng.normal(scale=0.8, size=(n_contents, DIM))
+        ids = rng.permutation(n_contents * 3)[:n_contents] + 1
+        types = rng.choice(['article', 'fiche_outils', 'guide_pratique'], n_contents)
+
+        write_content_index(ids, embeddings, types, index_dir)
+        del embeddings
+        start = time.perf_counter()
+        build_ivf(index_dir)
+        print(f"📦 {n_contents} contents - IVF built in {time.perf_counter() - start:.1f} s")
+
+        index = load_content_index(index_dir)
+        query_rows = rng.choice(n_contents, N_QUERIES, replace=False)
+
+        results = {}
+        for exact in [True, False]:
+            latencies, found = [], []
+            for row in query_rows:
+                start = time.perf_counter()
+                rows, _ = search_index(index, index["embeddings"][row], k=K, exact=exact, exclude_row=row)
+                latencies.append((time.perf_counter() - start) * 1000)
+                found.append(set(rows.tolist()))
+            results[exact] = found
+            p50, p99 = np.percentile(latencies, [50, 99])
+            print(f"   {'exact' if exact else 'ivf  '} : p50 {p50:.2f} ms, p99 {p99:.2f} ms")
+
+        recall = np.mean([len(a & e) / K for a, e in zip(results[False], results[True])])
+        print(f"   recall@{K} of the IVF index: {recall:.3f}")
+
+        start = time.perf_counter()
+        for row in query_rows[:50]:
+            find_similar_contents(int(index["ids"][row]), K, index_dir)
+        print(f"   endpoint function: {(time.perf_counter() - start) / 50 * 1000:.2f} ms per call")
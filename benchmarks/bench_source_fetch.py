@@ -0,0 +1,134 @@
+"""
+Time to fetch the four recompute sources from a remote server: one pd.read_csv(url) after
+the other against the concurrent, conditional fetch of etreprof.data_processing.sources.
+
+A local HTTP server stands in for the remote one. It serves synthetic CSVs with ETag and
+Last-Modified headers, answers 304 to matching conditional requests and adds a latency
+to every response and a bandwidth cap to every connection. Measured:
+- sequential pd.read_csv of the four URLs (the previous recompute)
+- first fetch (empty cache), second fetch (nothing changed), fetch after one source changed
+- peak Python memory of a download against the size of the files (bodies streamed to disk)
+The dataframes read from the cache must equal those read from the URLs.
+
+Usage (after pip install -e .): python benchmarks/bench_source_fetch.py [--rows 300000] [--latency-ms 200] [--mbps 400]
+"""
+import os
+import time
+import hashlib
+import argparse
+import tempfile
+import threading
+import tracemalloc
+import numpy as np
+import pandas as pd
+from email.utils import formatdate
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+SOURCE_FILES = {
+    "users": ("users.csv", 1),
+    "contents": ("contents.csv", 0.1),
+    "interactions": ("interactions.csv", 10),
+    "content_with_topics": ("content_with_topics.csv", 0.1)
+}
+
+
+def write_synthetic_sources(directory, n_rows, rng):
+    for name, (filename, scale) in SOURCE_FILES.items():
+        n = int(n_rows * scale)
+        pd.DataFrame({
+            'id': np.arange(n),
+            'value': rng.random(n),
+            'label': rng.choice(['article', 'fiche-outils', 'guide-pratique', 'newsletter'], n),
+            'created_at': '2025-01-01 10:00:00'
+        }).to_csv(os.path.join(directory, filename), index=False)
+
+
+def make_handler(directory, latency, bytes_per_second):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            time.sleep(latency)
+            path = os.path.join(directory, self.path.lstrip('/'))
+            stat = os.stat(path)
+            etag = f'"{hashlib.sha1(f"{stat.st_mtime_ns}-{stat.st_size}".encode()).hexdigest()[:16]}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/csv")
+            self.send_header("Content-Length", str(stat.st_size))
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", formatdate(stat.st_mtime, usegmt=True))
+            self.end_headers()
+            chunk_bytes = 256 * 1024
+            with open(path, 'rb') as f:
+                while chunk := f.read(chunk_bytes):
+                    self.wfile.write(chunk)
+                    time.sleep(len(chunk) / bytes_per_second)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=300_000, help="Rows of the users source (interactions x10)")
+    parser.add_argument('--latency-ms', type=float, default=200, help="Latency of every response")
+    parser.add_argument('--mbps', type=float, default=400, help="Bandwidth of every connection in Mbit/s")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    served_dir = os.path.join(directory, 'served')
+    os.makedirs(served_dir)
+    os.environ["SOURCES_CACHE_DIR"] = os.path.join(directory, 'cache')
+    from etreprof.data_processing.sources import fetch_sources, read_sources
+
+    write_synthetic_sources(served_dir, args.rows, np.random.default_rng(0))
+    total_bytes = sum(os.path.getsize(os.path.join(served_dir, f)) for f, _ in SOURCE_FILES.values())
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(served_dir, args.latency_ms / 1000, args.mbps * 1e6 / 8))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    urls = {name: f"http://127.0.0.1:{server.server_port}/{filename}" for name, (filename, _) in SOURCE_FILES.items()}
+    print(f"✅ Stand-in server with {len(urls)} sources ({total_bytes / 1e6:.0f} MB), "
+          f"{args.latency_ms:.0f} ms latency, {args.mbps:.0f} Mbit/s per connection")
+
+    start = time.perf_counter()
+    expected = {name: pd.read_csv(url, low_memory=False) for name, url in urls.items()}
+    print(f"⏱️  sequential pd.read_csv: {time.perf_counter() - start:.2f} s")
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    fetched = fetch_sources(urls)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"⏱️  first fetch (empty cache): {seconds:.2f} s - peak Python memory {peak / 1e6:.1f} MB for "
+          f"{sum(r['bytes'] for r in fetched.values()) / 1e6:.0f} MB downloaded")
+
+    start = time.perf_counter()
+    dataframes, fetched = read_sources(urls)
+    read_seconds = time.perf_counter() - start
+    assert all(r["status"] == "not_modified" for r in fetched.values()), fetched
+    fetch_seconds = max(r["seconds"] for r in fetched.values())
+    for name, df in dataframes.items():
+        pd.testing.assert_frame_equal(df, expected[name])
+    print(f"⏱️  nothing changed: fetch {fetch_seconds:.2f} s, fetch and read {read_seconds:.2f} s - dataframes identical")
+
+    time.sleep(0.01)
+    os.utime(os.path.join(served_dir, SOURCE_FILES["contents"][0]))
+    start = time.perf_counter()
+    fetched = fetch_sources(urls)
+    seconds = time.perf_counter() - start
+    statuses = {name: r["status"] for name, r in fetched.items()}
+    assert statuses["contents"] == "downloaded" and list(statuses.values()).count("not_modified") == 3, statuses
+    print(f"⏱️  contents changed: {seconds:.2f} s - {statuses}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
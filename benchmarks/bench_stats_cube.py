@@ -0,0 +1,109 @@
+"""
+Build time and size of the users aggregate cube, and latency of GET /stats queries from
+the cube against a groupby rescanning the users.
+
+Synthetic processed users (académie consistent with the département, levels, features
+with missing values) are aggregated by build_stats_cube. Every query is answered from the
+cube and by pandas on the users: counts and means must match.
+
+Usage (after pip install -e .): python benchmarks/bench_stats_cube.py [--users 1000000]
+"""
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+
+ACADEMIES = ['Paris', 'Créteil', 'Versailles', 'Lyon', 'Grenoble', 'Bordeaux', 'Lille', 'Nantes', 'Rennes',
+             'Toulouse', 'Montpellier', 'Aix-Marseille', 'Nice', 'Strasbourg', 'Nancy-Metz', 'La Réunion', 'NR']
+FLAGS = ['maternelle', 'elementaire', 'college', 'lycee', 'lycee_pro', 'autre']
+FEATURES = ['anciennete', 'total_interactions', 'diversite_contenus', 'topic_count', 'nb_opened_mail', 'nb_clicked_mail']
+
+QUERIES = [
+    ({}, []),
+    ({}, ['cluster']),
+    ({'cluster': ['2'], 'academie': ['Créteil'], 'college': ['1']}, []),
+    ({'degre': ['2']}, ['cluster', 'academie']),
+    ({'academie': ['Lyon', 'Grenoble']}, ['departement', 'cluster']),
+    ({'departement': ['null']}, ['degre']),
+]
+
+
+def synthetic_users(n_users, rng):
+    departements = np.array([f'{d:02d}' for d in range(1, 96)] + ['974'], dtype=object)
+    department_codes = rng.integers(0, len(departements), n_users)
+    academie_of_departement = rng.integers(0, len(ACADEMIES), len(departements))
+    df = pd.DataFrame({
+        'id': np.arange(1, n_users + 1),
+        'cluster': rng.integers(0, 5, n_users),
+        'departement': departements[department_codes],
+        'academie': np.array(ACADEMIES, dtype=object)[academie_of_departement[department_codes]],
+        'degre': rng.choice([1.0, 2.0, np.nan], n_users),
+    })
+    df.loc[rng.random(n_users) < 0.2, 'departement'] = np.nan
+    for flag in FLAGS:
+        df[flag] = (rng.random(n_users) < 0.25).astype(int)
+    for feature in FEATURES:
+        values = rng.gamma(1.5, 10, n_users)
+        values[rng.random(n_users) < 0.05] = np.nan
+        df[feature] = values
+    return df
+
+
+def pandas_query(df, filters, group_by):
+    """The same query on the users: filter, group, count and average."""
+    selected = np.ones(len(df), dtype=bool)
+    for dimension, accepted in filters.items():
+        labels = df[dimension].map(lambda v: 'null' if pd.isna(v) else str(int(v)) if isinstance(v, float) else str(v))
+        selected &= labels.isin(accepted).to_numpy()
+    df = df[selected]
+    if not group_by:
+        return {(): (len(df), df[FEATURES].mean().to_dict())}
+    grouped = df.groupby(group_by, dropna=False)
+    df_groups = grouped[FEATURES].mean().join(grouped.size().rename('count')).reset_index()
+    return {tuple(row[group_by]): (row['count'], row[FEATURES].to_dict()) for _, row in df_groups.iterrows()}
+
+
+def check(result, expected, group_by):
+    assert sum(row['count'] for row in result['rows']) == sum(count for count, _ in expected.values())
+    for row in result['rows']:
+        key = tuple(np.nan if row[d] is None else float(row[d]) if d == 'degre' else row[d] for d in group_by)
+        matches = [k for k in expected if all((pd.isna(a) and pd.isna(b)) or a == b for a, b in zip(k, key))]
+        count, means = expected[matches[0]]
+        assert row['count'] == count, (row, count)
+        for feature, mean in means.items():
+            assert (row['means'][feature] is None and pd.isna(mean)) or abs(row['means'][feature] - mean) < 1e-3, row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--users', type=int, default=1_000_000, help="Number of users")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    os.environ["STATS_CUBE_DIR"] = directory
+    from etreprof.ml_package.stats_cube import build_stats_cube, read_stats_cube, query_stats_cube
+
+    df_users = synthetic_users(args.users, np.random.default_rng(0))
+    start = time.perf_counter()
+    meta = build_stats_cube(df_users)
+    build_seconds = time.perf_counter() - start
+    cube = read_stats_cube()
+    size = sum(cube[name].nbytes for name in ['codes', 'counts', 'sums', 'valid'])
+    print(f"✅ {meta['n_users']:,} users in {meta['n_cells']:,} cells ({size / 1e6:.1f} MB), built in {build_seconds:.2f} s")
+
+    for filters, group_by in QUERIES:
+        start = time.perf_counter()
+        result = query_stats_cube(cube, filters, group_by)
+        cube_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        expected = pandas_query(df_users, filters, group_by)
+        pandas_seconds = time.perf_counter() - start
+        check(result, expected, group_by)
+        print(f"⏱️  {filters or 'all'} by {group_by or 'nothing'}: {len(result['rows'])} rows from {result['cells']:,} cells "
+              f"in {cube_seconds * 1000:.1f} ms - rescanning the users {pandas_seconds * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
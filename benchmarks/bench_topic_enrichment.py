@@ -0,0 +1,106 @@
+"""
+Equivalence and timing of the integer-coded create_user_topic_enrichment against the
+previous implementation (string casts, string merge, drop_duplicates and pivot).
+
+1. Equivalence: both implementations on the same synthetic interactions, with content ids
+   as strings like in the interactions CSV (including missing and non-numeric ids).
+2. Timing: both implementations on --check-events events, then the integer-coded one on
+   --events events (50M by default, content ids already numeric and dates parsed to fit in memory).
+
+Usage (after pip install -e .): python benchmarks/bench_topic_enrichment.py [--events 50000000]
+"""
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from etreprof.data_processing.user_contents import create_user_topic_enrichment
+
+REFERENCE_DATE = datetime(2025, 7, 10, 15, 53, 58)
+N_USERS = 200_000
+N_CONTENTS = 20_000
+TOPICS = list(range(-1, 16))
+
+
+def legacy_topic_enrichment(df_interactions, df_users, df_content_valid, reference_date):
+    """The implementation before integer coding, with datetime.now() replaced by reference_date."""
+    df_interactions = df_interactions.copy()
+    df_content_valid = df_content_valid.copy()
+    df_interactions['created_at'] = pd.to_datetime(df_interactions['created_at'])
+    df_interactions['content_id'] = df_interactions['content_id'].astype(str)
+    df_content_valid['id'] = df_content_valid['id'].astype(str)
+
+    cutoff_date = reference_date - timedelta(days=365*3)
+    df_interactions = df_interactions[df_interactions['created_at'] >= cutoff_date]
+
+    df_interactions_filtered = df_interactions.merge(df_content_valid[['id', 'reduced topics']],
+            left_on='content_id', right_on='id', how='inner')
+    df_interactions_unique = df_interactions_filtered.drop_duplicates(subset=['user_id', 'content_id'])
+    df_user_topic_counts = df_interactions_unique.groupby(['user_id', 'reduced topics']).size().reset_index(name='count')
+    df_topic_matrix = df_user_topic_counts.pivot(index='user_id', columns='reduced topics', values='count').fillna(0)
+
+    df_topic_matrix['topic_count'] = (df_topic_matrix > 0).sum(axis=1)
+    df_topic_matrix.columns = [f'topic_{col}' if col != 'topic_count' else col for col in df_topic_matrix.columns]
+
+    return df_users.merge(df_topic_matrix, left_on='id', right_index=True, how='left').fillna(0)
+
+
+def synthetic_data(n_events, string_ids, seed=0):
+    rng = np.random.default_rng(seed)
+    df_users = pd.DataFrame({'id': np.arange(1, N_USERS + 1), 'degre': rng.integers(1, 3, N_USERS)})
+
+    # 3/4 of the contents have a topic, a few ids are listed twice
+    content_ids = rng.choice(np.arange(1, N_CONTENTS + 1), size=N_CONTENTS * 3 // 4, replace=False)
+    content_ids = np.concatenate([content_ids, content_ids[:50]])
+    df_content_valid = pd.DataFrame({'id': content_ids, 'reduced topics': rng.choice(TOPICS, len(content_ids))})
+
+    # Skewed activity: a few users and contents get most of the events, over the last 5 years
+    user_ids = (rng.zipf(1.3, n_events) % N_USERS) + 1
+    event_contents = (rng.zipf(1.2, n_events) % (N_CONTENTS + 2000)) + 1
+    seconds = rng.integers(0, 5 * 365 * 86400, n_events)
+    created_at = np.datetime64(REFERENCE_DATE) - seconds.astype('timedelta64[s]')
+
+    if string_ids:
+        content_column = event_contents.astype(str).astype(object)
+        content_column[rng.random(n_events) < 0.05] = np.nan       # mail events
+        content_column[rng.random(n_events) < 0.01] = 'newsletter'  # non-numeric ids
+        created_column = pd.Series(created_at).dt.strftime('%Y-%m-%d %H:%M:%S')
+    else:
+        content_column = event_contents
+        created_column = created_at
+
+    df_interactions = pd.DataFrame({'user_id': user_ids, 'content_id': content_column, 'created_at': created_column})
+    return df_interactions, df_users, df_content_valid
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--check-events', type=int, default=2_000_000, help="Events of the equivalence check")
+    parser.add_argument('--events', type=int, default=50_000_000, help="Events of the large timing")
+    args = parser.parse_args()
+
+    df_interactions, df_users, df_content_valid = synthetic_data(args.check_events, string_ids=True)
+    df_legacy, legacy_seconds = timed(legacy_topic_enrichment, df_interactions, df_users, df_content_valid, REFERENCE_DATE)
+    df_new, new_seconds = timed(create_user_topic_enrichment, df_interactions, df_users, df_content_valid,
+                                reference_date=REFERENCE_DATE)
+    pd.testing.assert_frame_equal(df_new, df_legacy)
+    print(f"✅ Identical output on {args.check_events:,} events ({df_new.shape[1] - 2} topic columns)")
+    print(f"⏱️  Previous implementation {legacy_seconds:.2f} s - integer-coded {new_seconds:.2f} s "
+          f"(x{legacy_seconds / new_seconds:.1f})")
+    del df_interactions, df_legacy, df_new
+
+    df_interactions, df_users, df_content_valid = synthetic_data(args.events, string_ids=False, seed=1)
+    df_new, new_seconds = timed(create_user_topic_enrichment, df_interactions, df_users, df_content_valid,
+                                reference_date=REFERENCE_DATE)
+    print(f"⏱️  Integer-coded on {args.events:,} events: {new_seconds:.2f} s "
+          f"({args.events / new_seconds / 1e6:.1f}M events/s, {int((df_new['topic_count'] > 0).sum()):,} users with topics)")
+
+
+if __name__ == "__main__":
+    main()
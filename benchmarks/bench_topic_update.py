@@ -0,0 +1,168 @@
+"""
+Incremental topic model update against a full refit, on daily batches of new contents.
+
+The saved model files (config.json, topics.json, topic_embeddings.safetensors) are copied
+to a temporary directory. A synthetic encoder stands for the e5 encoder: contents on an
+existing topic are embedded close to that topic embedding, contents on --new-themes
+themes the model does not know close to new random directions, and a few outliers
+anywhere. --days batches of --batch new contents go through update_topic_model.
+Measured: the documents embedded (incremental vs a refit over the whole corpus every day)
+and the time of each step. Checked: every new theme becomes one topic, labelled with its
+own words, the labels match the topic embeddings (validate_topic_model) and the contents
+of a new theme published after its topic exists are assigned to it directly.
+
+Usage (after pip install -e .): python benchmarks/bench_topic_update.py [--corpus 9000] [--days 10] [--batch 40]
+"""
+import os
+import json
+import shutil
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+
+GENERIC_WORDS = ['élèves', 'classe', 'séance', 'enseignant', 'activité', 'objectif']
+NEW_THEMES = [
+    ['théâtre', 'improvisation', 'scène', 'personnage', 'répétition', 'spectacle'],
+    ['potager', 'jardin', 'compost', 'semis', 'plantes', 'récolte'],
+    ['robotique', 'programmation', 'capteurs', 'robot', 'algorithme', 'scratch'],
+    ['podcast', 'micro', 'enregistrement', 'radio', 'montage', 'interview'],
+]
+
+
+class SyntheticEncoder:
+    """
+    Embeds a document next to the direction of its theme (found from its words).
+    """
+
+    def __init__(self, directions, vocabularies, noise=0.5):
+        self.directions = directions
+        self.themes = {word: theme for theme, words in enumerate(vocabularies) for word in words}
+        self.noise = noise
+        self.n_encoded = 0
+
+    def encode(self, documents, batch_size=32, normalize_embeddings=True, **kwargs):
+        from etreprof.ml_package.topic_index import document_hash
+
+        dim = self.directions.shape[1]
+        embeddings = np.empty((len(documents), dim), dtype=np.float32)
+        for i, document in enumerate(documents):
+            rng = np.random.default_rng(document_hash(document))
+            theme = next((self.themes[w] for w in document.split() if w in self.themes), None)
+            direction = self.directions[theme] if theme is not None else rng.standard_normal(dim)
+            direction = direction / np.linalg.norm(direction)
+            noise = rng.standard_normal(dim)
+            embeddings[i] = direction + self.noise * noise / np.linalg.norm(noise)
+        self.n_encoded += len(documents)
+        return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def synthetic_batch(day, n_contents, n_topics, n_new_themes, rng):
+    """
+    New contents of a day: 70% on existing topics, 25% on new themes, 5% outliers.
+    Returns the contents and their theme (topic id, 'new_k' or 'outlier').
+    """
+    rows, themes = [], []
+    for i in range(n_contents):
+        draw = rng.random()
+        if draw < 0.70:
+            topic = int(rng.integers(0, n_topics))
+            words = [f'sujet{topic}'] * 3 + list(rng.choice(GENERIC_WORDS, 40))
+            themes.append(topic)
+        elif draw < 0.95:
+            k = int(rng.integers(0, n_new_themes))
+            words = list(rng.choice(NEW_THEMES[k], 30)) + list(rng.choice(GENERIC_WORDS, 20))
+            themes.append(f'new_{k}')
+        else:
+            words = [f'mot{j}' for j in rng.integers(0, 10_000, 40)]
+            themes.append('outlier')
+        rows.append({'id': day * 100_000 + i, 'markdown': f"# Contenu {day}-{i}\n\n{' '.join(words)}"})
+    return pd.DataFrame(rows), themes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--corpus', type=int, default=9000, help="Contents already in the model")
+    parser.add_argument('--days', type=int, default=10, help="Daily batches of new contents")
+    parser.add_argument('--batch', type=int, default=40, help="New contents per day")
+    parser.add_argument('--new-themes', type=int, default=3, choices=range(1, len(NEW_THEMES) + 1),
+                        help="Themes of the new contents the model does not know")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    bertopic_dir = os.path.join(directory, 'bertopic')
+    buffer_dir = os.path.join(directory, 'topic_buffer')
+    from etreprof.ml_package.topic_update import update_topic_model, read_topic_files, BERTOPIC_PATH
+    from etreprof.ml_package.ranking import load_topic_embeddings, TOPIC_IDS
+
+    shutil.copytree(BERTOPIC_PATH, bertopic_dir)
+    model_files = read_topic_files(bertopic_dir)
+    n_rows = len(model_files["embeddings"])
+    outliers = model_files["topics"].get("_outliers", 1)
+    n_topics = n_rows - outliers
+    min_size = model_files["config"]["min_topic_size"]
+
+    rng = np.random.default_rng(0)
+    dim = model_files["embeddings"].shape[1]
+    directions = np.vstack([model_files["embeddings"][outliers:], rng.standard_normal((args.new_themes, dim))])
+    vocabularies = [[f'sujet{t}'] for t in range(n_topics)] + NEW_THEMES[:args.new_themes]
+    encoder = SyntheticEncoder(directions, vocabularies)
+
+    timings = {"embedding": 0.0, "assignment": 0.0, "new_topics": 0.0}
+    full_refit_documents = 0
+    corpus = args.corpus
+    created, theme_topics, direct = [], {}, []
+    for day in range(args.days):
+        df_batch, themes = synthetic_batch(day, args.batch, n_topics, args.new_themes, rng)
+        topics_before = set(theme_topics.values())
+        result = update_topic_model(df_batch, encoder, bertopic_dir, buffer_dir, min_buffer=min_size * 3)
+        for step, seconds in result["timings"].items():
+            timings[step] += seconds
+        corpus += len(df_batch)
+        full_refit_documents += corpus
+
+        assigned = dict(zip(result["assignments"]['id'], result["assignments"]['reduced topics']))
+        for content_id, theme in zip(df_batch['id'], themes):
+            if isinstance(theme, int):
+                assert assigned[content_id] == theme, (content_id, theme, assigned[content_id])
+            elif theme == 'outlier':
+                assert assigned[content_id] == -1
+            elif theme in theme_topics and theme_topics[theme] in topics_before:
+                direct.append(assigned[content_id] == theme_topics[theme])
+        for topic in result["new_topics"]:
+            created.append(topic)
+            members = [t for t, c in zip(themes, df_batch['id']) if assigned.get(c) == topic["id"]]
+            theme_topics[max(set(members), key=members.count) if members else None] = topic["id"]
+            print(f"🆕 day {day + 1}: topic {topic['id']} '{topic['label'].split('_', 1)[1]}' "
+                  f"({topic['size']} contents, {result['buffered']} left in the buffer)")
+
+    print(f"📦 {encoder.n_encoded:,} documents embedded over {args.days} days "
+          f"(a daily refit would embed {full_refit_documents:,}, x{full_refit_documents / encoder.n_encoded:,.0f})")
+    n_updates = args.days
+    print(f"⏱️  per daily update: embedding {timings['embedding'] / n_updates * 1e3:.1f} ms (synthetic encoder), "
+          f"assignment {timings['assignment'] / n_updates * 1e3:.2f} ms, "
+          f"buffer clustering and merge {timings['new_topics'] / n_updates * 1e3:.1f} ms")
+
+    # Every new theme is one new topic, labelled with its words
+    assert len(created) == args.new_themes, created
+    for k in range(args.new_themes):
+        topic_id = theme_topics[f'new_{k}']
+        label = next(t["label"] for t in created if t["id"] == topic_id)
+        assert all(w in NEW_THEMES[k] for w in label.split('_', 1)[1].split(', ')), label
+    assert direct and all(direct), direct
+    print(f"✅ {args.new_themes} new themes -> topics {sorted(theme_topics.values())}, "
+          f"{len(direct)} later contents of these themes assigned directly")
+
+    # The updated files load as the model and the ranking load them
+    with open(os.path.join(bertopic_dir, 'topics.json'), 'r', encoding='utf-8') as f:
+        topics = json.load(f)
+    embeddings = load_topic_embeddings(bertopic_dir)
+    assert len(topics["topic_labels"]) == len(embeddings) == n_rows + args.new_themes
+    assert len(topics["topic_sizes"]) == len(topics["topic_representations"]) == len(embeddings)
+    assert embeddings[:n_rows].tobytes() == model_files["embeddings"][:n_rows].tobytes()
+    assert len(embeddings) >= len(TOPIC_IDS)
+    print(f"✅ {len(embeddings)} topic embeddings and labels, the {n_rows} existing ones unchanged")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""
+Pool of classification worker processes for the API.
+
+Each worker holds its own copy of the classification models and a pinned number of
+torch threads, so classification does not compete with the cheap endpoints for the
+GIL or the CPU threads of the API process. Jobs go through a bounded queue per worker
+and are only sent to workers that finished loading their models: when every queue is
+full the API answers 429, when no worker is ready it answers 503. A worker that dies
+fails its pending jobs at once and is respawned.
+"""
+import os
+import math
+import time
+import queue
+import asyncio
+import itertools
+import threading
+import multiprocessing as mp
+from collections import deque
+from typing import Dict, List, Any
+
+
+class PoolFullError(Exception):
+    """Every worker queue is full, the request should be retried later (HTTP 429)."""
+
+
+class PoolUnavailableError(Exception):
+    """No worker is ready, the worker died or the job timed out (HTTP 503)."""
+
+
+class ClassificationError(Exception):
+    """The worker raised an exception while classifying the contents (HTTP 500)."""
+
+
+# Seconds between two checks of the worker processes by the result reader
+LIVENESS_CHECK_SECONDS = 1.0
+
+
+def _worker_main(worker_id, generation, job_queue, result_queue, torch_threads):
+    """
+    Worker process loop: pin the thread counts, load the models, then classify jobs
+    until a None job is received.
+    """
+    for variable in ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS']:
+        os.environ[variable] = str(torch_threads)
+    try:
+        import torch
+        torch.set_num_threads(torch_threads)
+        torch.set_num_interop_threads(1)
+    except ImportError:
+        pass
+
+    from etreprof.ml_package.models import classify_contents, warmup_classification
+    from etreprof.ml_package.artifacts import artifact_manager
+
+    result_queue.put(("ready", worker_id, generation, None, warmup_classification(), None))
+    # Each worker swaps in new versions of its models on its own
+    artifact_manager.start_watching(float(os.getenv("ARTIFACTS_POLL_SECONDS", "30")))
+
+    while True:
+        job = job_queue.get()
+        if job is None:
+            break
+        job_id, contents = job
+        start = time.perf_counter()
+        try:
+            result, error = classify_contents(contents), None
+        except Exception as e:
+            result, error = None, f"{type(e).__name__}: {e}"
+        result_queue.put(("done", worker_id, generation, job_id, time.perf_counter() - start, (result, error)))
+
+
+class ClassificationPool:
+    """
+    Dispatches classification jobs to the least loaded worker process.
+
+    Parameters
+    ----------
+    n_workers : int
+        Number of worker processes.
+    torch_threads : int
+        Number of torch (and BLAS) threads of each worker.
+    max_queue_per_worker : int
+        Jobs waiting or running per worker before the pool is considered full.
+    timeout : float
+        Seconds a request waits for its result before failing with PoolUnavailableError.
+    """
+
+    def __init__(self, n_workers: int = 2, torch_threads: int = 1, max_queue_per_worker: int = 8,
+                 timeout: float = 60.0):
+        self.n_workers = n_workers
+        self.torch_threads = torch_threads
+        self.max_queue_per_worker = max_queue_per_worker
+        self.timeout = timeout
+        self._context = None
+        self._processes = []
+        self._job_queues = []
+        self._result_queue = None
+        self._reader = None
+        self._lock = threading.Lock()
+        self._job_ids = itertools.count()
+        self._pending = {}
+        # Worker of every job sent and not done yet, to fail them if it dies
+        self._assigned = {}
+        self._stopping = False
+        self._workers = [
+            {"generation": 0, "ready": False, "load_seconds": None, "queue_depth": 0, "completed": 0,
+             "errors": 0, "restarts": 0, "service_times": deque(maxlen=200)}
+            for _ in range(n_workers)
+        ]
+
+    @classmethod
+    def from_env(cls):
+        """
+        Build the pool from CLASSIFY_WORKERS, CLASSIFY_TORCH_THREADS, CLASSIFY_MAX_QUEUE
+        and CLASSIFY_TIMEOUT.
+        """
+        n_workers = int(os.getenv("CLASSIFY_WORKERS", "2"))
+        default_threads = max(1, (os.cpu_count() or 1) // max(n_workers, 1) // 2)
+        return cls(
+            n_workers=n_workers,
+            torch_threads=int(os.getenv("CLASSIFY_TORCH_THREADS", str(default_threads))),
+            max_queue_per_worker=int(os.getenv("CLASSIFY_MAX_QUEUE", "8")),
+            timeout=float(os.getenv("CLASSIFY_TIMEOUT", "60"))
+        )
+
+    def start(self):
+        # spawn: workers must not inherit the API's threads and event loop
+        self._context = mp.get_context('spawn')
+        self._result_queue = self._context.Queue()
+        for worker_id in range(self.n_workers):
+            job_queue, process = self._spawn(worker_id)
+            self._job_queues.append(job_queue)
+            self._processes.append(process)
+
+        self._reader = threading.Thread(target=self._read_results, daemon=True, name="classification-results")
+        self._reader.start()
+
+    def _spawn(self, worker_id):
+        job_queue = self._context.Queue()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(worker_id, self._workers[worker_id]["generation"], job_queue, self._result_queue,
+                  self.torch_threads),
+            daemon=True,
+            name=f"classification-worker-{worker_id}"
+        )
+        process.start()
+        return job_queue, process
+
+    def stop(self):
+        self._stopping = True
+        for job_queue in self._job_queues:
+            job_queue.put(None)
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        if self._result_queue is not None:
+            self._result_queue.put(("stop", None, None, None, None, None))
+
+    def _read_results(self):
+        next_check = time.monotonic() + LIVENESS_CHECK_SECONDS
+        while True:
+            if time.monotonic() >= next_check:
+                self._respawn_dead_workers()
+                next_check = time.monotonic() + LIVENESS_CHECK_SECONDS
+            try:
+                kind, worker_id, generation, job_id, seconds, payload = self._result_queue.get(
+                    timeout=LIVENESS_CHECK_SECONDS)
+            except queue.Empty:
+                continue
+            if kind == "stop":
+                break
+
+            with self._lock:
+                worker = self._workers[worker_id]
+                if generation != worker["generation"]:
+                    continue  # Sent by a worker process that died since
+                if kind == "ready":
+                    worker["ready"], worker["load_seconds"] = True, seconds
+                    continue
+
+                result, error = payload
+                self._assigned.pop(job_id, None)
+                worker["queue_depth"] -= 1
+                worker["completed"] += 1
+                worker["service_times"].append(seconds)
+                if error is not None:
+                    worker["errors"] += 1
+                pending = self._pending.pop(job_id, None)
+            if pending is None:
+                continue  # The request timed out
+
+            loop, future = pending
+            loop.call_soon_threadsafe(_resolve, future, result, error)
+
+    def _respawn_dead_workers(self):
+        """
+        Fail the jobs of the workers that died and start a new process in their place.
+        """
+        if self._stopping:
+            return
+        for worker_id, process in enumerate(self._processes):
+            if process.is_alive():
+                continue
+            with self._lock:
+                worker = self._workers[worker_id]
+                lost_jobs = [job_id for job_id, assigned in self._assigned.items() if assigned == worker_id]
+                lost = [self._pending.pop(job_id, None) for job_id in lost_jobs]
+                for job_id in lost_jobs:
+                    del self._assigned[job_id]
+                worker.update(generation=worker["generation"] + 1, ready=False, load_seconds=None, queue_depth=0)
+                worker["restarts"] += 1
+                job_queue, new_process = self._spawn(worker_id)
+                self._job_queues[worker_id], self._processes[worker_id] = job_queue, new_process
+
+            error = PoolUnavailableError(f"Classification worker {worker_id} died (exit code {process.exitcode})")
+            for pending in lost:
+                if pending is not None:
+                    loop, future = pending
+                    loop.call_soon_threadsafe(_fail, future, error)
+
+    async def classify(self, contents: List[str]) -> Dict[str, Any]:
+        """
+        Classify contents in a worker process.
+
+        Raises
+        ------
+        PoolFullError
+            If every ready worker already has max_queue_per_worker jobs.
+        PoolUnavailableError
+            If no worker is ready, the worker died or the result did not come back within the timeout.
+        ClassificationError
+            If the worker raised an exception while classifying.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        with self._lock:
+            alive = [i for i, process in enumerate(self._processes) if process.is_alive()]
+            if not alive:
+                raise PoolUnavailableError("No classification worker is running")
+            ready = [i for i in alive if self._workers[i]["ready"]]
+            if not ready:
+                raise PoolUnavailableError("The classification workers are still loading their models")
+            worker_id = min(ready, key=lambda i: self._workers[i]["queue_depth"])
+            if self._workers[worker_id]["queue_depth"] >= self.max_queue_per_worker:
+                raise PoolFullError("Classification queue is full")
+            job_id = next(self._job_ids)
+            self._pending[job_id] = (loop, future)
+            self._assigned[job_id] = worker_id
+            self._workers[worker_id]["queue_depth"] += 1
+            self._job_queues[worker_id].put((job_id, contents))
+
+        try:
+            return await asyncio.wait_for(future, timeout=self.timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._pending.pop(job_id, None)
+            raise PoolUnavailableError(f"Classification did not complete within {self.timeout:.0f} s")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Queue depth, completed jobs and service time of every worker.
+        """
+        workers = []
+        for worker_id, worker in enumerate(self._workers):
+            service_times = sorted(worker["service_times"])
+            workers.append({
+                "worker_id": worker_id,
+                "alive": worker_id < len(self._processes) and self._processes[worker_id].is_alive(),
+                "ready": worker["ready"],
+                "load_seconds": round(worker["load_seconds"], 2) if worker["load_seconds"] is not None else None,
+                "queue_depth": worker["queue_depth"],
+                "completed": worker["completed"],
+                "errors": worker["errors"],
+                "restarts": worker["restarts"],
+                "service_time_ms": {
+                    "mean": round(sum(service_times) / len(service_times) * 1000, 1) if service_times else None,
+                    "p95": round(service_times[math.ceil(0.95 * len(service_times)) - 1] * 1000, 1)
+                    if service_times else None
+                }
+            })
+        return {
+            "n_workers": self.n_workers,
+            "torch_threads": self.torch_threads,
+            "max_queue_per_worker": self.max_queue_per_worker,
+            "workers": workers
+        }
+
+
+def _resolve(future, result, error):
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(ClassificationError(error))
+    else:
+        future.set_result(result)
+
+
+def _fail(future, error):
+    if not future.done():
+        future.set_exception(error)
@@ -1,41 +1,320 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Body, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.routing import APIRoute
+from starlette.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
+from typing import List, Optional
 import os
+import hmac
+import asyncio
+import functools
+from urllib.parse import urlencode
 import pandas as pd
 from dotenv import load_dotenv
 
 load_dotenv()
 
-from etreprof.ml_package.models import classify_content, get_cluster_info, predict_user_clusters, get_user_profile
+from etreprof.ml_package.models import (
+    classify_contents, classify_content, get_cluster_info, predict_user_clusters, get_user_profile, get_user_profiles,
+    warmup_classification
+)
+from etreprof.ml_package.topic_index import lookup_content_topic
+from etreprof.ml_package.artifacts import artifact_manager
 from etreprof.data_processing.user_full_processing import main_process_users
+from etreprof.data_processing.sources import read_sources
+from etreprof.data_processing.profiling import profiled, profiling_thread
 from etreprof.ml_package.recommender import generate_simple_recommendations
+from etreprof.ml_package.reco_table import get_cluster_recommendations, reco_table_version
+from etreprof.ml_package.content_index import find_similar_contents
+from etreprof.ml_package.reco_export import recommendation_export, EXPORT_FORMATS
+from etreprof.ml_package.stats_cube import build_stats_cube, load_stats_cube, query_stats_cube, CUBE_DIMENSIONS
+from etreprof.api.classification_pool import (
+    ClassificationPool, PoolFullError, PoolUnavailableError, ClassificationError
+)
+from etreprof.api.micro_batcher import MicroBatcher
+from etreprof.api.snapshots import SnapshotStore, snapshot_response
+from etreprof.api.preload import parse_preload, preload
 
+# Serving profiles: "lite" instances only serve clusters, profiles and recommendations
+# and never import the classification stack (torch, BERTopic), "full" instances also
+# classify contents and load the classification models at startup.
+SERVING_PROFILES = {
+    "lite": [],
+    "full": ["classification"]
+}
+SERVING_PROFILE = os.getenv("SERVING_PROFILE", "full")
+if SERVING_PROFILE not in SERVING_PROFILES:
+    raise ValueError(f"SERVING_PROFILE must be one of {list(SERVING_PROFILES)}, got {SERVING_PROFILE!r}")
 
-app = FastAPI(title="ÊtrePROF Classification API", version="1.0.0")
+
+def subsystem_enabled(subsystem: str) -> bool:
+    return subsystem in SERVING_PROFILES[SERVING_PROFILE]
+
+
+def subsystem_disabled_response(subsystem: str):
+    return JSONResponse(status_code=503, content={
+        "success": False,
+        "error": f"The {subsystem} subsystem is not available in the '{SERVING_PROFILE}' serving profile"
+    })
+
+
+# Classification runs in a pool of worker processes (CLASSIFY_WORKERS, 0 = in the API process)
+classification_pool = None
+# Concurrent /classify requests are gathered into batches (CLASSIFY_BATCH_WINDOW_MS, 0 = no batching)
+classification_batcher = None
+# Pre-serialized /clusters and /recommend responses, rebuilt when their sources change
+snapshots = SnapshotStore()
+# Maximum number of ids of a POST /users/profiles request
+PROFILES_MAX_IDS = int(os.getenv("PROFILES_MAX_IDS", "100000"))
+# Seconds between two checks for new artifact files (0 = never swap artifacts)
+ARTIFACTS_POLL_SECONDS = float(os.getenv("ARTIFACTS_POLL_SECONDS", "30"))
+# Data loaded at import, before gunicorn --preload forks the workers ("all" or names, see preload.py)
+PRELOAD_ARTIFACTS = parse_preload(os.getenv("PRELOAD_ARTIFACTS", ""))
+if PRELOAD_ARTIFACTS:
+    preload_timings = preload(PRELOAD_ARTIFACTS)
+    print(f"✅ {len(preload_timings)}/{len(PRELOAD_ARTIFACTS)} artifacts preloaded in {sum(preload_timings.values()):.1f} s")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global classification_pool, classification_batcher
+    if subsystem_enabled("classification"):
+        if float(os.getenv("CLASSIFY_BATCH_WINDOW_MS", "10")) > 0:
+            classification_batcher = MicroBatcher.from_env(classify_in_backend)
+        if int(os.getenv("CLASSIFY_WORKERS", "2")) > 0:
+            classification_pool = ClassificationPool.from_env()
+            classification_pool.start()
+            print(f"✅ {classification_pool.n_workers} classification workers started")
+        else:
+            loading_time = warmup_classification()
+            print(f"✅ Classification models loaded in {loading_time:.1f} s")
+    artifact_manager.start_watching(ARTIFACTS_POLL_SECONDS)
+    yield
+    artifact_manager.stop_watching()
+    if classification_pool is not None:
+        classification_pool.stop()
+
+
+app = FastAPI(title="ÊtrePROF Classification API", version="1.0.0", lifespan=lifespan)
+
+# Requests carrying PROFILE_TOKEN (X-Profile header or profile query parameter) run under
+# the sampling profiler, without a token no middleware is installed (see profiling.py)
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+
+
+def thread_profiled(endpoint):
+    """
+    Wrap an endpoint so that the thread running it (the event loop for async endpoints,
+    a thread of the pool for sync ones) is sampled by the profiler of its request.
+    """
+    if asyncio.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            with profiling_thread():
+                return await endpoint(*args, **kwargs)
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            with profiling_thread():
+                return endpoint(*args, **kwargs)
+    return wrapper
+
+
+class ProfiledRoute(APIRoute):
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, thread_profiled(endpoint), **kwargs)
+
+
+if PROFILE_TOKEN:
+    app.router.route_class = ProfiledRoute
+
+    @app.middleware("http")
+    async def profile_request(request: Request, call_next):
+        token = request.headers.get("X-Profile") or request.query_params.get("profile")
+        if "profile" in request.query_params:
+            # The parameter belongs to the profiler, the routes never see it
+            request.scope["query_string"] = urlencode(
+                [(k, v) for k, v in request.query_params.multi_items() if k != "profile"]
+            ).encode()
+        if token is None or not hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode()):
+            return await call_next(request)
+        # Only the thread running the endpoint is sampled, not the other requests served meanwhile.
+        # Profiling stops when the response starts: the body of a StreamingResponse is not profiled.
+        with profiled(f"{request.method} {request.url.path}", context_threads=True) as profiler:
+            response = await call_next(request)
+        response.headers["X-Profile-File"] = os.path.basename(profiler.path)
+        return response
 
 @app.get("/")
 def root():
     """Root endpoint to check if the API is running.
-    Returns a simple greeting message.
+    Returns a simple greeting message and the serving profile.
+    """
+    return {"greetings": "Welcome to ÊtrePROF API!", "status": "running", "serving_profile": SERVING_PROFILE}
+
+async def classify_in_backend(contents: List[str]):
+    """
+    Classify contents in the worker pool, or in the thread pool when there are no workers.
+    """
+    if classification_pool is None:
+        return await run_in_threadpool(classify_contents, contents)
+    return await classification_pool.classify(contents)
+
+async def run_classification(classification):
     """
-    return {"greetings": "Welcome to ÊtrePROF API!", "status": "running"}
+    Await a classification.
+    Returns its result, the 429/503 response when the pool cannot take the job,
+    or the 500 response when the classification failed.
+    """
+    try:
+        return await classification
+    except PoolFullError as e:
+        return JSONResponse(status_code=429, headers={"Retry-After": "1"},
+                            content={"success": False, "error": str(e)})
+    except PoolUnavailableError as e:
+        return JSONResponse(status_code=503, content={"success": False, "error": str(e)})
+    except ClassificationError as e:
+        return JSONResponse(status_code=500, content={"success": False, "error": f"Classification failed: {e}"})
 
 @app.post("/classify")
-def classify(content: str):
+async def classify(content: str, content_id: Optional[int] = None):
     """    Endpoint to classify content based on its type.
     Parameters
     ----------
     content : str
         The content to classify.
+    content_id : int, optional
+        The id of the content on the platform. When its markdown did not change since it was
+        classified, its stored topic is used and the topic model does not run.
+    """
+    if not subsystem_enabled("classification"):
+        return subsystem_disabled_response("classification")
+
+    lookup = lookup_content_topic(content_id, content) if content_id is not None else None
+    if lookup is not None and lookup["status"] == "hit":
+        # Only the cheap defi and theme classifiers run (when packaged), in the API process
+        data = await run_in_threadpool(classify_content, content, content_id)
+        return {"success": True, "data": {**data, "batch_size": 1}}
+
+    if classification_batcher is not None:
+        # Classified together with the requests arriving in the same window
+        result = await run_classification(classification_batcher.classify(content))
+        if isinstance(result, JSONResponse):
+            return result
+        data = result
+    else:
+        result = await run_classification(classify_in_backend([content]))
+        if isinstance(result, JSONResponse):
+            return result
+        data = {**result["results"][0], "timings_ms": result["timings_ms"], "batch_size": 1}
+    if lookup is not None:
+        data["index_lookup"] = lookup["status"]
+    return {"success": True, "data": data}
+
+@app.get("/classify/{content_id}")
+def classify_by_id(content_id: int):
+    """Endpoint to get the stored topic of a content already classified, without running the model.
+    Available in every serving profile.
+    Parameters
+    ----------
+    content_id : int
+        The id of the content on the platform.
+    """
+    lookup = lookup_content_topic(content_id)
+    if lookup["status"] == "unknown_id":
+        return {
+            "success": False,
+            "error": f"Content {content_id} has not been classified, POST /classify?content_id={content_id} with its markdown"
+        }
+    return {
+        "success": True,
+        "data": {"content_id": content_id, "topic_principal": lookup["topic_principal"], "classification_path": "index"}
+    }
+
+@app.post("/classify/batch")
+async def classify_batch(contents: List[str] = Body(...)):
+    """Endpoint to classify several contents at once.
+    The markdown cleaning, topic model and sparse features run once for the whole batch.
+    Parameters
+    ----------
+    contents : List[str]
+        The contents to classify (JSON array in the request body, max 64).
+    """
+    if not subsystem_enabled("classification"):
+        return subsystem_disabled_response("classification")
+
+    if len(contents) == 0 or len(contents) > 64:
+        return {
+            "success": False,
+            "error": "Provide between 1 and 64 contents"
+        }
+
+    result = await run_classification(classify_in_backend(contents))
+    if isinstance(result, JSONResponse):
+        return result
+    return {"success": True, "data": result["results"], "timings_ms": result["timings_ms"]}
+
+@app.get("/admin/classification/stats")
+def classification_stats():
+    """Endpoint to monitor the classification workers: queue depth and service time per worker,
+    and the batches formed by the micro-batcher."""
+    return {
+        "success": True,
+        "pool": classification_pool.stats() if classification_pool is not None else None,
+        "batcher": classification_batcher.stats() if classification_batcher is not None else None,
+        "serving_profile": SERVING_PROFILE
+    }
+
+@app.get("/admin/artifacts")
+def artifact_stats():
+    """Endpoint to list the model and data artifacts of the API process with their active version and load time.
+    Classification workers hold their own copy of the topic model and swap it on their own."""
+    return {"success": True, "poll_seconds": ARTIFACTS_POLL_SECONDS, "artifacts": artifact_manager.stats()}
+
+@app.post("/admin/artifacts/{name}/reload")
+def reload_artifact(name: str, force: bool = False):
+    """Endpoint to load, validate and swap in the current files of an artifact without waiting for the next check.
+    Parameters
+    ----------
+    name : str
+        The artifact name (see GET /admin/artifacts).
+    force : bool
+        Reload even if the files did not change.
     """
-    result = classify_content(content)
-    return {"success": True, "data": result}
+    stats = artifact_manager.stats()
+    if name not in stats:
+        return {
+            "success": False,
+            "error": f"Unknown artifact {name}",
+            "available_artifacts": list(stats)
+        }
+
+    swapped = artifact_manager.reload(name, force=force)
+    artifact = artifact_manager.stats()[name]
+    if artifact["last_error"] is not None:
+        return {
+            "success": False,
+            "error": artifact["last_error"],
+            "artifact": artifact
+        }
+    return {"success": True, "swapped": swapped, "artifact": artifact}
+
+@app.get("/admin/snapshots")
+def snapshot_stats():
+    """Endpoint to list the cached response snapshots with their ETag, build time and size."""
+    return {"success": True, "snapshots": snapshots.stats()}
 
 @app.get("/clusters")
-def get_clusters():
+def get_clusters(request: Request):
     """Endpoint to get information about user clusters.
-    Returns a dictionary with cluster IDs and their descriptions."""
-    cluster_info = get_cluster_info()
-    return {"success": True, "clusters": cluster_info}
+    Returns a dictionary with cluster IDs and their descriptions.
+    The response carries an ETag and is answered with 304 when If-None-Match matches it."""
+    snapshot = snapshots.get(
+        "clusters",
+        artifact_manager.version("clustering"),
+        lambda: {"success": True, "clusters": get_cluster_info()}
+    )
+    return snapshot_response(request, snapshot)
 
 @app.post("/clusters/recompute")
 def recompute_clusters():
@@ -46,14 +325,19 @@ def recompute_clusters():
     It's a long-running operation and should be used with caution.
     It won't be available on cloud run.
     """
-    df_users = pd.read_csv(os.getenv("USER_URL_DB"), low_memory=False)
-    df_contents = pd.read_csv(os.getenv("CONTENTS_URL_DB"), low_memory=False)
-    df_interactions = pd.read_csv(os.getenv("INTERACTIONS_URL_DB"), low_memory=False)
-    df_content_valid = pd.read_csv(os.getenv("CONTENT_WITH_TOPICS_URL_DB"), low_memory=False)
+    # Fetched concurrently, sources unchanged since the last recompute are read from the local cache
+    sources, fetched = read_sources()
+    df_users, df_contents = sources["users"], sources["contents"]
+    df_interactions, df_content_valid = sources["interactions"], sources["content_with_topics"]
 
     df_users_processed = main_process_users(df_users, df_contents, df_content_valid, df_interactions)
 
     new_clusters = predict_user_clusters(df_users_processed)
+    snapshots.invalidate()
+
+    # Dashboard statistics of the new clusters
+    build_stats_cube(df_users_processed, new_clusters)
+    artifact_manager.reload("stats_cube")
 
     cluster_counts = pd.Series(new_clusters).value_counts().sort_index()
 
@@ -68,21 +352,75 @@ def recompute_clusters():
             "cluster_3": int(cluster_counts.get(3, 0)),
             "cluster_4": int(cluster_counts.get(4, 0))
         },
-        "processing_time": "calculated in real-time"
+        "processing_time": "calculated in real-time",
+        "sources": {name: result["status"] for name, result in fetched.items()}
+    }
+
+@app.get("/stats")
+def get_stats(request: Request, group_by: str = ""):
+    """Endpoint to count the users and average their features by cluster, académie, département,
+    degré and establishment flags, answered from the aggregate cube built at recompute time.
+    Parameters
+    ----------
+    group_by : str
+        Comma-separated dimensions kept in the result (the others are rolled up), e.g. "cluster,academie".
+    <dimension> : str, optional
+        Any dimension as a filter, with comma-separated accepted values ("null" for missing),
+        e.g. cluster=2&academie=Créteil&college=1.
+    """
+    cube = load_stats_cube()
+    if cube is None:
+        return {
+            "success": False,
+            "error": "The statistics cube has not been built, recompute the clusters first"
+        }
+
+    unknown_parameters = [p for p in request.query_params if p != "group_by" and p not in CUBE_DIMENSIONS]
+    if unknown_parameters:
+        return {
+            "success": False,
+            "error": f"Unknown parameters {unknown_parameters}",
+            "available_dimensions": CUBE_DIMENSIONS
+        }
+
+    filters = {d: request.query_params[d].split(",") for d in CUBE_DIMENSIONS if d in request.query_params}
+    dimensions = [d for d in group_by.split(",") if d]
+    try:
+        result = query_stats_cube(cube, filters, dimensions)
+    except ValueError as e:
+        return {
+            "success": False,
+            "error": str(e)
+        }
+
+    return {
+        "success": True,
+        "group_by": dimensions,
+        "filters": filters,
+        **result,
+        "generated_at": cube["meta"]["generated_at"]
     }
 
 @app.get("/user/{user_id}/profile")
-def get_user_profile_endpoint(user_id: int):
+def get_user_profile_endpoint(user_id: int, mode: str = "cluster"):
     """Endpoint to get the profile of a user by their ID.
     Parameters
     ----------
     user_id : int
         The ID of the user whose profile is requested.
+    mode : str
+        "cluster" (default) or "personalized" to rank contents by the user's topics.
     Returns
     -------
     dict : A dictionary containing the user's profile data or an error message if the user is not found.
     """
-    profile_data = get_user_profile(user_id)
+    if mode not in ["cluster", "personalized"]:
+        return {
+            "success": False,
+            "error": "Mode must be 'cluster' or 'personalized'"
+        }
+
+    profile_data = get_user_profile(user_id, mode=mode)
 
     if "error" in profile_data:
         return {
@@ -95,8 +433,74 @@ def get_user_profile_endpoint(user_id: int):
         "data": profile_data
     }
 
+@app.post("/users/profiles")
+def get_user_profiles_endpoint(user_ids: List[int] = Body(...), recommendations: bool = True):
+    """Endpoint to get the profiles of several users at once.
+    The ids are resolved in one lookup and the cluster, levels and recommendations are built
+    once per (cluster, levels) segment, so the cost grows with the number of ids, not of requests.
+    Parameters
+    ----------
+    user_ids : List[int]
+        The IDs of the users (JSON array in the request body, max PROFILES_MAX_IDS).
+    recommendations : bool
+        Whether to include the cluster recommendations of every profile (default is True).
+    Returns
+    -------
+    dict : The profiles found, in the order of the ids, and the list of ids not found.
+    """
+    if len(user_ids) == 0 or len(user_ids) > PROFILES_MAX_IDS:
+        return {
+            "success": False,
+            "error": f"Provide between 1 and {PROFILES_MAX_IDS} user ids"
+        }
+
+    result = get_user_profiles(user_ids, include_recommendations=recommendations)
+
+    # Serialized directly: the profiles are plain JSON types and jsonable_encoder
+    # would walk every one of them
+    return JSONResponse(content={
+        "success": True,
+        "data": result["profiles"],
+        "not_found": result["not_found"]
+    })
+
+@app.get("/export/recommendations")
+def export_recommendations(format: str = "ndjson", cluster_id: Optional[int] = None,
+                           academie: Optional[str] = None, degre: Optional[int] = None):
+    """Endpoint to export the recommendations of every user, streamed in user id order.
+    Rows are serialized by chunks as the response is sent, so the memory used does not depend
+    on the number of users.
+    Parameters
+    ----------
+    format : str
+        "ndjson" (default, one JSON object per line) or "csv".
+    cluster_id : int, optional
+        Only export the users of this cluster.
+    academie : str, optional
+        Only export the users of this académie.
+    degre : int, optional
+        Only export the users of this degré.
+    """
+    if format not in EXPORT_FORMATS:
+        return {
+            "success": False,
+            "error": f"Format must be one of {EXPORT_FORMATS}"
+        }
+    if cluster_id is not None and cluster_id not in [0, 1, 2, 3, 4]:
+        return {
+            "success": False,
+            "error": "Cluster ID must be 0, 1, 2, 3, or 4",
+            "available_clusters": [0, 1, 2, 3, 4]
+        }
+
+    rows = recommendation_export(format, cluster_id=cluster_id, academie=academie, degre=degre)
+    if format == "csv":
+        return StreamingResponse(rows, media_type="text/csv; charset=utf-8",
+                                 headers={"Content-Disposition": "attachment; filename=recommendations.csv"})
+    return StreamingResponse(rows, media_type="application/x-ndjson")
+
 @app.get("/recommend/{cluster_id}")
-def get_recommendations(cluster_id: int):
+def get_recommendations(cluster_id: int, request: Request):
     if cluster_id not in [0, 1, 2, 3, 4]:
         return {
             "success": False,
@@ -104,13 +508,55 @@ def get_recommendations(cluster_id: int):
             "available_clusters": [0, 1, 2, 3, 4]
         }
 
-    recommendations = generate_simple_recommendations(cluster_id)
+    # Without the materialized table recommendations are drawn at each request and not cached
+    table_version = reco_table_version()
+    if table_version is None:
+        return {
+            "success": True,
+            "cluster_id": cluster_id,
+            "recommendations": generate_simple_recommendations(cluster_id),
+            "status": "Cluster recommendations generated successfully"
+        }
+
+    snapshot = snapshots.get(
+        f"recommend/{cluster_id}",
+        table_version,
+        lambda: {
+            "success": True,
+            "cluster_id": cluster_id,
+            "recommendations": get_cluster_recommendations(cluster_id),
+            "status": "Cluster recommendations generated successfully"
+        }
+    )
+    return snapshot_response(request, snapshot)
+
+@app.get("/content/{content_id}/similar")
+def get_similar_contents(content_id: int, k: int = 10):
+    """Endpoint to get the contents closest to a given content, from the precomputed embeddings index.
+    Parameters
+    ----------
+    content_id : int
+        The ID of the reference content.
+    k : int
+        The number of similar contents to return (default is 10, max 100).
+    """
+    if k < 1 or k > 100:
+        return {
+            "success": False,
+            "error": "k must be between 1 and 100"
+        }
+
+    result = find_similar_contents(content_id, k)
+
+    if "error" in result:
+        return {
+            "success": False,
+            "error": result["error"]
+        }
 
     return {
         "success": True,
-        "cluster_id": cluster_id,
-        "recommendations": recommendations,
-        "status": "Cluster recommendations generated successfully"
+        "data": result
     }
 
 
@@ -0,0 +1,119 @@
+"""
+Dynamic micro-batching of concurrent classification requests.
+
+Requests arriving within a short window are gathered and classified with one batched
+encode and topic assignment, then every request gets its own result back. A batch is
+sent as soon as the window expires, the maximum batch size is reached or the token
+budget is spent.
+"""
+import os
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Any
+
+# The encoder truncates documents at 512 tokens
+MAX_TOKENS_PER_DOCUMENT = 512
+
+
+def estimate_tokens(content: str) -> int:
+    """
+    Rough token count of a content for the encoder (about 4 tokens for 3 French words).
+    """
+    return min(len(content.split()) * 4 // 3 + 2, MAX_TOKENS_PER_DOCUMENT)
+
+
+class MicroBatcher:
+    """
+    Gather single classification requests into batches.
+
+    Parameters
+    ----------
+    process_batch : Callable[[List[str]], Awaitable[Dict]]
+        Coroutine classifying a list of contents, returning classify_contents' output.
+    window_ms : float
+        How long the first request of a batch waits for others.
+    max_batch_size : int
+        Number of contents that triggers an immediate flush.
+    max_batch_tokens : int
+        Estimated encoder tokens that trigger an immediate flush.
+    """
+
+    def __init__(self, process_batch: Callable[[List[str]], Awaitable[Dict[str, Any]]],
+                 window_ms: float = 10.0, max_batch_size: int = 16, max_batch_tokens: int = 4096):
+        self.process_batch = process_batch
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self._contents = []
+        self._futures = []
+        self._tokens = 0
+        self._timer = None
+        self.batches_sent = 0
+        self.contents_sent = 0
+
+    @classmethod
+    def from_env(cls, process_batch):
+        """
+        Build the batcher from CLASSIFY_BATCH_WINDOW_MS, CLASSIFY_MAX_BATCH and CLASSIFY_MAX_BATCH_TOKENS.
+        """
+        return cls(
+            process_batch,
+            window_ms=float(os.getenv("CLASSIFY_BATCH_WINDOW_MS", "10")),
+            max_batch_size=int(os.getenv("CLASSIFY_MAX_BATCH", "16")),
+            max_batch_tokens=int(os.getenv("CLASSIFY_MAX_BATCH_TOKENS", "4096"))
+        )
+
+    async def classify(self, content: str) -> Dict[str, Any]:
+        """
+        Classify one content as part of a batch.
+        Returns the classification of the content with the timings and size of its batch.
+        """
+        tokens = estimate_tokens(content)
+        if self._contents and self._tokens + tokens > self.max_batch_tokens:
+            self._flush()
+
+        future = asyncio.get_running_loop().create_future()
+        self._contents.append(content)
+        self._futures.append(future)
+        self._tokens += tokens
+
+        if len(self._contents) >= self.max_batch_size or self._tokens >= self.max_batch_tokens:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._contents:
+            return
+
+        contents, futures = self._contents, self._futures
+        self._contents, self._futures, self._tokens = [], [], 0
+        self.batches_sent += 1
+        self.contents_sent += len(contents)
+        asyncio.ensure_future(self._run(contents, futures))
+
+    async def _run(self, contents: List[str], futures: List[asyncio.Future]):
+        try:
+            output = await self.process_batch(contents)
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, result in zip(futures, output["results"]):
+            if not future.done():
+                future.set_result({**result, "timings_ms": output["timings_ms"], "batch_size": len(contents)})
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window_ms": self.window * 1000,
+            "max_batch_size": self.max_batch_size,
+            "max_batch_tokens": self.max_batch_tokens,
+            "batches_sent": self.batches_sent,
+            "mean_batch_size": round(self.contents_sent / self.batches_sent, 2) if self.batches_sent else None
+        }
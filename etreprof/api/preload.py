@@ -0,0 +1,80 @@
+"""
+Serving data loaded once in the master process and shared by the API workers.
+
+With `gunicorn --preload`, main.py is imported in the master and the workers are forked
+from it: the data loaded at import time (PRELOAD_ARTIFACTS) is shared copy-on-write
+instead of being loaded again by every worker. NumPy arrays (KMeans centroids, user
+assignments, topic counts, recommendation pools...) keep their values in buffers the
+workers only read, so those pages stay shared. gc.freeze() moves the objects loaded
+before the fork out of the collected generations, so a garbage collection in a worker
+does not write to their headers and copy their pages.
+
+Files already memory-mapped (reco_table, content_index, consumed_index, stats_cube,
+popularity) are shared through the page cache in any case, forked or not.
+"""
+import gc
+import time
+from typing import Callable, Dict, List
+
+from etreprof.ml_package.models import load_clustering_models, load_user_assignments
+from etreprof.ml_package.recommender import load_recommendations_csv
+from etreprof.ml_package.popularity import load_popularity
+from etreprof.ml_package.consumed_index import load_consumed_index
+from etreprof.ml_package.stats_cube import load_stats_cube
+from etreprof.ml_package.topic_index import load_topic_index
+from etreprof.ml_package.reco_table import load_reco_table
+from etreprof.ml_package.content_index import load_content_index
+from etreprof.ml_package.ranking import load_ranking_index, load_user_topics
+
+# Read-only data of the serving paths, by name. The classification models (torch,
+# BERTopic) are not preloaded: forking a process whose torch threads already run is unsafe,
+# and they live in the classification workers anyway.
+PRELOADERS: Dict[str, Callable[[], object]] = {
+    "clustering": load_clustering_models,
+    "user_assignments": load_user_assignments,
+    "recommendations": load_recommendations_csv,
+    "popularity": load_popularity,
+    "consumed_index": load_consumed_index,
+    "stats_cube": load_stats_cube,
+    "topic_index": load_topic_index,
+    "reco_table": load_reco_table,
+    "content_index": load_content_index,
+    "user_topics": load_user_topics,
+    "ranking_index": load_ranking_index
+}
+
+
+def parse_preload(value: str) -> List[str]:
+    """
+    Names of PRELOAD_ARTIFACTS: empty for none, "all", or names separated by commas.
+    """
+    if value.strip() == "all":
+        return list(PRELOADERS)
+    names = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = [name for name in names if name not in PRELOADERS]
+    if unknown:
+        raise ValueError(f"Unknown PRELOAD_ARTIFACTS {unknown}, available: {list(PRELOADERS)}")
+    return names
+
+
+def preload(names: List[str]) -> Dict[str, float]:
+    """
+    Load the named data, then freeze the objects of the process for the garbage collector.
+    Data that fails to load is skipped: the workers load it on first use as usual.
+
+    Returns
+    -------
+    Dict[str, float]: Loading time in seconds of every data loaded.
+    """
+    timings = {}
+    for name in names:
+        start = time.perf_counter()
+        try:
+            PRELOADERS[name]()
+        except Exception as e:
+            print(f"⚠️ {name} not preloaded - {type(e).__name__}: {e}")
+            continue
+        timings[name] = time.perf_counter() - start
+    gc.collect()
+    gc.freeze()
+    return timings
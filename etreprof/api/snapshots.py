@@ -0,0 +1,92 @@
+"""
+Versioned snapshots of the read-only API responses.
+
+The cluster catalog and the cluster recommendation pools only change when their sources
+change (clustering artifacts, materialized recommendation table).
+Their responses are serialized once per source version and served as pre-built JSON
+bytes with an ETag (hash of the bytes), so a repeated request is a dictionary lookup and
+a client holding the current version gets a 304 without a body.
+"""
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Hashable, Optional
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+
+SNAPSHOT_MAX_AGE = int(os.getenv("SNAPSHOT_MAX_AGE", "60"))
+
+
+class Snapshot:
+    """
+    A serialized response body with its ETag and the version of the sources it was built from.
+    """
+    __slots__ = ("body", "etag", "source_version", "built_at")
+
+    def __init__(self, body: bytes, source_version: Hashable):
+        self.body = body
+        self.etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        self.source_version = source_version
+        self.built_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+class SnapshotStore:
+    """
+    Snapshots by name, rebuilt when the version of their sources changes.
+    """
+
+    def __init__(self):
+        self._snapshots: Dict[str, Snapshot] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str, source_version: Hashable, build: Callable[[], Any]) -> Snapshot:
+        """
+        Return the snapshot of name for source_version, building and serializing it if needed.
+        """
+        snapshot = self._snapshots.get(name)
+        if snapshot is not None and snapshot.source_version == source_version:
+            return snapshot
+
+        # One build per version even when several requests miss at the same time
+        with self._lock:
+            snapshot = self._snapshots.get(name)
+            if snapshot is None or snapshot.source_version != source_version:
+                body = json.dumps(jsonable_encoder(build()), ensure_ascii=False, separators=(',', ':'))
+                snapshot = Snapshot(body.encode('utf-8'), source_version)
+                self._snapshots[name] = snapshot
+        return snapshot
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshots.clear()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: {"etag": snapshot.etag, "built_at": snapshot.built_at, "bytes": len(snapshot.body)}
+            for name, snapshot in self._snapshots.items()
+        }
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Whether an If-None-Match header matches the ETag (weak comparison, as for GET).
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    candidates = [candidate.strip() for candidate in if_none_match.split(',')]
+    return any(candidate.removeprefix('W/') == etag for candidate in candidates)
+
+
+def snapshot_response(request: Request, snapshot: Snapshot) -> Response:
+    """
+    Serve a snapshot: 304 when the client already has it, the pre-serialized bytes otherwise.
+    """
+    headers = {"ETag": snapshot.etag, "Cache-Control": f"public, max-age={SNAPSHOT_MAX_AGE}"}
+    if etag_matches(request.headers.get("if-none-match"), snapshot.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=snapshot.body, media_type="application/json", headers=headers)
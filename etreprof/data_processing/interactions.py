@@ -0,0 +1,111 @@
+import time
+import numpy as np
+import pandas as pd
+
+# Content id of the rows without a valid one: negative ids such as -1 are real ids
+MISSING_CONTENT_ID = np.iinfo(np.int64).min
+
+
+def content_ids_to_numeric(content_ids):
+    """
+    Convert content ids (numbers, or strings as read from the interactions CSV) to float
+    numbers, NaN for missing or non-numeric ids.
+    Strings are factorized first, so each distinct id is parsed only once.
+    """
+    content_ids = pd.Series(content_ids)
+    if pd.api.types.is_numeric_dtype(content_ids):
+        return content_ids.to_numpy(dtype=np.float64)
+    codes, uniques = pd.factorize(content_ids)
+    numeric_uniques = pd.to_numeric(pd.Series(uniques.astype(str)), errors='coerce').to_numpy(dtype=np.float64)
+    return np.where(codes >= 0, numeric_uniques[codes], np.nan)
+
+
+class PreparedInteractions:
+    """
+    Interactions parsed, coded and sorted by user once, shared read-only by every
+    stage of main_process_users.
+
+    - 'created_at' is parsed to datetime64 (NaT when missing)
+    - 'type' and 'content_type' are categoricals
+    - 'content_id' is an int64 (MISSING_CONTENT_ID for missing or non-numeric ids)
+    - rows are sorted by user (stable, so the original order is kept within a user),
+      the rows of the i-th user of user_ids are offsets[i]:offsets[i+1]
+    - rows without user_id are dropped
+
+    Parameters
+    ----------
+    df_interactions : pandas.DataFrame
+        Raw interactions with 'user_id' and 'created_at', and usually 'type', 'content_type'
+        and 'content_id'.
+
+    Attributes
+    ----------
+    frame : pandas.DataFrame
+        The prepared interactions, with a 'user_code' column (position of the user in user_ids).
+    user_ids : numpy.ndarray
+        Sorted unique user ids.
+    offsets : numpy.ndarray
+        Start row of every user, followed by the number of rows.
+    """
+
+    def __init__(self, df_interactions: pd.DataFrame):
+        start = time.perf_counter()
+        if df_interactions['user_id'].isna().any():
+            df_interactions = df_interactions.dropna(subset=['user_id'])
+
+        user_codes, user_ids = pd.factorize(df_interactions['user_id'], sort=True)
+        user_codes = user_codes.astype(np.int32)
+        order = np.argsort(user_codes, kind='stable')
+        counts = np.bincount(user_codes, minlength=len(user_ids))
+
+        self.user_ids = np.asarray(user_ids)
+        self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self.frame = pd.DataFrame({
+            'user_id': df_interactions['user_id'].to_numpy()[order],
+            'user_code': user_codes[order]
+        })
+        # Coded before sorting: reordering integer codes is much cheaper than reordering strings
+        for column in ['type', 'content_type']:
+            if column in df_interactions.columns:
+                codes, categories = pd.factorize(df_interactions[column], sort=True)
+                self.frame[column] = pd.Categorical.from_codes(codes[order], categories)
+        if 'content_id' in df_interactions.columns:
+            content_ids = content_ids_to_numeric(df_interactions['content_id'])[order]
+            valid_ids = ~np.isnan(content_ids) & (content_ids % 1 == 0)
+            self.frame['content_id'] = np.where(valid_ids, np.nan_to_num(content_ids), MISSING_CONTENT_ID).astype(np.int64)
+        self.frame['created_at'] = pd.to_datetime(df_interactions['created_at']).iloc[order].reset_index(drop=True)
+        self.preparation_seconds = time.perf_counter() - start
+
+    @property
+    def n_users(self) -> int:
+        return len(self.user_ids)
+
+    def count_by_user(self, mask=None) -> np.ndarray:
+        """
+        Number of rows of every user (of user_ids), restricted to the rows of mask if given.
+        Summed over the rows of each user between its offsets, in one pass over the mask.
+        """
+        if mask is None:
+            return np.diff(self.offsets)
+        if self.n_users == 0:
+            return np.zeros(0, dtype=np.int64)
+        # Every user has at least one row, so no slice of the offsets is empty
+        return np.add.reduceat(np.asarray(mask, dtype=bool), self.offsets[:-1], dtype=np.int64)
+
+    def type_mask(self, column: str, values) -> np.ndarray:
+        """
+        Rows whose categorical column ('type' or 'content_type') is one of values,
+        compared on the category codes.
+        """
+        categorical = self.frame[column].cat
+        codes = [categorical.categories.get_loc(value) for value in values if value in categorical.categories]
+        return np.isin(categorical.codes.to_numpy(), codes)
+
+
+def prepare_interactions(interactions) -> PreparedInteractions:
+    """
+    Return the interactions as PreparedInteractions, preparing a raw DataFrame if needed.
+    """
+    if isinstance(interactions, PreparedInteractions):
+        return interactions
+    return PreparedInteractions(interactions)
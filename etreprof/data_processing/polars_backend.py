@@ -0,0 +1,330 @@
+"""
+Polars backend of the user feature pipeline.
+
+main_users_cleaning, main_frequency_users and main_contents_usage written as Polars
+lazy queries over the CSV or Parquet inputs: only the columns used are read (projection
+pushdown), the filters are applied while scanning (predicate pushdown) and the queries
+run on every core. With POLARS_ENGINE=streaming the queries are executed in batches and
+can spill to disk.
+
+Selected with FEATURES_BACKEND=polars (see user_full_processing.process_users_files),
+the result is the frame of the pandas backend on the same inputs. The last step of the
+pandas pipeline (fillna(0) on the whole frame, which puts 0 in text and date columns)
+is applied on the pandas frame.
+"""
+import os
+import pandas as pd
+import polars as pl
+from datetime import datetime, timedelta
+from .user_transforms import (niveaux_rares, all_niveaux, variants_france, col_to_drop, niveaux_primaires,
+                              niveaux_secondaires, niveaux_formateurs, niveaux_etablissements, dept_to_academie,
+                              users_columns_rename, users_columns_order, niveau_column)
+from .user_frequency import REFERENCE_DATE
+from .user_contents import priority_challenges, consultation_types, engagement_types
+
+POLARS_ENGINE = os.getenv("POLARS_ENGINE", "auto")
+
+# Columns read as text from the CSV files, as pandas does (codes with leading zeros, JSON, dates)
+USERS_TEXT_COLUMNS = ['locale', 'pays', 'codepostal', 'statut_mailchimp', 'json_niveau',
+                      'json_discipline', 'json_etablissement', 'created_at']
+INTERACTIONS_TEXT_COLUMNS = ['type', 'content_type', 'content_id', 'created_at']
+
+
+def scan_table(path, text_columns=()):
+    """
+    Lazy scan of a Parquet or CSV file, text_columns being read as strings from a CSV.
+    """
+    if path.endswith('.parquet'):
+        return pl.scan_parquet(path)
+    return pl.scan_csv(path, schema_overrides={column: pl.String for column in text_columns},
+                       infer_schema_length=10000)
+
+
+def _to_datetime(lf, column):
+    """
+    Column parsed to datetime[ns] when read as text (null when it cannot be parsed).
+    """
+    if lf.collect_schema()[column] == pl.String:
+        return pl.col(column).str.to_datetime(time_unit='ns', strict=False)
+    return pl.col(column).cast(pl.Datetime('ns'))
+
+
+def _numeric_ids(column):
+    """
+    Integer content ids, null for missing, non-numeric or non-integer ids (see content_ids_to_numeric).
+    """
+    ids = pl.col(column).cast(pl.Float64, strict=False)
+    return pl.when(ids % 1 == 0).then(ids).cast(pl.Int64)
+
+
+def _pandas_id_dtype(path, column):
+    """
+    Dtype of an id column read by pandas: integer ids with missing values are read as
+    floats, except the nullable integers of a Parquet file written by pandas.
+    """
+    if path.endswith('.parquet'):
+        is_float = pd.read_parquet(path, columns=[column])[column].dtype.kind == 'f'
+    else:
+        ids = scan_table(path).select(column)
+        is_float = (ids.collect_schema()[column].is_float()
+                    or ids.select(pl.col(column).null_count()).collect(engine=POLARS_ENGINE).item() > 0)
+    return pl.Float64 if is_float else pl.Int64
+
+
+def _etablissement_field(key):
+    """
+    Field of the first establishment of json_etablissement (see extract_etablissement_info):
+    null without establishment, 'NR' when the field is missing or the JSON cannot be read.
+    """
+    etablissements = pl.col('json_etablissement')
+    first = etablissements.str.json_path_match('$[0]')
+    value = first.str.json_path_match(f'$.{key}')
+    return (pl.when(etablissements.is_null() | (etablissements == '[]')).then(None)
+            .when(value.is_not_null()).then(value)
+            .when(first.str.contains(f'"{key}":null', literal=True)).then(None)
+            .otherwise(pl.lit('NR')))
+
+
+def main_users_cleaning(users: pl.LazyFrame) -> pl.LazyFrame:
+    """
+    Cleans the user data (see user_transforms.main_users_cleaning).
+    """
+    pays = pl.col('pays').fill_null('france').str.to_lowercase().str.strip_chars()
+    users = (users
+             .filter(pl.col('locale').ne_missing('be'))
+             .filter(pays.is_in(variants_france))
+             .drop(col_to_drop, strict=False))
+
+    # Levels: the rare ones are only kept when there is nothing else
+    niveaux = pl.col('json_niveau').fill_null('[]').str.json_decode(pl.List(pl.String))
+    valides = niveaux.list.eval(pl.element().filter(~pl.element().is_in(niveaux_rares)))
+    niveaux = pl.when(valides.list.len() > 0).then(valides).otherwise(niveaux)
+    niveaux = niveaux.list.eval(pl.element().replace({"Enseignement spécialisé": "ASH", "Études supérieures": "POST BAC"}))
+    users = users.with_columns(niveaux.alias('niveaux'))
+
+    # One-hot encoding of the levels, on the column name of each level
+    niveau_columns = pl.col('niveaux').list.eval(
+        (pl.lit('niveau_') + pl.element())
+        .str.replace_all(' ', '_', literal=True).str.replace_all('-', '_', literal=True)
+        .str.replace_all('è', 'e', literal=True).str.replace_all('é', 'e', literal=True)
+        .str.to_lowercase()
+    )
+
+    def count(values):
+        return pl.col('niveaux').list.eval(pl.element().is_in(values)).list.sum()
+
+    degre = (pl.when(count(niveaux_formateurs) > 0).then(3)
+             .when(count(niveaux_primaires) > count(niveaux_secondaires)).then(1)
+             .when(count(niveaux_secondaires) > count(niveaux_primaires)).then(2)
+             .when((count(niveaux_primaires) == count(niveaux_secondaires)) & (count(niveaux_primaires) > 0)).then(1)
+             .otherwise(0))
+
+    users = users.with_columns(
+        [niveau_columns.list.contains(niveau_column(niveau)).cast(pl.Int64).alias(niveau_column(niveau))
+         for niveau in sorted(all_niveaux)]
+        + [degre.cast(pl.Int64).alias('degre')]
+        + [pl.col('niveaux').list.eval(pl.element().is_in(niveaux_etab)).list.any().cast(pl.Int64).alias(etab)
+           for etab, niveaux_etab in niveaux_etablissements.items()]
+        + [_etablissement_field('code_postal').alias('code_postal_etab'),
+           _etablissement_field('academie').alias('academie_etab'),
+           _etablissement_field('type_etablissement').alias('type_etablissement_etab')]
+    )
+
+    # Postal code (the establishment one first), departement and academie
+    users = users.with_columns(pl.coalesce('code_postal_etab', pl.col('codepostal').cast(pl.String)).alias('codepostal'))
+    code_postal = pl.col('codepostal').str.strip_chars().str.zfill(5)
+    departement = (pl.when(code_postal.str.contains(r'^\d+$'))
+                   .then(pl.when(code_postal.str.starts_with('97') | code_postal.str.starts_with('98'))
+                         .then(code_postal.str.slice(0, 3))
+                         .otherwise(code_postal.str.slice(0, 2))))
+    users = users.with_columns(departement.alias('departement'))
+    academie = pl.coalesce('academie_etab',
+                           pl.col('departement').replace_strict(dept_to_academie, default=None, return_dtype=pl.String))
+
+    # Discipline (secondary only) and seniority at the end of 2025
+    discipline = (pl.when((pl.col('maternelle') == 1) | (pl.col('elementaire') == 1)).then(None)
+                  .otherwise(pl.col('json_discipline').str.json_path_match('$[0]')))
+    created_at = _to_datetime(users, 'created_at')
+    ecart_annees = 2025 - created_at.dt.year()
+    anciennete = (pl.when(ecart_annees.is_null()).then(pl.col('anciennete'))
+                  .when(pl.col('anciennete').is_null()).then(ecart_annees)
+                  .otherwise(pl.col('anciennete') + ecart_annees))
+
+    users = users.with_columns(
+        academie.alias('academie_etab'),
+        discipline.alias('discipline'),
+        anciennete.alias('anciennete'),
+        created_at.dt.date().alias('created_at')
+    )
+
+    return users.rename(users_columns_rename, strict=False).select(users_columns_order)
+
+
+def create_temporal_engagement(interactions: pl.LazyFrame, now: datetime = REFERENCE_DATE) -> pl.LazyFrame:
+    """
+    Actions per user over the last 12 weeks, 12 months and 3 years, first and last
+    action dates (see user_frequency.create_temporal_engagement_df_optimized).
+    """
+    age = (pl.lit(now).cast(pl.Datetime('ns')) - pl.col('created_at')).dt.total_nanoseconds()
+    periods = [('week', timedelta(weeks=1), 12), ('month', timedelta(days=30), 12), ('year', timedelta(days=365), 3)]
+
+    # Period i covers [now - (i+1) * period, now - i * period), actions after now have a negative index
+    dated = (interactions
+             .select('user_id', _to_datetime(interactions, 'created_at').alias('created_at'))
+             .filter(pl.col('user_id').is_not_null() & pl.col('created_at').is_not_null())
+             .with_columns([((age - 1) // (int(period / timedelta(microseconds=1)) * 1000)).alias(name)
+                            for name, period, _ in periods]))
+
+    return (dated
+            .group_by('user_id')
+            .agg([pl.col('created_at').min().alias('join_date'),
+                  pl.col('created_at').max().alias('last_action_date'),
+                  pl.len().cast(pl.Int64).alias('total_interactions')]
+                 + [(pl.col(name) == i).sum().cast(pl.Int64).alias(f'{name}_minus_{i}')
+                    for name, _, n_periods in periods for i in range(n_periods)])
+            .sort('user_id')
+            .rename({'user_id': 'id'}))
+
+
+def main_frequency_users(interactions: pl.LazyFrame, users: pl.LazyFrame, reference_date=None) -> pl.LazyFrame:
+    """
+    Users with their temporal engagement (see user_frequency.main_frequency_users).
+    """
+    engagement = create_temporal_engagement(interactions, reference_date if reference_date is not None else REFERENCE_DATE)
+    return users.join(engagement, on='id', how='left', maintain_order='left')
+
+
+def create_user_topic_enrichment(interactions: pl.LazyFrame, users: pl.LazyFrame, content_valid: pl.LazyFrame,
+                                 reference_date=None) -> pl.LazyFrame:
+    """
+    Number of distinct contents consulted per topic during the 3 years before the reference
+    date, and number of topics consulted (see user_contents.create_user_topic_enrichment).
+    Left null for users without topics, like the merge before its fillna(0).
+    """
+    reference_date = pd.Timestamp(reference_date if reference_date is not None else datetime.now())
+    cutoff_date = reference_date - timedelta(days=365*3)
+
+    # First row of each content id, as the merge did
+    topics = (content_valid
+              .select(pl.col('id').cast(pl.Float64, strict=False).alias('content_id'), pl.col('reduced topics').alias('topic'))
+              .filter(pl.col('content_id').is_not_null())
+              .unique(subset='content_id', keep='first', maintain_order=True)
+              .filter(pl.col('topic').is_not_null() & (pl.col('content_id') >= 0) & (pl.col('content_id') % 1 == 0))
+              .with_columns(pl.col('content_id').cast(pl.Int64)))
+
+    # Pivoting needs the topics consulted, so the (user, topic) counts are collected
+    counts = (interactions
+              .filter((pl.col('created_at') >= cutoff_date) & (pl.col('content_id') >= 0))
+              .select('user_id', 'content_id')
+              .unique()
+              .join(topics, on='content_id', how='inner')
+              .group_by('user_id', 'topic')
+              .agg(pl.len().cast(pl.Float64).alias('count'))
+              .collect(engine=POLARS_ENGINE))
+
+    observed = sorted(counts['topic'].unique().to_list())
+    topic_columns = {f'{topic}': f'topic_{topic}' for topic in observed}
+    if observed:
+        topic_matrix = (counts.with_columns(pl.col('topic').cast(pl.String))
+                        .pivot(on='topic', index='user_id', values='count')
+                        .rename(topic_columns)
+                        .select(['user_id'] + [pl.col(column).fill_null(0.0) for column in topic_columns.values()]))
+    else:
+        topic_matrix = pl.DataFrame({'user_id': counts['user_id'].unique()})
+    topic_matrix = topic_matrix.join(
+        counts.group_by('user_id').agg(pl.len().cast(pl.Int64).alias('topic_count')), on='user_id', how='left')
+
+    return users.join(topic_matrix.lazy().rename({'user_id': 'id'}), on='id', how='left', maintain_order='left')
+
+
+def main_contents_usage(contents: pl.LazyFrame, interactions: pl.LazyFrame, users: pl.LazyFrame,
+                        content_valid: pl.LazyFrame, reference_date=None) -> pl.LazyFrame:
+    """
+    Users with their contents usage and topics (see user_contents.main_contents_usage).
+    The feature columns are left null where the pandas backend has NaN before its final fillna(0).
+    """
+    interactions = (interactions
+                    .select('user_id', 'type', 'content_type', _numeric_ids('content_id').alias('content_id'),
+                            _to_datetime(interactions, 'created_at').alias('created_at'))
+                    .filter(pl.col('user_id').is_not_null()))
+
+    consulted = pl.any_horizontal([(pl.col('type') == interaction_type) & pl.col('content_type').is_in(content_types)
+                                   for interaction_type, content_types in consultation_types.items()])
+    consultations = interactions.filter(consulted)
+
+    # Flags of each content by id (first row of an id)
+    flags = (contents
+             .select(_numeric_ids('id').alias('content_id'),
+                     *[(pl.col(challenge) == 1).fill_null(False).alias(challenge) for challenge in priority_challenges])
+             .filter(pl.col('content_id') >= 0)
+             .unique(subset='content_id', keep='first', maintain_order=True))
+
+    # One column per content type consulted, sorted like the pandas categories
+    content_types = sorted(consultations.select(pl.col('content_type').unique()).collect(engine=POLARS_ENGINE)
+                           .to_series().drop_nulls().to_list())
+    user_features = (consultations
+                     .join(flags, on='content_id', how='left')
+                     .group_by('user_id')
+                     .agg([(pl.col('content_type') == content_type).sum().cast(pl.Int64)
+                           .alias(f'nb_{content_type.replace("-", "_")}') for content_type in content_types]
+                          + [pl.col(challenge).fill_null(False).sum().cast(pl.Int64).alias(f'nb_{challenge}')
+                             for challenge in priority_challenges]
+                          + [pl.len().cast(pl.Int64).alias('total_interactions'),
+                             pl.col('content_id').drop_nulls().n_unique().cast(pl.Int64)
+                             .alias('diversite_contenus')]))
+
+    # Engagement of every user, with the content features of those who consulted contents
+    engagement = (interactions
+                  .group_by('user_id')
+                  .agg([(pl.col('type') == interaction_type).sum().cast(pl.Int64).alias(column)
+                        for column, interaction_type in engagement_types.items()]))
+    users_featured = (user_features
+                      .join(engagement, on='user_id', how='full', coalesce=True)
+                      .sort('user_id')
+                      .rename({'user_id': 'id'}))
+
+    # Right merge on the users, with the _x/_y suffixes of pandas on common columns
+    featured_columns = users_featured.collect_schema().names()
+    users_columns = users.collect_schema().names()
+    common = [column for column in featured_columns if column in users_columns and column != 'id']
+    users_featured = users_featured.rename({column: f'{column}_x' for column in common})
+    users = users.rename({column: f'{column}_y' for column in common})
+    complete = users.join(users_featured, on='id', how='left', maintain_order='left').select(
+        users_featured.collect_schema().names() + [column for column in users.collect_schema().names() if column != 'id'])
+
+    return create_user_topic_enrichment(interactions, complete, content_valid, reference_date)
+
+
+def to_pandas(df_final: pl.DataFrame) -> pd.DataFrame:
+    """
+    The pandas frame of the pipeline: dates of account creation as datetime.date objects,
+    missing values set to 0.
+    """
+    df = df_final.to_pandas()
+    df['created_at'] = pd.to_datetime(df['created_at']).dt.date
+    return df.fillna(0)
+
+
+def process_users_files(users_path, contents_path, content_valid_path, interactions_path, reference_date=None):
+    """
+    Run the user feature pipeline on the files with Polars.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The frame of main_process_users.
+    """
+    users = scan_table(users_path, USERS_TEXT_COLUMNS)
+    interactions = scan_table(interactions_path, INTERACTIONS_TEXT_COLUMNS)
+
+    # The joins need one id dtype: float as soon as one side is read as float by pandas
+    # (interactions without user), as the id of the pandas frame
+    id_dtypes = [_pandas_id_dtype(users_path, 'id'), _pandas_id_dtype(interactions_path, 'user_id')]
+    id_dtype = pl.Float64 if pl.Float64 in id_dtypes else pl.Int64
+    users = main_users_cleaning(users.with_columns(pl.col('id').cast(id_dtype)))
+    interactions = interactions.with_columns(pl.col('user_id').cast(id_dtype))
+
+    users = main_frequency_users(interactions, users, reference_date)
+    df_final = main_contents_usage(scan_table(contents_path), interactions, users,
+                                   scan_table(content_valid_path), reference_date)
+    return to_pandas(df_final.collect(engine=POLARS_ENGINE))
@@ -0,0 +1,214 @@
+"""
+Opt-in sampling profiler for API requests and pipeline stages.
+
+A background thread reads the Python stacks of the profiled threads every
+PROFILE_INTERVAL_MS (sys._current_frames), so the profiled code is not instrumented and
+the cost is one stack walk per thread and per interval, whatever the code does. Samples
+of idle threads (waiting on a lock, a queue or a selector) are dropped. A profile stops
+taking samples after PROFILE_MAX_SAMPLES.
+
+The profile is written to PROFILE_DIR as a speedscope file (https://www.speedscope.app,
+flame graph and time-ordered views), one profile per thread.
+
+Profiling is off by default:
+- PROFILE_STAGES=1 profiles every stage of main_process_users
+- PROFILE_TOKEN=<secret> lets a request carrying the header 'X-Profile: <secret>' or the
+  query parameter 'profile=<secret>' be profiled (see etreprof/api/main.py)
+A request is profiled with context_threads: only the threads that run its endpoint, and
+enter profiling_thread() while doing so, are sampled, not the requests served alongside.
+When disabled, profiled() returns a no-op context and the API installs no middleware.
+"""
+import os
+import re
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+ROOT_PATH = os.path.dirname(os.path.abspath(__file__))
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(ROOT_PATH)), 'data')
+PROFILE_PATH = os.getenv("PROFILE_DIR", os.path.join(DATA_PATH, 'profiles'))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_SAMPLES = int(os.getenv("PROFILE_MAX_SAMPLES", "100000"))
+PROFILE_STAGES = os.getenv("PROFILE_STAGES", "").lower() in ("1", "true", "yes")
+
+# Leaf functions of a thread that waits (module file name, function name)
+IDLE_FRAMES = {
+    ('threading.py', 'wait'), ('threading.py', '_wait_for_tstate_lock'), ('queue.py', 'get'),
+    ('selectors.py', 'select'), ('selectors.py', 'poll')
+}
+
+# Profiler of the block being profiled with context_threads, seen by the threads it hands work to
+_CONTEXT_PROFILER: ContextVar[Optional["SamplingProfiler"]] = ContextVar("context_profiler", default=None)
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of some threads (or of all threads) until stopped.
+    """
+
+    def __init__(self, thread_ids: Optional[List[int]] = None, interval_ms: float = PROFILE_INTERVAL_MS,
+                 max_samples: int = PROFILE_MAX_SAMPLES):
+        self.thread_ids = set(thread_ids) if thread_ids is not None else None
+        self.interval = interval_ms / 1000
+        self.max_samples = max_samples
+        self.frames = []
+        self._frame_indexes = {}
+        # thread id -> (stacks as frame indexes from the root, weights in ms)
+        self.samples: Dict[int, tuple] = {}
+        self.n_samples = 0
+        self.seconds = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add_thread(self, thread_id: int):
+        self.thread_ids.add(thread_id)
+
+    def remove_thread(self, thread_id: int):
+        self.thread_ids.discard(thread_id)
+
+    def _frame_index(self, code) -> int:
+        index = self._frame_indexes.get(code)
+        if index is None:
+            index = len(self.frames)
+            self._frame_indexes[code] = index
+            self.frames.append({"name": code.co_name, "file": code.co_filename, "line": code.co_firstlineno})
+        return index
+
+    def _sample(self, weight_ms: float):
+        own_id = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                continue
+            if (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_FRAMES:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_index(frame.f_code))
+                frame = frame.f_back
+            stacks, weights = self.samples.setdefault(thread_id, ([], []))
+            stacks.append(stack[::-1])
+            weights.append(weight_ms)
+            self.n_samples += 1
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval) and self.n_samples < self.max_samples:
+            now = time.perf_counter()
+            self._sample((now - last) * 1000)
+            last = now
+
+    def start(self):
+        self._start = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="sampling-profiler")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.seconds = time.perf_counter() - self._start
+
+    def speedscope(self, name: str) -> Dict:
+        """
+        The samples in the speedscope file format, one sampled profile per thread.
+        """
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        profiles = []
+        for thread_id, (stacks, weights) in self.samples.items():
+            profiles.append({
+                "type": "sampled",
+                "name": f"{name} - {thread_names.get(thread_id, thread_id)}",
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": stacks,
+                "weights": weights
+            })
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "etreprof",
+            "shared": {"frames": self.frames},
+            "profiles": profiles
+        }
+
+
+def write_profile(profiler: SamplingProfiler, name: str, output_dir: str = PROFILE_PATH) -> str:
+    """
+    Write the samples of a stopped profiler to output_dir. Returns the path of the file.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', name).strip('_') or 'profile'
+    timestamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%f')
+    path = os.path.join(output_dir, f'{timestamp}-{slug}-{os.getpid()}.speedscope.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(profiler.speedscope(name), f)
+    return path
+
+
+@contextmanager
+def _profiling(name: str, all_threads: bool, context_threads: bool, output_dir: str, interval_ms: float):
+    if all_threads:
+        thread_ids = None
+    else:
+        thread_ids = [] if context_threads else [threading.get_ident()]
+    profiler = SamplingProfiler(thread_ids, interval_ms)
+    token = _CONTEXT_PROFILER.set(profiler if context_threads else None)
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        _CONTEXT_PROFILER.reset(token)
+        profiler.path = write_profile(profiler, name, output_dir)
+        print(f"🔬 {name}: {profiler.n_samples} samples in {profiler.seconds:.2f} s -> {profiler.path}")
+
+
+def profiled(name: str, enabled: bool = True, all_threads: bool = False, context_threads: bool = False,
+             output_dir: str = PROFILE_PATH, interval_ms: float = PROFILE_INTERVAL_MS):
+    """
+    Context profiling its block (the current thread, every thread, or the threads entering
+    profiling_thread() from the block's context) and writing the profile to output_dir when
+    it exits. Returns a no-op context when not enabled.
+
+    Parameters
+    ----------
+    name : str
+        Name of the profile, used in the file name.
+    enabled : bool
+        Whether to profile (e.g. PROFILE_STAGES).
+    all_threads : bool
+        Sample every thread instead of the current one.
+    context_threads : bool
+        Sample, instead of the current thread, the threads that enter profiling_thread() from
+        the context of the block, while they are in it (work handed to a thread pool).
+    output_dir : str
+        Directory where the profile is written.
+    interval_ms : float
+        Time between two samples.
+    """
+    if not enabled:
+        return nullcontext()
+    return _profiling(name, all_threads, context_threads, output_dir, interval_ms)
+
+
+@contextmanager
+def profiling_thread():
+    """
+    Context sampling the current thread, while in it, by the profiler of the enclosing
+    profiled(..., context_threads=True) block. Does nothing outside such a block.
+    """
+    profiler = _CONTEXT_PROFILER.get()
+    if profiler is None:
+        yield
+        return
+    thread_id = threading.get_ident()
+    profiler.add_thread(thread_id)
+    try:
+        yield
+    finally:
+        profiler.remove_thread(thread_id)
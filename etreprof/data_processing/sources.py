@@ -0,0 +1,152 @@
+"""
+Download of the source tables of the recompute (users, contents, interactions, content topics).
+
+The four sources are fetched concurrently with one pooled HTTP client. Each one is kept
+in a local cache with the ETag and Last-Modified headers of its response; the next fetch
+is a conditional request (If-None-Match / If-Modified-Since) and a source the server
+reports unchanged (304) is read from the cache without being downloaded again. Bodies
+are streamed to disk by chunks, never held in memory, under a temporary name swapped in
+when complete, then the headers are written (last).
+
+A source that is a local path instead of an http(s) URL is read in place.
+
+Files written in SOURCES_CACHE_DIR, for each source:
+- {name}.csv  : the last downloaded body
+- {name}.json : url, etag, last_modified, bytes and fetched_at of that body
+"""
+import os
+import json
+import time
+import asyncio
+import httpx
+import pandas as pd
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
+
+ROOT_PATH = os.path.dirname(os.path.abspath(__file__))
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(ROOT_PATH)), 'data')
+SOURCES_CACHE_PATH = os.getenv("SOURCES_CACHE_DIR", os.path.join(DATA_PATH, 'sources_cache'))
+
+# Source name -> environment variable of its URL
+SOURCES = {
+    "users": "USER_URL_DB",
+    "contents": "CONTENTS_URL_DB",
+    "interactions": "INTERACTIONS_URL_DB",
+    "content_with_topics": "CONTENT_WITH_TOPICS_URL_DB"
+}
+FETCH_TIMEOUT_SECONDS = float(os.getenv("SOURCES_FETCH_TIMEOUT_SECONDS", "300"))
+CHUNK_BYTES = 1 << 20
+
+
+def _read_cache_meta(name: str, cache_dir: str) -> Optional[Dict[str, Any]]:
+    meta_path = os.path.join(cache_dir, f'{name}.json')
+    if not os.path.exists(meta_path) or not os.path.exists(os.path.join(cache_dir, f'{name}.csv')):
+        return None
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+async def fetch_source(client: httpx.AsyncClient, name: str, url: str, cache_dir: str = SOURCES_CACHE_PATH) -> Dict[str, Any]:
+    """
+    Fetch one source into the cache, conditionally when a cached copy of the same URL exists.
+
+    Returns
+    -------
+    Dict[str, Any]
+        'path' of the file to read, 'status' ('downloaded', 'not_modified' or 'local'),
+        'bytes' downloaded and 'seconds'.
+    """
+    start = time.perf_counter()
+    if not url.startswith(('http://', 'https://')):
+        return {"path": url, "status": "local", "bytes": 0, "seconds": 0.0}
+
+    cached = _read_cache_meta(name, cache_dir)
+    headers = {}
+    if cached is not None and cached["url"] == url:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    path = os.path.join(cache_dir, f'{name}.csv')
+    async with client.stream("GET", url, headers=headers) as response:
+        if response.status_code == 304 and headers:
+            return {"path": path, "status": "not_modified", "bytes": 0, "seconds": time.perf_counter() - start}
+        response.raise_for_status()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = os.path.join(cache_dir, f'.{name}.csv.tmp')
+        n_bytes = 0
+        with open(tmp_path, 'wb') as f:
+            async for chunk in response.aiter_bytes(CHUNK_BYTES):
+                f.write(chunk)
+                n_bytes += len(chunk)
+        os.replace(tmp_path, path)
+
+        meta = {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "bytes": n_bytes,
+            "fetched_at": datetime.now(timezone.utc).isoformat(timespec='seconds')
+        }
+    tmp_path = os.path.join(cache_dir, f'.{name}.json.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(cache_dir, f'{name}.json'))
+    return {"path": path, "status": "downloaded", "bytes": n_bytes, "seconds": time.perf_counter() - start}
+
+
+async def fetch_sources_async(urls: Dict[str, str], cache_dir: str = SOURCES_CACHE_PATH,
+                              timeout: float = FETCH_TIMEOUT_SECONDS) -> Dict[str, Dict[str, Any]]:
+    """
+    Fetch every source concurrently with one pooled client (see fetch_source).
+    """
+    limits = httpx.Limits(max_connections=len(urls), max_keepalive_connections=len(urls))
+    async with httpx.AsyncClient(timeout=timeout, limits=limits, follow_redirects=True) as client:
+        results = await asyncio.gather(*[fetch_source(client, name, url, cache_dir) for name, url in urls.items()])
+    return dict(zip(urls, results))
+
+
+def fetch_sources(urls: Optional[Dict[str, str]] = None, cache_dir: str = SOURCES_CACHE_PATH,
+                  timeout: float = FETCH_TIMEOUT_SECONDS) -> Dict[str, Dict[str, Any]]:
+    """
+    Fetch the sources from a synchronous caller (an endpoint run in the thread pool, a script).
+
+    Parameters
+    ----------
+    urls : Dict[str, str], optional
+        URL or path of each source (default is the environment variables of SOURCES).
+    cache_dir : str
+        Directory of the cached copies.
+    timeout : float
+        Timeout in seconds of each request.
+    """
+    if urls is None:
+        missing = [variable for variable in SOURCES.values() if not os.getenv(variable)]
+        if missing:
+            raise ValueError(f"Missing environment variables {missing}")
+        urls = {name: os.getenv(variable) for name, variable in SOURCES.items()}
+    return asyncio.run(fetch_sources_async(urls, cache_dir, timeout))
+
+
+def read_sources(urls: Optional[Dict[str, str]] = None, cache_dir: str = SOURCES_CACHE_PATH):
+    """
+    Fetch the sources and read them.
+
+    Returns
+    -------
+    Tuple
+        The dataframe of every source, and the fetch result of every source (see fetch_source).
+    """
+    fetched = fetch_sources(urls, cache_dir)
+    dataframes = {name: pd.read_csv(result["path"], low_memory=False) for name, result in fetched.items()}
+    return dataframes, fetched
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    for name, result in fetch_sources().items():
+        print(f"✅ {name}: {result['status']} ({result['bytes'] / 1e6:.1f} Mo en {result['seconds']:.1f} s)")
@@ -1,45 +1,104 @@
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
-from tqdm import tqdm
+from .interactions import PreparedInteractions, prepare_interactions, content_ids_to_numeric, MISSING_CONTENT_ID
 
-def create_user_topic_enrichment(df_interactions, df_users, df_content_valid):
+priority_challenges = ['transition_ecologique', 'sante_mentale', 'ecole_inclusive', 'cps', 'reussite_tous_eleves']
+
+# Content consultations: page views of contents, downloads of guides and tools
+consultation_types = {'page_view': ['contenu'], 'download': ['guide-pratique', 'fiche-outils']}
+
+# Engagement columns and the interaction type they count
+engagement_types = {'nb_vote': 'contenu_vote', 'nb_comments': 'comment_posted',
+                    'nb_opened_mail': 'opened_mail', 'nb_clicked_mail': 'click_mail'}
+
+def consultation_mask(interactions):
     """
-    Enrich users database with topics
-    3 args :
-        - df_interactions
-        - df_users
-        - df_content_valid : the dataframe with the topics
+    Interactions that are content consultations (see consultation_types), as a boolean
+    array aligned with interactions.frame.
     """
-    # Update column types
-    df_interactions['created_at'] = pd.to_datetime(df_interactions['created_at'])
-    df_interactions['content_id'] = df_interactions['content_id'].astype(str)
-    df_content_valid['id'] = df_content_valid['id'].astype(str)
+    consulted = np.zeros(len(interactions.frame), dtype=bool)
+    for interaction_type, content_types in consultation_types.items():
+        consulted |= interactions.type_mask('content_type', content_types) & interactions.type_mask('type', [interaction_type])
+    return consulted
 
-    # We only take the actions of the 3 last years
-    cutoff_date = datetime.now() - timedelta(days=365*3)
-    df_interactions = df_interactions[df_interactions['created_at'] >= cutoff_date]
-
-    # Join interaction_events + df_content_valid
-    df_interactions_filtered = df_interactions.merge(df_content_valid[['id', 'reduced topics']],
-            left_on='content_id', right_on='id', how='inner')
+def content_topic_lookup(df_content_valid):
+    """
+    Topic of each content id, from the first row of the id (as the merge did).
 
-    # Drop duplicates of (user_id, content_id) tuple
-    df_interactions_unique = df_interactions_filtered.drop_duplicates(subset=['user_id', 'content_id'])
+    Returns
+    -------
+    topic_values : numpy.ndarray
+        Sorted topics.
+    topic_of_content : numpy.ndarray
+        Position in topic_values of the topic of each content id, -1 without topic.
+    """
+    df_topics = df_content_valid[['id', 'reduced topics']].copy()
+    df_topics['id'] = content_ids_to_numeric(df_topics['id'])
+    df_topics = df_topics.dropna(subset=['id']).drop_duplicates(subset='id').dropna(subset=['reduced topics'])
+    df_topics = df_topics[(df_topics['id'] >= 0) & (df_topics['id'] % 1 == 0)]
+    topic_values, topic_codes = np.unique(df_topics['reduced topics'].to_numpy(), return_inverse=True)
+    valid_ids = df_topics['id'].to_numpy(dtype=np.int64)
+    id_span = int(valid_ids.max()) + 1 if len(valid_ids) else 1
+    topic_of_content = np.full(id_span, -1, dtype=np.int32)
+    topic_of_content[valid_ids] = topic_codes
+    return topic_values, topic_of_content
+
+def create_user_topic_enrichment(df_interactions, df_users, df_content_valid, reference_date=None):
+    """
+    Enrich users database with topics: number of distinct contents consulted per topic
+    during the 3 years before the reference date, and number of topics consulted.
+    4 args :
+        - df_interactions (or PreparedInteractions)
+        - df_users
+        - df_content_valid : the dataframe with the topics
+        - reference_date : end of the 3-year window (default is now)
 
-    # Count by topic
-    df_user_topic_counts = df_interactions_unique.groupby(['user_id', 'reduced topics']).size().reset_index(name='count')
+    Ids are integer-coded instead of merged as strings: contents are mapped to their topic
+    with a lookup array indexed by content id, distinct (user, content) pairs are found on
+    a combined integer key and counted per (user, topic) with bincount.
+    The input dataframes are not modified.
+    """
+    if isinstance(df_interactions, PreparedInteractions):
+        df_interactions = df_interactions.frame
+    reference_date = pd.Timestamp(reference_date if reference_date is not None else datetime.now())
 
-    # need to pivot the results
-    df_topic_matrix = df_user_topic_counts.pivot(
-        index='user_id',
-        columns='reduced topics',
-        values='count'
-    ).fillna(0)
+    # We only take the actions of the 3 last years
+    cutoff_date = reference_date - timedelta(days=365*3)
+    recent = (pd.to_datetime(df_interactions['created_at']) >= cutoff_date).to_numpy()
+
+    # Content -> topic code lookup
+    topic_values, topic_of_content = content_topic_lookup(df_content_valid)
+    id_span = len(topic_of_content)
+
+    # Interactions of the window on a content with a topic
+    content_ids = content_ids_to_numeric(df_interactions['content_id'].to_numpy()[recent])
+    user_codes, user_uniques = pd.factorize(df_interactions['user_id'].to_numpy()[recent])
+    matched = (user_codes >= 0) & (content_ids >= 0) & (content_ids < id_span)
+    matched &= (content_ids % 1 == 0)
+    content_index = np.where(matched, content_ids, 0).astype(np.int64)
+    matched &= topic_of_content[content_index] >= 0
+
+    # Distinct (user, content) pairs, users renumbered among the matched ones
+    pair_users, users_matched = pd.factorize(user_codes[matched])
+    pairs = pd.unique(pair_users.astype(np.int64) * id_span + content_index[matched])
+    pair_topics = topic_of_content[pairs % id_span]
+
+    # Count by (user, topic)
+    n_users, n_topics = len(users_matched), len(topic_values)
+    counts = np.bincount((pairs // id_span) * n_topics + pair_topics, minlength=n_users * n_topics)
+    counts = counts.reshape(n_users, n_topics)
+
+    # Topics consulted by at least one user, sorted as the pivot did
+    observed = counts.sum(axis=0) > 0
+    df_topic_matrix = pd.DataFrame(
+        counts[:, observed].astype(np.float64),
+        index=pd.Index(user_uniques[users_matched], name='user_id'),
+        columns=[f'topic_{topic}' for topic in topic_values[observed]]
+    )
 
-    # Add count of different topics and rename
-    df_topic_matrix['topic_count'] = (df_topic_matrix > 0).sum(axis=1)
-    df_topic_matrix.columns = [f'topic_{col}' if col != 'topic_count'
-                           else col for col in df_topic_matrix.columns]
+    # Add count of different topics
+    df_topic_matrix['topic_count'] = (counts > 0).sum(axis=1)
 
     # Merge with users
     df_users_enriched = df_users.merge(
@@ -48,7 +107,7 @@ def create_user_topic_enrichment(df_interactions, df_users, df_content_valid):
 
     return df_users_enriched
 
-def main_contents_usage(df_contents, df_interactions, df_users, df_content_valid):
+def main_contents_usage(df_contents, df_interactions, df_users, df_content_valid, reference_date=None):
     """
     Main function to process user contents usage data from interactions and user CSV files.
 
@@ -56,125 +115,76 @@ def main_contents_usage(df_contents, df_interactions, df_users, df_content_valid
     ----------
     df_contents : pandas.DataFrame
         DataFrame containing content data.
-    df_interactions : pandas.DataFrame
-        DataFrame containing user interactions.
+    df_interactions : pandas.DataFrame or PreparedInteractions
+        DataFrame containing user interactions, or the interactions already prepared
+        by main_process_users (not modified).
     df_users : pandas.DataFrame
         DataFrame containing user data.
     df_content_valid : pandas.DataFrame
         DataFrame containing valid content data with topics.
+    reference_date : datetime, optional
+        End of the 3-year window of the topic enrichment (default is now).
 
     Returns
     -------
     pandas.DataFrame
         DataFrame with enriched user data including content usage statistics.
     """
+    interactions = prepare_interactions(df_interactions)
+    frame = interactions.frame
+    user_codes = frame['user_code'].to_numpy()
+    content_ids = frame['content_id'].to_numpy()
 
-    df_contents_lite = df_contents[['id', 'type', 'transition_ecologique', 'sante_mentale', 'ecole_inclusive', 'cps',
-       'reussite_tous_eleves']]
-
-    df_contents_lite['master_theme'] = None
-
-    df_interactions_filtered = df_interactions[df_interactions.content_type.isin(['contenu', 'guide-pratique', 'fiche-outils'])]
+    # Content consultations
+    consulted = consultation_mask(interactions)
 
-    df_interactions_filtered = df_interactions_filtered[
-        ((df_interactions_filtered.content_type == 'contenu') & (df_interactions_filtered.type == "page_view")) |
-        ((df_interactions_filtered.content_type == 'guide-pratique') & (df_interactions_filtered.type == "download")) |
-        ((df_interactions_filtered.content_type == 'fiche-outils') & (df_interactions_filtered.type == "download"))
-    ]
+    # Users with at least one consultation, sorted like the groupbys
+    consultations_by_user = interactions.count_by_user(consulted)
+    consulting_users = np.flatnonzero(consultations_by_user)
+    df_user_features = pd.DataFrame({'user_id': interactions.user_ids[consulting_users]})
 
     # CONTENT TYPE FEATURES
     # Count interactions by user and content type
-    content_type_features = df_interactions_filtered.groupby(['user_id', 'content_type']).size().unstack(fill_value=0)
-    content_type_features.columns = [f'nb_{col.replace("-", "_")}' for col in content_type_features.columns]
+    content_type_categories = frame['content_type'].cat.categories
+    content_type_codes = frame['content_type'].cat.codes.to_numpy()
+    for code in np.unique(content_type_codes[consulted]):
+        content_type = content_type_categories[code]
+        counts = interactions.count_by_user(consulted & (content_type_codes == code))
+        df_user_features[f'nb_{content_type.replace("-", "_")}'] = counts[consulting_users]
 
     # PRIORITY CHALLENGE FEATURES
-    # Merge with df_contents_lite to get priority challenges and themes
-    # Fix type mismatch: convert content_id to int to match df_contents_lite id column
-    df_interactions_filtered['content_id'] = pd.to_numeric(df_interactions_filtered['content_id'], errors='coerce')
-
-    df_interactions_with_content = df_interactions_filtered.merge(
-        df_contents_lite[['id', 'transition_ecologique', 'sante_mentale', 'ecole_inclusive', 'cps', 'reussite_tous_eleves', 'master_theme']],
-        left_on='content_id',
-        right_on='id',
-        how='left'
-    )
-
-    # Function to count interactions by priority challenge
-    def count_priority_challenge_interactions(df_merged):
-        priority_features = pd.DataFrame(index=df_merged['user_id'].unique())
-        priority_features.index.name = 'user_id'  # Ensure index has a name
-
-        challenges = ['transition_ecologique', 'sante_mentale', 'ecole_inclusive', 'cps', 'reussite_tous_eleves']
-
-        for challenge in tqdm(challenges, desc="Processing priority challenges"):
-            # Filter content that matches this challenge (value = 1)
-            challenge_interactions = df_merged[df_merged[challenge] == 1]
-
-            # Count by user_id
-            challenge_counts = challenge_interactions.groupby('user_id').size()
-
-            # Add to DataFrame (fill_value=0 for users without interactions on this challenge)
-            priority_features[f'nb_{challenge}'] = challenge_counts.reindex(priority_features.index, fill_value=0)
-
-        return priority_features.fillna(0).astype(int)
-
-    priority_features = count_priority_challenge_interactions(df_interactions_with_content)
-
-    # COMBINE INTO FINAL MATRIX
-    # Start with unique user_ids
-    df_user_features = pd.DataFrame({'user_id': df_interactions_filtered['user_id'].unique()})
-
-    # Merge with content type features
-    df_user_features = df_user_features.merge(
-        content_type_features.reset_index(),
-        on='user_id',
-        how='left'
-    ).fillna(0)
-
-    # Merge with priority challenge features
-    df_user_features = df_user_features.merge(
-        priority_features.reset_index(),
-        on='user_id',
-        how='left'
-    ).fillna(0)
-
-    # THEME FEATURES
-    # Filter interactions that have a defined master_theme (not None/NaN)
-    theme_interactions = df_interactions_with_content.dropna(subset=['master_theme'])
-
-    if not theme_interactions.empty:
-        # Count interactions by user and theme
-        theme_features = theme_interactions.groupby(['user_id', 'master_theme']).size().unstack(fill_value=0)
-        theme_features.columns = [f'nb_theme_{col}' for col in theme_features.columns]
-
-        # Merge with main matrix
-        df_user_features = df_user_features.merge(
-            theme_features.reset_index(),
-            on='user_id',
-            how='left'
-        ).fillna(0)
+    # Flags of each content by id (contents without a valid id never match)
+    df_flags = df_contents[['id'] + priority_challenges].copy()
+    df_flags['id'] = content_ids_to_numeric(df_flags['id'])
+    df_flags = df_flags[(df_flags['id'] >= 0) & (df_flags['id'] % 1 == 0)].drop_duplicates(subset='id')
+    flag_ids = df_flags['id'].to_numpy(dtype=np.int64)
+    id_span = max(int(flag_ids.max()) + 1 if len(flag_ids) else 1, 1)
+    content_rows = np.full(id_span, -1, dtype=np.int64)
+    content_rows[flag_ids] = np.arange(len(flag_ids))
+
+    known = consulted & (content_ids >= 0) & (content_ids < id_span)
+    rows = np.where(known, content_rows[np.where(known, content_ids, 0)], -1)
+    for challenge in priority_challenges:
+        challenge_contents = (df_flags[challenge] == 1).to_numpy()
+        has_challenge = (rows >= 0) & challenge_contents[np.maximum(rows, 0)]
+        df_user_features[f'nb_{challenge}'] = interactions.count_by_user(has_challenge)[consulting_users]
 
     # Total interactions per user
-    df_user_features['total_interactions'] = df_interactions_filtered.groupby('user_id').size().values
+    df_user_features['total_interactions'] = consultations_by_user[consulting_users]
 
     # Content diversity (number of unique contents consulted)
-    df_user_features['diversite_contenus'] = df_interactions_filtered.groupby('user_id')['content_id'].nunique().values
-
-    # Convert all to integers
-    numeric_columns = df_user_features.select_dtypes(include=['float64']).columns
-    df_user_features[numeric_columns] = df_user_features[numeric_columns].astype(int)
-
-    # Create DataFrame with user_id uniques
-    df_engagement = pd.DataFrame({'user_id': df_interactions['user_id'].unique()})
+    # The pair keys are built on content codes, content ids can be negative
+    with_content = consulted & (content_ids != MISSING_CONTENT_ID)
+    content_codes, content_values = pd.factorize(content_ids[with_content])
+    n_contents = max(len(content_values), 1)
+    pairs = pd.unique(user_codes[with_content].astype(np.int64) * n_contents + content_codes)
+    distinct_contents = np.bincount(pairs // n_contents, minlength=interactions.n_users)
+    df_user_features['diversite_contenus'] = distinct_contents[consulting_users]
 
     # Count each type of interaction by user
-    engagement_counts = df_interactions.groupby(['user_id', 'type']).size().unstack(fill_value=0)
-
-    # Add only the columns we are interested in (with 0 if they do not exist)
-    df_engagement['nb_vote'] = engagement_counts.get('contenu_vote', 0).values if 'contenu_vote' in engagement_counts.columns else 0
-    df_engagement['nb_comments'] = engagement_counts.get('comment_posted', 0).values if 'comment_posted' in engagement_counts.columns else 0
-    df_engagement['nb_opened_mail'] = engagement_counts.get('opened_mail', 0).values if 'opened_mail' in engagement_counts.columns else 0
-    df_engagement['nb_clicked_mail'] = engagement_counts.get('click_mail', 0).values if 'click_mail' in engagement_counts.columns else 0
+    df_engagement = pd.DataFrame({'user_id': interactions.user_ids})
+    for column, interaction_type in engagement_types.items():
+        df_engagement[column] = interactions.count_by_user(interactions.type_mask('type', [interaction_type]))
 
     df_users_featured = df_user_features.merge(
                             df_engagement,
@@ -193,6 +203,6 @@ def main_contents_usage(df_contents, df_interactions, df_users, df_content_valid
                     )
 
     # Fill with topics enrichment
-    df_complete = create_user_topic_enrichment(df_interactions, df_complete, df_content_valid)
+    df_complete = create_user_topic_enrichment(interactions, df_complete, df_content_valid, reference_date)
 
     return df_complete
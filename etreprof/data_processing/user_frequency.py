@@ -1,9 +1,13 @@
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
-from tqdm import tqdm
 import time
+from .interactions import prepare_interactions
 
-def create_temporal_engagement_df_optimized(df_interactions):
+# Default reference date of the time windows, fixed for testing (datetime.now() for current data)
+REFERENCE_DATE = datetime(2025, 7, 10, 15, 53, 58)
+
+def create_temporal_engagement_df_optimized(df_interactions, reference_date=None):
     """
     Create a temporal user engagement DataFrame from interaction data.
 
@@ -13,10 +17,13 @@ def create_temporal_engagement_df_optimized(df_interactions):
 
     Parameters
     ----------
-    df_interactions : pandas.DataFrame
+    df_interactions : pandas.DataFrame or PreparedInteractions
         DataFrame containing user interactions with at minimum the columns:
         - 'user_id' : Unique user identifier
         - 'created_at' : Date/time of interaction (will be converted to datetime)
+        or the interactions already prepared by main_process_users (not modified).
+    reference_date : datetime, optional
+        End of the time windows (default is REFERENCE_DATE).
 
     Returns
     -------
@@ -43,10 +50,11 @@ def create_temporal_engagement_df_optimized(df_interactions):
 
     Notes
     -----
-    - Time periods are calculated retrospectively from datetime.now()
+    - Time periods are calculated retrospectively from reference_date
     - Weeks = 7 days, months = 30 days, years = 365 days
     - Rows with missing user_id or created_at are dropped
-    - Function displays progress bar via tqdm
+    - Each row gets its week, month and year index from its age, and the actions
+      are counted per (user, period) with bincount on the rows sorted by user
     - Execution time is measured and displayed
 
     Examples
@@ -56,11 +64,10 @@ def create_temporal_engagement_df_optimized(df_interactions):
     ...     'created_at': ['2024-01-01', '2024-01-15', '2024-02-01', '2024-02-10', '2024-03-01']
     ... })
     >>> df_engagement = create_temporal_engagement_df_optimized(df_interactions)
-    🚀 Optimized version with groupby + apply...
     📊 Unique users: 3
     📊 Total interactions: 5
     ⚡ Processing...
-    ✅ Optimized calculation completed in 0.12 seconds!
+    ✅ Time elapsed to run processing 0.01 secondes!
 
     Raises
     ------
@@ -71,79 +78,58 @@ def create_temporal_engagement_df_optimized(df_interactions):
 
     See Also
     --------
-    pandas.DataFrame.groupby : Grouping method used for aggregation
-    tqdm.pandas : Progress bar for pandas operations
+    PreparedInteractions : Interactions parsed and sorted by user once for every stage
     """
 
-    # Activate tqdm for pandas
-    tqdm.pandas()
+    interactions = prepare_interactions(df_interactions)
 
     start_time = time.time()
 
-    # Prepare
-    df_interactions['created_at'] = pd.to_datetime(df_interactions['created_at'])
-    df_interactions = df_interactions.dropna(subset=['user_id', 'created_at'])
+    # Rows are sorted by user, users without a date are left out
+    frame = interactions.frame
+    dated = frame['created_at'].notna().to_numpy()
+    dates = frame['created_at'].to_numpy(dtype='datetime64[ns]')[dated]
+
+    # The dated rows of a user stay contiguous: their groups come from the user offsets
+    dated_counts = interactions.count_by_user(dated)
+    present_users = np.flatnonzero(dated_counts)
+    first_rows = (np.cumsum(dated_counts) - dated_counts)[present_users]
+    n_users = len(present_users)
+    user_rows = np.repeat(np.arange(n_users), dated_counts[present_users])
 
-    print(f"📊 Unique users : {df_interactions['user_id'].nunique()}")
-    print(f"📊 Total interactions : {len(df_interactions)}")
+    print(f"📊 Unique users : {n_users}")
+    print(f"📊 Total interactions : {len(dates)}")
 
     # Define periods
-    # now = datetime.now() # Use current date and time but for testing purposes we use a fixed date
-    now = datetime(2025, 7, 10, 15, 53, 58)  # Fixed date for testing
-    weeks = [(now - timedelta(weeks=i+1), now - timedelta(weeks=i)) for i in range(12)]
-    months = [(now - timedelta(days=30*(i+1)), now - timedelta(days=30*i)) for i in range(12)]
-    years = [(now - timedelta(days=365*(i+1)), now - timedelta(days=365*i)) for i in range(3)]
+    now = reference_date if reference_date is not None else REFERENCE_DATE
+    age = (np.datetime64(now, 'ns') - dates).astype(np.int64)
 
-    def process_user_group(group):
+    def count_periods(period, n_periods):
         """
-        Process interaction group for a single user to calculate temporal engagement metrics.
-
-        Parameters
-        ----------
-        group : pandas.DataFrame
-            Group of interactions for one user containing 'created_at' column.
-
-        Returns
-        -------
-        pandas.Series
-            Series with engagement metrics: weekly/monthly/yearly counts,
-            join_date, last_action_date, and total_interactions.
+        Number of actions of every user in each of the n_periods periods before now:
+        period i covers [now - (i+1) * period, now - i * period).
         """
-        dates = group['created_at']
-
-        result = {}
-
-        # Weekks
-        for i, (debut, fin) in enumerate(weeks):
-            result[f'week_minus_{i}'] = dates[(dates >= debut) & (dates < fin)].count()
-
-        # Months
-        for i, (debut, fin) in enumerate(months):
-            result[f'month_minus_{i}'] = dates[(dates >= debut) & (dates < fin)].count()
-
-        # Years
-        for i, (debut, fin) in enumerate(years):
-            result[f'year_minus_{i}'] = dates[(dates >= debut) & (dates < fin)].count()
-
-        # Complementary datas
-        result['join_date'] = dates.min()  # First interaction
-        result['last_action_date'] = dates.max()  # Last action
-        result['total_interactions'] = len(dates)  # Total number of interactions
-
-        return pd.Series(result)
+        period_ns = int(period / timedelta(microseconds=1)) * 1000
+        index = (age - 1) // period_ns
+        in_range = (age > 0) & (index < n_periods)
+        counts = np.bincount(user_rows[in_range] * n_periods + index[in_range], minlength=n_users * n_periods)
+        return counts.reshape(n_users, n_periods)
 
     print("⚡ Run in progress...")
-    df_engagement = df_interactions.groupby('user_id').progress_apply(process_user_group).reset_index()
-
-    df_engagement = df_engagement.rename(columns={'user_id': 'id'})
-
-    # Reorder columns
-    column_order = ['id', 'join_date', 'last_action_date', 'total_interactions']
-    column_order.extend([f'week_minus_{i}' for i in range(12)])
-    column_order.extend([f'month_minus_{i}' for i in range(12)])
-    column_order.extend([f'year_minus_{i}' for i in range(3)])
-
-    df_engagement = df_engagement[column_order]
+    weeks = count_periods(timedelta(weeks=1), 12)
+    months = count_periods(timedelta(days=30), 12)
+    years = count_periods(timedelta(days=365), 3)
+
+    date_values = dates.astype(np.int64)
+    df_engagement = pd.DataFrame({
+        'id': interactions.user_ids[present_users],
+        'join_date': np.minimum.reduceat(date_values, first_rows).astype('datetime64[ns]') if n_users else dates[:0],
+        'last_action_date': np.maximum.reduceat(date_values, first_rows).astype('datetime64[ns]') if n_users else dates[:0],
+        'total_interactions': np.bincount(user_rows, minlength=n_users)
+    })
+    for name, counts in [('week', weeks), ('month', months), ('year', years)]:
+        for i in range(counts.shape[1]):
+            df_engagement[f'{name}_minus_{i}'] = counts[:, i]
 
     # Total execution time
     end_time = time.time()
@@ -154,12 +140,14 @@ def create_temporal_engagement_df_optimized(df_interactions):
     return df_engagement
 
 
-def main_frequency_users(df_interactions, df_users):
+def main_frequency_users(df_interactions, df_users, reference_date=None):
     """
-    Main function to process user frequency data from interactions and user CSV files.
+    Main function to process user frequency data from interactions (DataFrame or
+    PreparedInteractions) and user CSV files, with time windows ending at
+    reference_date (default is REFERENCE_DATE).
     """
     # Create the temporal engagement DataFrame
-    df_engagement = create_temporal_engagement_df_optimized(df_interactions)
+    df_engagement = create_temporal_engagement_df_optimized(df_interactions, reference_date)
 
     # Merge the engagement DataFrame with the user DataFrame
     df_users_enriched = df_users.merge(df_engagement, on='id', how='left')
@@ -2,10 +2,15 @@ import pandas as pd
 from .user_transforms import main_users_cleaning
 from .user_frequency import main_frequency_users
 from .user_contents import main_contents_usage
+from .interactions import PreparedInteractions
+from .profiling import profiled, PROFILE_STAGES
 import os
 from dotenv import load_dotenv
 
-def main_process_users(df_users, df_contents, df_content_valid, df_interactions):
+# 'pandas' (eager, in memory) or 'polars' (lazy queries on the files, see polars_backend)
+FEATURES_BACKEND = os.getenv("FEATURES_BACKEND", "pandas")
+
+def main_process_users(df_users, df_contents, df_content_valid, df_interactions, reference_date=None):
     """
     Main function to process user data, contents, and interactions.
 
@@ -16,7 +21,10 @@ def main_process_users(df_users, df_contents, df_content_valid, df_interactions)
     df_contents : pandas.DataFrame
         DataFrame containing content data.
     df_interactions : pandas.DataFrame
-        DataFrame containing interaction data.
+        DataFrame containing interaction data (not modified).
+    reference_date : datetime, optional
+        End of the time windows of the frequency features (default is
+        user_frequency.REFERENCE_DATE) and of the topic enrichment (default is now).
 
     Returns
     -------
@@ -24,19 +32,55 @@ def main_process_users(df_users, df_contents, df_content_valid, df_interactions)
         Processed DataFrame with user features and engagement metrics.
     """
 
+    # Each stage is profiled when PROFILE_STAGES is set (see profiling.py)
     # Clean user data
-    df_users_cleaned = main_users_cleaning(df_users)
+    with profiled("users_cleaning", PROFILE_STAGES):
+        df_users_cleaned = main_users_cleaning(df_users)
 
+    # Parse, code and sort the interactions once for every stage
+    with profiled("prepare_interactions", PROFILE_STAGES):
+        interactions = PreparedInteractions(df_interactions)
+    print(f"📦 {len(interactions.frame)} interactions of {interactions.n_users} users prepared "
+          f"in {interactions.preparation_seconds:.2f} s")
 
     # Process user frequency data
-    df_users_enriched = main_frequency_users(df_interactions, df_users_cleaned)
+    with profiled("frequency_users", PROFILE_STAGES):
+        df_users_enriched = main_frequency_users(interactions, df_users_cleaned, reference_date)
 
 
     # Process user contents usage
-    df_final = main_contents_usage(df_contents, df_interactions, df_users_enriched, df_content_valid)
+    with profiled("contents_usage", PROFILE_STAGES):
+        df_final = main_contents_usage(df_contents, interactions, df_users_enriched, df_content_valid, reference_date)
 
     return df_final
 
+def read_table(path):
+    """
+    Read a CSV or Parquet file with pandas.
+    """
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    return pd.read_csv(path, low_memory=False)
+
+def process_users_files(users_path, contents_path, content_valid_path, interactions_path,
+                        reference_date=None, backend=FEATURES_BACKEND):
+    """
+    Run the user feature pipeline on CSV or Parquet files with the given backend:
+    'pandas' reads the files and runs main_process_users, 'polars' runs the same
+    pipeline as lazy queries on the files (same output).
+    """
+    if backend == 'polars':
+        from .polars_backend import process_users_files as process_with_polars
+        return process_with_polars(users_path, contents_path, content_valid_path, interactions_path, reference_date)
+    if backend != 'pandas':
+        raise ValueError(f"Unknown features backend {backend}, use 'pandas' or 'polars'")
+
+    df_users = read_table(users_path)
+    df_contents = read_table(contents_path)
+    df_content_valid = read_table(content_valid_path)
+    df_interactions = read_table(interactions_path)
+    return main_process_users(df_users, df_contents, df_content_valid, df_interactions, reference_date)
+
 if __name__ == "__main__":
     # Import databases
     # load_dotenv()
@@ -45,10 +89,6 @@ if __name__ == "__main__":
     # df_interactions = pd.read_csv(os.getenv("INTERACTIONS_URL_DB"), low_memory=False)
 
     # local paths for testing
-    df_users = pd.read_csv("raw_data/users.csv", low_memory=False)
-    df_contents = pd.read_csv("raw_data/contents_v3.csv", low_memory=False)
-    df_interactions = pd.read_csv("raw_data/interaction_events.csv", low_memory=False)
-    df_content_valid = pd.read_csv("raw_data/content_with_topics.csv", low_memory=False)
-
-    df_final = main_process_users(df_users, df_contents, df_content_valid, df_interactions)
+    df_final = process_users_files("raw_data/users.csv", "raw_data/contents_v3.csv",
+                                   "raw_data/content_with_topics.csv", "raw_data/interaction_events.csv")
     df_final.to_csv("data/users_final_dataset.csv", index=False)
@@ -244,6 +244,101 @@ def update_anciennete(row):
         return anciennete
 
 
+variants_france = [
+    'france', 'f', 'fr', 'fra', 'fran', 'franc', 'francs', 'frnace',
+    'frrance', 'fance', 'farnce', 'frane', 'francr', 'frande', 'franxe',
+    'frannce', 'francec', 'francer', 'français', 'françe', 'francia',
+    'francce', 'franccccccce', 'franche', 'france0', 'frankreich',
+    "france  d'origine it", 'france (ile de la ré', 'france nouvelle-calé',
+    'france réunion', 'france île de la réu', 'france/ gb/canada/us',
+    'guadeloupe', 'guadeloupe (dom)', 'guadeloupe france',
+    'martinique', 'martiniqie', 'martinique (france)', 'martinique ( france)',
+    'réunion', 'reunion', 'runion', 'reunion france', 'la reunion', 'la réunion',
+    'ile de la reunion', 'ile de la réunion', 'ile de la réunion (f',
+    'île de la reunion',
+    'guyane', 'guyane française', 'guyane francaise', 'french guiana',
+    'mayotte', 'réside à mayotte',
+    'nouvelle calédonie', 'nouvelle-calédonie', 'nouvelle calédonie',
+    'nouvelle caledonie', 'nouvelle-caledonie', 'nouvelle camédonie',
+    'nouvelle- calédonie', 'caledonie',
+    'polynésie française', 'polynesie française', 'polynesie francaise',
+    'polynésie', 'french polynesia', 'tahiti', 'tahiti (polynésie fr',
+    'saint-martin', 'saint martin', 'saint-martin (partie française)',
+    'saint barthelemy', 'saint pierre and miq',
+    'maurice', 'ile maurice',
+    'france (la réunion)', 'france (mayotte )', 'bretagne-france',
+    'paris', 'nice', 'angers', 'strasbourg', 'bourges', 'tarbes',
+    'montpellier', 'nantes', 'toulouse', 'mulhouse', 'cayenne', 'mirepoix',
+    'eysines', 'aubervilliers', 'amiens', 'angouleme', 'vierzon',
+    'le cannet', 'oyonnax', 'romans', 'chaumont en vexin', 'sucy',
+    'amberieu en bugey', 'aigueperse', 'le creusot', 'mantrs la ville',
+    'montbéliard', 'st joseph', 'bretagne', '', '600'
+]
+
+col_to_drop = ['locale', 'public', 'name', 'prenom', 'pays', 'statut',
+               'fonction', 'fontion_longue', 'enseigne_en_eefe',
+               'date_derniere_action', 'updated_at', 'json_format',
+               'json_centre_interet', 'json_metadata']
+
+niveaux_primaires = ['TPS', 'PS', 'MS', 'GS', 'CP', 'CE1', 'CE2', 'CM1', 'CM2', 'Direction', 'ASH']
+niveaux_secondaires = ['6e', '5e', '4e', '3e', '2nde', '1ère', 'Terminale', 'Bac Pro', 'CAP', 'SEGPA', 'Professeur-e documentaliste', 'POST BAC']
+niveaux_formateurs = ['Formateur-trice /Inspecteur-trice']
+
+# Levels taught in each type of school
+niveaux_etablissements = {
+    'maternelle': ['TPS', 'PS', 'MS', 'GS', 'Direction','ASH'],
+    'elementaire': ['CP', 'CE1', 'CE2', 'CM1', 'CM2', 'ASH', 'Direction'],
+    'college': ['6e', '5e', '4e', '3e', 'SEGPA', 'Professeur-e documentaliste'],
+    'lycee': ['2nde', '1ère', 'Terminale', 'Professeur-e documentaliste'],
+    'lycee_pro': ['Bac Pro', 'CAP'],
+    'autre': ['POST BAC', 'Formateur-trice /Inspecteur-trice']
+}
+
+users_columns_rename = {
+    'codepostal': 'code_postal',
+    'type_etablissement_etab': 'type_etab',
+    'academie_etab': 'academie',
+    'niveau_formateur_trice_/inspecteur_trice': 'niveau_formateur',
+    'niveau_professeur_e_documentaliste': 'niveau_documentaliste'
+}
+
+users_columns_order = [
+    'id', 'statut_infolettre', 'statut_mailchimp', 'code_postal', 'departement', 'academie',
+    'anciennete', 'created_at', 'degre', 'maternelle', 'elementaire', 'college', 'lycee', 'lycee_pro', 'autre',
+    'type_etab', 'discipline',
+    'niveau_tps',
+    'niveau_ps',
+    'niveau_ms',
+    'niveau_gs',
+    'niveau_cp',
+    'niveau_ce1',
+    'niveau_ce2',
+    'niveau_cm1',
+    'niveau_cm2',
+    'niveau_6e',
+    'niveau_5e',
+    'niveau_4e',
+    'niveau_3e',
+    'niveau_2nde',
+    'niveau_1ere',
+    'niveau_terminale',
+    'niveau_cap',
+    'niveau_bac_pro',
+    'niveau_post_bac',
+    'niveau_segpa',
+    'niveau_ash',
+    'niveau_direction',
+    'niveau_formateur',
+    'niveau_documentaliste',
+]
+
+def niveau_column(niveau):
+    """
+    Name of the one-hot column of a level.
+    """
+    return f"niveau_{niveau}".replace(" ", "_").replace("-", "_").replace("è", "e").replace("é", "e").lower()
+
+
 def main_users_cleaning(df):
     """
     Cleans the user data from the given csv file.
@@ -253,47 +348,12 @@ def main_users_cleaning(df):
     df = df[df.locale != "be"]
     df['pays'] = df['pays'].fillna('france')
     df['pays'] = df['pays'].str.lower().str.strip()
-    variants_france = [
-            'france', 'f', 'fr', 'fra', 'fran', 'franc', 'francs', 'frnace',
-            'frrance', 'fance', 'farnce', 'frane', 'francr', 'frande', 'franxe',
-            'frannce', 'francec', 'francer', 'français', 'françe', 'francia',
-            'francce', 'franccccccce', 'franche', 'france0', 'frankreich',
-            "france  d'origine it", 'france (ile de la ré', 'france nouvelle-calé',
-            'france réunion', 'france île de la réu', 'france/ gb/canada/us',
-            'guadeloupe', 'guadeloupe (dom)', 'guadeloupe france',
-            'martinique', 'martiniqie', 'martinique (france)', 'martinique ( france)',
-            'réunion', 'reunion', 'runion', 'reunion france', 'la reunion', 'la réunion',
-            'ile de la reunion', 'ile de la réunion', 'ile de la réunion (f',
-            'île de la reunion',
-            'guyane', 'guyane française', 'guyane francaise', 'french guiana',
-            'mayotte', 'réside à mayotte',
-            'nouvelle calédonie', 'nouvelle-calédonie', 'nouvelle calédonie',
-            'nouvelle caledonie', 'nouvelle-caledonie', 'nouvelle camédonie',
-            'nouvelle- calédonie', 'caledonie',
-            'polynésie française', 'polynesie française', 'polynesie francaise',
-            'polynésie', 'french polynesia', 'tahiti', 'tahiti (polynésie fr',
-            'saint-martin', 'saint martin', 'saint-martin (partie française)',
-            'saint barthelemy', 'saint pierre and miq',
-            'maurice', 'ile maurice',
-            'france (la réunion)', 'france (mayotte )', 'bretagne-france',
-            'paris', 'nice', 'angers', 'strasbourg', 'bourges', 'tarbes',
-            'montpellier', 'nantes', 'toulouse', 'mulhouse', 'cayenne', 'mirepoix',
-            'eysines', 'aubervilliers', 'amiens', 'angouleme', 'vierzon',
-            'le cannet', 'oyonnax', 'romans', 'chaumont en vexin', 'sucy',
-            'amberieu en bugey', 'aigueperse', 'le creusot', 'mantrs la ville',
-            'montbéliard', 'st joseph', 'bretagne', '', '600'
-        ]
 
     df.loc[df['pays'].isin(variants_france), 'pays'] = 'france'
 
     df.loc[df['pays'].isin(['', '600']), 'pays'] = 'france'
     df = df[df.pays == 'france']
 
-    col_to_drop = ['locale', 'public', 'name', 'prenom', 'pays', 'statut',
-                   'fonction', 'fontion_longue', 'enseigne_en_eefe',
-                   'date_derniere_action', 'updated_at', 'json_format',
-                   'json_centre_interet', 'json_metadata']
-
     for col in col_to_drop:
         drop_col(df, col)
 
@@ -306,20 +366,15 @@ def main_users_cleaning(df):
 
     # One-hot encoding for 'json_niveau'
     for niveau in sorted(all_niveaux):
-        col_name = f"niveau_{niveau}".replace(" ", "_").replace("-", "_").replace("è", "e").replace("é", "e").lower()
-        df[col_name] = 0
+        df[niveau_column(niveau)] = 0
     for idx, niveaux_str in df['json_niveau'].items():
         niveaux_list = json.loads(niveaux_str)
         for niveau in niveaux_list:
-            col_name = f"niveau_{niveau}".replace(" ", "_").replace("-", "_").replace("è", "e").replace("é", "e").lower()
+            col_name = niveau_column(niveau)
             if col_name in df.columns:
                 df.loc[idx, col_name] = 1
 
     # Encode 'degre' column
-    niveaux_primaires = ['TPS', 'PS', 'MS', 'GS', 'CP', 'CE1', 'CE2', 'CM1', 'CM2', 'Direction', 'ASH']
-    niveaux_secondaires = ['6e', '5e', '4e', '3e', '2nde', '1ère', 'Terminale', 'Bac Pro', 'CAP', 'SEGPA', 'Professeur-e documentaliste', 'POST BAC']
-    niveaux_formateurs = ['Formateur-trice /Inspecteur-trice']
-
     # Créer la colonne degre (0 par défaut)
     df['degre'] = 0
 
@@ -341,34 +396,16 @@ def main_users_cleaning(df):
                 df.loc[idx, 'degre'] = 1  # En cas d'égalité, primaire par défaut
 
     # Encode 'grandsNiveaux' column
-    niveaux_maternelle = ['TPS', 'PS', 'MS', 'GS', 'Direction','ASH']
-    niveaux_elementaire = ['CP', 'CE1', 'CE2', 'CM1', 'CM2', 'ASH', 'Direction']
-    niveaux_college = ['6e', '5e', '4e', '3e', 'SEGPA', 'Professeur-e documentaliste']
-    niveaux_lycee = ['2nde', '1ère', 'Terminale', 'Professeur-e documentaliste']
-    niveaux_lycee_pro = ['Bac Pro', 'CAP']
-    niveaux_autre = ['POST BAC', 'Formateur-trice /Inspecteur-trice']
-
-    etablissements = ['maternelle', 'elementaire', 'college', 'lycee', 'lycee_pro', 'autre']
-
-    for etab in etablissements:
+    for etab in niveaux_etablissements:
         df[etab] = 0
 
     for idx, niveaux_str in df['json_niveau'].items():
         if isinstance(niveaux_str, str):
             niveaux_list = json.loads(niveaux_str)
 
-            if any(niveau in niveaux_maternelle for niveau in niveaux_list):
-                df.loc[idx, 'maternelle'] = 1
-            if any(niveau in niveaux_elementaire for niveau in niveaux_list):
-                df.loc[idx, 'elementaire'] = 1
-            if any(niveau in niveaux_college for niveau in niveaux_list):
-                df.loc[idx, 'college'] = 1
-            if any(niveau in niveaux_lycee for niveau in niveaux_list):
-                df.loc[idx, 'lycee'] = 1
-            if any(niveau in niveaux_lycee_pro for niveau in niveaux_list):
-                df.loc[idx, 'lycee_pro'] = 1
-            if any(niveau in niveaux_autre for niveau in niveaux_list):
-                df.loc[idx, 'autre'] = 1
+            for etab, niveaux_etab in niveaux_etablissements.items():
+                if any(niveau in niveaux_etab for niveau in niveaux_list):
+                    df.loc[idx, etab] = 1
 
     # Drop the original 'json_niveau' column
     drop_col(df, 'json_niveau')
@@ -399,44 +436,8 @@ def main_users_cleaning(df):
     # Clean 'created_at' column (only keep date part)
     df['created_at'] = pd.to_datetime(df['created_at']).dt.date
 
-    df = df.rename(columns={
-        'codepostal': 'code_postal',
-        'type_etablissement_etab': 'type_etab',
-        'academie_etab': 'academie',
-        'niveau_formateur_trice_/inspecteur_trice': 'niveau_formateur',
-        'niveau_professeur_e_documentaliste': 'niveau_documentaliste'
-    })
-
-    columns_order = [
-    'id', 'statut_infolettre', 'statut_mailchimp', 'code_postal', 'departement', 'academie',
-    'anciennete', 'created_at', 'degre', 'maternelle', 'elementaire', 'college', 'lycee', 'lycee_pro', 'autre',
-    'type_etab', 'discipline',
-    'niveau_tps',
-    'niveau_ps',
-    'niveau_ms',
-    'niveau_gs',
-    'niveau_cp',
-    'niveau_ce1',
-    'niveau_ce2',
-    'niveau_cm1',
-    'niveau_cm2',
-    'niveau_6e',
-    'niveau_5e',
-    'niveau_4e',
-    'niveau_3e',
-    'niveau_2nde',
-    'niveau_1ere',
-    'niveau_terminale',
-    'niveau_cap',
-    'niveau_bac_pro',
-    'niveau_post_bac',
-    'niveau_segpa',
-    'niveau_ash',
-    'niveau_direction',
-    'niveau_formateur',
-    'niveau_documentaliste',
-    ]
+    df = df.rename(columns=users_columns_rename)
 
-    df = df[columns_order]
+    df = df[users_columns_order]
 
     return df
@@ -0,0 +1,203 @@
+"""
+Hot-swappable model and data artifacts.
+
+Each artifact (clustering models, BERTopic model, recommendations mapping...) is loaded
+from a set of files and kept in memory. When its files change, the new version is
+loaded and validated in a background thread, then swapped in with a single reference
+assignment: requests already running keep the version they fetched, the next ones get
+the new one. A version that fails to load or to validate is rejected and the previous
+version stays active.
+"""
+import os
+import time
+import hashlib
+import threading
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+
+class ArtifactError(Exception):
+    """An artifact could not be loaded or did not pass validation."""
+
+
+def source_version(paths: List[str]) -> tuple:
+    """
+    Version of the files of an artifact: path, modification time and size of every file
+    (files of a directory included), None for a missing path.
+    """
+    version = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, filenames in sorted(os.walk(path)):
+                for filename in sorted(filenames):
+                    file_path = os.path.join(root, filename)
+                    stat = os.stat(file_path)
+                    version.append((os.path.relpath(file_path, path), stat.st_mtime_ns, stat.st_size))
+        elif os.path.exists(path):
+            stat = os.stat(path)
+            version.append((os.path.basename(path), stat.st_mtime_ns, stat.st_size))
+        else:
+            version.append((os.path.basename(path), None))
+    return tuple(version)
+
+
+def version_id(version: tuple) -> str:
+    return hashlib.sha1(repr(version).encode('utf-8')).hexdigest()[:12]
+
+
+class _Artifact:
+    def __init__(self, name, paths, load, validate):
+        self.name = name
+        self.paths = paths
+        self.load = load
+        self.validate = validate
+        # (value, version, loaded_at, load_seconds), replaced as a whole on swap
+        self.active = None
+        self.lock = threading.Lock()
+        self.reloads = 0
+        self.rejected_version = None
+        self.last_error = None
+
+
+class ArtifactManager:
+    """
+    Registry of the artifacts of the process, with their active version.
+    """
+
+    def __init__(self):
+        self._artifacts: Dict[str, _Artifact] = {}
+        self._watcher = None
+        self._stop = threading.Event()
+
+    def register(self, name: str, paths: Callable[[], List[str]], load: Callable[[], Any],
+                 validate: Optional[Callable[[Any], None]] = None):
+        """
+        Declare an artifact.
+
+        Parameters
+        ----------
+        name : str
+            Name of the artifact.
+        paths : Callable[[], List[str]]
+            Returns the files and directories the artifact is loaded from.
+        load : Callable[[], Any]
+            Loads the artifact.
+        validate : Callable[[Any], None], optional
+            Raises ArtifactError (or any exception) if a loaded artifact must not be used.
+        """
+        self._artifacts[name] = _Artifact(name, paths, load, validate)
+
+    def _load(self, artifact: _Artifact):
+        version = source_version(artifact.paths())
+        start = time.perf_counter()
+        value = artifact.load()
+        if artifact.validate is not None:
+            artifact.validate(value)
+        # Files written during the load may have been read half-written
+        if source_version(artifact.paths()) != version:
+            raise ArtifactError(f"The files of {artifact.name} changed while loading")
+        loaded_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+        return value, version, loaded_at, time.perf_counter() - start
+
+    def get(self, name: str) -> Any:
+        """
+        The active version of an artifact, loaded on first use.
+
+        Raises
+        ------
+        ArtifactError
+            If the artifact has never been loaded successfully and fails to load.
+        """
+        artifact = self._artifacts[name]
+        active = artifact.active
+        if active is None:
+            with artifact.lock:
+                if artifact.active is None:
+                    try:
+                        artifact.active = self._load(artifact)
+                    except Exception as e:
+                        artifact.last_error = f"{type(e).__name__}: {e}"
+                        raise ArtifactError(f"Could not load {name}: {artifact.last_error}") from e
+                active = artifact.active
+        return active[0]
+
+    def version(self, name: str) -> str:
+        """
+        Identifier of the active version of an artifact.
+        """
+        self.get(name)
+        return version_id(self._artifacts[name].active[1])
+
+    def reload(self, name: str, force: bool = False) -> bool:
+        """
+        Load, validate and swap in the current files of an artifact if they changed
+        (or always with force). Returns True if a new version was swapped in.
+        """
+        artifact = self._artifacts[name]
+        with artifact.lock:
+            version = source_version(artifact.paths())
+            if not force and artifact.active is not None and version == artifact.active[1]:
+                return False
+            if not force and version == artifact.rejected_version:
+                return False
+            try:
+                loaded = self._load(artifact)
+            except Exception as e:
+                artifact.rejected_version = version
+                artifact.last_error = f"{type(e).__name__}: {e}"
+                print(f"❌ {name}: new version rejected - {artifact.last_error}")
+                return False
+            artifact.active = loaded
+            artifact.reloads += 1
+            artifact.last_error = None
+        print(f"🔄 {name}: version {version_id(loaded[1])} loaded in {loaded[3]:.1f} s")
+        return True
+
+    def check(self):
+        """
+        Reload the artifacts in use whose files changed.
+        """
+        for name, artifact in self._artifacts.items():
+            if artifact.active is not None:
+                self.reload(name)
+
+    def start_watching(self, interval: float):
+        """
+        Check for new artifact versions every interval seconds in a background thread.
+        """
+        if interval <= 0 or self._watcher is not None:
+            return
+
+        def watch():
+            while not self._stop.wait(interval):
+                self.check()
+
+        self._stop.clear()
+        self._watcher = threading.Thread(target=watch, daemon=True, name="artifact-watcher")
+        self._watcher.start()
+
+    def stop_watching(self):
+        self._stop.set()
+        self._watcher = None
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Active version, load time and last error of every artifact.
+        """
+        stats = {}
+        for name, artifact in self._artifacts.items():
+            active = artifact.active
+            stats[name] = {
+                "loaded": active is not None,
+                "version": version_id(active[1]) if active is not None else None,
+                "loaded_at": active[2] if active is not None else None,
+                "load_seconds": round(active[3], 3) if active is not None else None,
+                "reloads": artifact.reloads,
+                "last_error": artifact.last_error,
+                "paths": artifact.paths()
+            }
+        return stats
+
+
+# Shared by the modules of the process, each registering the artifacts it loads
+artifact_manager = ArtifactManager()
@@ -0,0 +1,228 @@
+"""
+Compact, pickle-free format of the user clustering models.
+
+The KMeans and RobustScaler pickles carry training state (labels_ of every training
+user) and depend on the sklearn version. Assigning a cluster only needs the centroids,
+the scaler center and scale, the feature order and the log-transformed features:
+they are stored in clustering_model.safetensors (float64 arrays, read with
+safetensors.numpy like the topic embeddings) and clustering_model.json, and loaded
+with NumPy alone in about 30 µs.
+
+Usage:
+    python -m etreprof.ml_package.clustering_export export   # write the files from the pickles
+    python -m etreprof.ml_package.clustering_export verify   # compare assignments with the pickles
+"""
+import os
+import sys
+import json
+import time
+import pickle
+import hashlib
+import numpy as np
+import pandas as pd
+from typing import Dict, Any, List
+from safetensors.numpy import save, load
+
+ROOT_PATH = os.path.dirname(os.path.abspath(__file__))
+PICKLES_PATH = os.path.join(ROOT_PATH, 'pickles')
+ARRAYS_FILE = 'clustering_model.safetensors'
+METADATA_FILE = 'clustering_model.json'
+FORMAT_VERSION = 1
+
+
+def model_features(features_used: List[str], log_transformed_features: List[str]) -> List[str]:
+    """
+    Input columns of the scaler: features_used with the log-transformed features
+    replaced by '<feature>_log' columns appended at the end.
+    """
+    return ([f for f in features_used if f not in log_transformed_features]
+            + [f'{f}_log' for f in log_transformed_features])
+
+
+def export_clustering_model(kmeans, scaler, metadata: Dict[str, Any], output_dir: str = PICKLES_PATH) -> Dict[str, Any]:
+    """
+    Write the centroids, scaler center and scale to clustering_model.safetensors and the feature
+    lists to clustering_model.json.
+
+    Parameters
+    ----------
+    kmeans : sklearn.cluster.KMeans
+        The fitted KMeans.
+    scaler : sklearn.preprocessing.RobustScaler
+        The fitted scaler.
+    metadata : Dict[str, Any]
+        The training metadata (metadata.json) with 'features_used' and 'log_transformed_features'.
+    output_dir : str
+        Directory receiving the two files.
+
+    Returns
+    -------
+    Dict[str, Any]: The JSON metadata written.
+    """
+    log_features = metadata.get('log_transformed_features', [])
+    features = model_features(metadata['features_used'], log_features)
+    n_features = len(features)
+
+    centroids = np.ascontiguousarray(kmeans.cluster_centers_, dtype=np.float64)
+    center = np.asarray(scaler.center_ if scaler.center_ is not None else np.zeros(n_features), dtype=np.float64)
+    scale = np.asarray(scaler.scale_ if scaler.scale_ is not None else np.ones(n_features), dtype=np.float64)
+    if centroids.shape[1] != n_features or len(center) != n_features or len(scale) != n_features:
+        raise ValueError(f"Models expect {centroids.shape[1]} features, metadata lists {n_features}")
+
+    os.makedirs(output_dir, exist_ok=True)
+    arrays_path = os.path.join(output_dir, ARRAYS_FILE)
+    raw = save({"centroids": centroids, "center": center, "scale": scale})
+    with open(f'{arrays_path}.tmp', 'wb') as f:
+        f.write(raw)
+    os.replace(f'{arrays_path}.tmp', arrays_path)
+
+    # Written last: the arrays hash ties the two files together
+    model_metadata = {
+        "format_version": FORMAT_VERSION,
+        "n_clusters": int(centroids.shape[0]),
+        "features_used": metadata['features_used'],
+        "log_transformed_features": log_features,
+        "model_features": features,
+        "model_version": metadata.get('model_version'),
+        "trained_at": metadata.get('trained_at'),
+        "arrays_sha256": hashlib.sha256(raw).hexdigest()
+    }
+    metadata_path = os.path.join(output_dir, METADATA_FILE)
+    with open(f'{metadata_path}.tmp', 'w', encoding='utf-8') as f:
+        json.dump(model_metadata, f, indent=2)
+    os.replace(f'{metadata_path}.tmp', metadata_path)
+    return model_metadata
+
+
+def load_clustering_model(model_dir: str = PICKLES_PATH) -> Dict[str, Any]:
+    """
+    Load the compact clustering model with NumPy only.
+
+    Returns
+    -------
+    Dict[str, Any]: The JSON metadata with the 'centroids', 'center' and 'scale' arrays
+    and the squared norms of the centroids.
+
+    Raises
+    ------
+    ValueError
+        If the arrays file does not match the metadata (partial export).
+    """
+    with open(os.path.join(model_dir, METADATA_FILE), 'r', encoding='utf-8') as f:
+        model = json.load(f)
+    with open(os.path.join(model_dir, ARRAYS_FILE), 'rb') as f:
+        raw = f.read()
+    if hashlib.sha256(raw).hexdigest() != model['arrays_sha256']:
+        raise ValueError(f"{ARRAYS_FILE} does not match {METADATA_FILE}, export the model again")
+
+    arrays = load(raw)
+    model["centroids"] = arrays["centroids"]
+    model["center"] = arrays["center"]
+    model["scale"] = arrays["scale"]
+    model["centroid_norms"] = (model["centroids"] ** 2).sum(axis=1)
+    return model
+
+
+def clustering_features(df_users: pd.DataFrame, model: Dict[str, Any]) -> np.ndarray:
+    """
+    Build the scaler input of users: features_used with missing values set to 0,
+    log1p of the log-transformed features, in the model's column order.
+    """
+    missing_features = [f for f in model['features_used'] if f not in df_users.columns]
+    if missing_features:
+        raise ValueError(f"Missing required features for clustering: {missing_features}")
+
+    log_features = model['log_transformed_features']
+    columns = [f for f in model['features_used'] if f not in log_features] + log_features
+    X = df_users[columns].fillna(0).to_numpy(dtype=np.float64)
+    n_linear = len(columns) - len(log_features)
+    X[:, n_linear:] = np.log1p(X[:, n_linear:])
+    return X
+
+
+def predict_clusters(model: Dict[str, Any], X: np.ndarray) -> np.ndarray:
+    """
+    Assign each row of X (see clustering_features) to its closest centroid after scaling,
+    with the same distance expansion as KMeans.predict (ties go to the lowest cluster).
+    """
+    X_scaled = (X - model["center"]) / model["scale"]
+    distances = model["centroid_norms"] - 2 * X_scaled @ model["centroids"].T
+    return np.argmin(distances, axis=1).astype(np.int32)
+
+
+def load_pickled_models(model_dir: str = PICKLES_PATH):
+    with open(os.path.join(model_dir, 'kmeans_model.pkl'), 'rb') as f:
+        kmeans = pickle.load(f)
+    with open(os.path.join(model_dir, 'scaler_model.pkl'), 'rb') as f:
+        scaler = pickle.load(f)
+    with open(os.path.join(model_dir, 'metadata.json'), 'r') as f:
+        metadata = json.load(f)
+    return kmeans, scaler, metadata
+
+
+def sample_users(model: Dict[str, Any], n_users: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Synthetic users spread around the centroids and between them, with the raw
+    (not log-transformed, not scaled) feature values, for verification.
+    """
+    rng = np.random.default_rng(seed)
+    centroids = model["centroids"][rng.integers(0, model["n_clusters"], n_users)]
+    other = model["centroids"][rng.integers(0, model["n_clusters"], n_users)]
+    mix = rng.random((n_users, 1))
+    X_scaled = mix * centroids + (1 - mix) * other + rng.normal(0, 1.0, centroids.shape)
+    X = X_scaled * model["scale"] + model["center"]
+
+    log_features = model['log_transformed_features']
+    n_linear = X.shape[1] - len(log_features)
+    X[:, n_linear:] = np.expm1(np.clip(X[:, n_linear:], 0, None))
+    columns = [f for f in model['features_used'] if f not in log_features] + log_features
+    return pd.DataFrame(X, columns=columns)[model['features_used']]
+
+
+def verify_against_pickles(n_users: int = 1_000_000, model_dir: str = PICKLES_PATH) -> Dict[str, Any]:
+    """
+    Compare the assignments of the compact model with the pickled scaler and KMeans on synthetic users.
+    """
+    kmeans, scaler, _ = load_pickled_models(model_dir)
+    start = time.perf_counter()
+    model = load_clustering_model(model_dir)
+    load_seconds = time.perf_counter() - start
+
+    df_users = sample_users(model, n_users)
+    X = clustering_features(df_users, model)
+
+    start = time.perf_counter()
+    compact = predict_clusters(model, X)
+    compact_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    pickled = kmeans.predict(scaler.transform(pd.DataFrame(X, columns=model['model_features'])))
+    pickled_seconds = time.perf_counter() - start
+
+    return {
+        "n_users": n_users,
+        "mismatches": int((compact != pickled).sum()),
+        "cluster_distribution": np.bincount(compact, minlength=model["n_clusters"]).tolist(),
+        "load_us": round(load_seconds * 1e6, 1),
+        "compact_predict_ms": round(compact_seconds * 1000, 1),
+        "pickled_predict_ms": round(pickled_seconds * 1000, 1)
+    }
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "verify"
+
+    if command == "export":
+        model_metadata = export_clustering_model(*load_pickled_models())
+        size = os.path.getsize(os.path.join(PICKLES_PATH, ARRAYS_FILE))
+        print(f"✅ {ARRAYS_FILE} ({size} bytes) and {METADATA_FILE} written - "
+              f"{model_metadata['n_clusters']} clusters x {len(model_metadata['model_features'])} features")
+    elif command == "verify":
+        report = verify_against_pickles()
+        status = "✅" if report["mismatches"] == 0 else "❌"
+        print(f"{status} {report['mismatches']} different assignments out of {report['n_users']} users")
+        print(f"📊 Load {report['load_us']} µs - predict {report['compact_predict_ms']} ms "
+              f"(pickles {report['pickled_predict_ms']} ms) - clusters {report['cluster_distribution']}")
+    else:
+        print(f"Unknown command {command}, use 'export' or 'verify'")
+        sys.exit(1)
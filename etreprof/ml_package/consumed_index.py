@@ -0,0 +1,187 @@
+"""
+Per-user index of the contents already consumed, to stop recommending them.
+
+The index is built from the content consultations that main_contents_usage counts (page
+views of contents, downloads of guides and tools). Content ids are factorized, and the
+consumed contents of every user are stored as one sorted int32 array of content codes,
+all users concatenated with an offsets array (CSR layout):
+
+- user_ids.npy    : int64 sorted ids of the users with at least one consultation
+- offsets.npy     : int64, the contents of the i-th user are contents[offsets[i]:offsets[i+1]]
+- contents.npy    : int32 content codes, sorted within each user
+- content_ids.npy : int64 content id of each code
+- meta.json       : build timestamp and sizes (written last)
+
+The arrays are memory-mapped: a lookup is a binary search and one slice read, and only
+the pages touched are loaded. On disk and in the page cache, a user takes
+16 bytes + 4 bytes per distinct content consumed.
+"""
+import os
+import json
+import numpy as np
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+from .artifacts import artifact_manager, ArtifactError
+from etreprof.data_processing.interactions import prepare_interactions, MISSING_CONTENT_ID
+from etreprof.data_processing.user_contents import consultation_mask
+
+ROOT_PATH = os.path.dirname(os.path.abspath(__file__))
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(ROOT_PATH)), 'data')
+CONSUMED_INDEX_PATH = os.getenv("CONSUMED_INDEX_DIR", os.path.join(DATA_PATH, 'consumed_index'))
+ARRAYS = ['user_ids', 'offsets', 'contents', 'content_ids']
+
+
+def build_consumed_index(df_interactions, output_dir: str = CONSUMED_INDEX_PATH) -> Dict[str, Any]:
+    """
+    Build the consumed contents index from the interactions and write it to output_dir.
+
+    Parameters
+    ----------
+    df_interactions : pandas.DataFrame or PreparedInteractions
+        Interactions with 'user_id', 'type', 'content_type', 'content_id' and 'created_at'.
+    output_dir : str
+        Directory where the index is written.
+
+    Returns
+    -------
+    Dict[str, Any]: The content of meta.json.
+    """
+    interactions = prepare_interactions(df_interactions)
+    frame = interactions.frame
+    content_ids = frame['content_id'].to_numpy()
+    consumed = consultation_mask(interactions) & (content_ids != MISSING_CONTENT_ID)
+
+    content_values, content_codes = np.unique(content_ids[consumed], return_inverse=True)
+    n_contents = max(len(content_values), 1)
+    # Distinct (user, content) pairs, sorted by user then content code
+    pairs = np.unique(frame['user_code'].to_numpy()[consumed].astype(np.int64) * n_contents + content_codes)
+    pair_users = pairs // n_contents
+    user_codes, counts = np.unique(pair_users, return_counts=True)
+
+    arrays = {
+        'user_ids': np.asarray(interactions.user_ids[user_codes], dtype=np.int64),
+        'offsets': np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+        'contents': (pairs % n_contents).astype(np.int32),
+        'content_ids': content_values.astype(np.int64)
+    }
+
+    os.makedirs(output_dir, exist_ok=True)
+    for name, array in arrays.items():
+        tmp_path = os.path.join(output_dir, f'.{name}.npy.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp_path, os.path.join(output_dir, f'{name}.npy'))
+
+    meta = {
+        "generated_at": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        "n_users": int(len(arrays['user_ids'])),
+        "n_contents": int(len(arrays['content_ids'])),
+        "n_pairs": int(len(arrays['contents'])),
+        "bytes": int(sum(array.nbytes for array in arrays.values()))
+    }
+    tmp_path = os.path.join(output_dir, '.meta.json.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(output_dir, 'meta.json'))
+    return meta
+
+
+def read_consumed_index(index_dir: str = CONSUMED_INDEX_PATH) -> Optional[Dict[str, Any]]:
+    """
+    Open the index with memory-mapped arrays, or None if it has not been built.
+    """
+    meta_path = os.path.join(index_dir, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    index = {name: np.load(os.path.join(index_dir, f'{name}.npy'), mmap_mode='r') for name in ARRAYS}
+    return {**index, "meta": meta}
+
+artifact_manager.register(
+    "consumed_index",
+    paths=lambda: [os.path.join(CONSUMED_INDEX_PATH, 'meta.json')],
+    load=read_consumed_index
+)
+
+
+def load_consumed_index() -> Optional[Dict[str, Any]]:
+    """
+    Get the active index, or None if it has not been built or cannot be loaded (the
+    recommendations then exclude nothing).
+    It is loaded once and swapped when it is rebuilt (see artifacts.py).
+    """
+    try:
+        return artifact_manager.get("consumed_index")
+    except ArtifactError as e:
+        print(f"❌ Erreur lors du chargement: {e}")
+        return None
+
+
+def consumed_contents(user_id: int) -> np.ndarray:
+    """
+    Sorted content ids already consumed by a user (empty without index or consultation).
+    """
+    index = load_consumed_index()
+    if index is None or len(index["user_ids"]) == 0:
+        return np.array([], dtype=np.int64)
+    position = int(np.searchsorted(index["user_ids"], user_id))
+    if position >= len(index["user_ids"]) or index["user_ids"][position] != user_id:
+        return np.array([], dtype=np.int64)
+    codes = index["contents"][index["offsets"][position]:index["offsets"][position + 1]]
+    return np.asarray(index["content_ids"])[codes]
+
+
+def consumed_in_pools(user_ids, user_pools, pool_content_ids: List[List[int]]) -> np.ndarray:
+    """
+    Whether each user already consumed one of the contents of its pool, for recommendations
+    shared by many users (False for every user without index).
+
+    Parameters
+    ----------
+    user_ids : array-like
+        The users.
+    user_pools : array-like
+        Pool of each user, a position in pool_content_ids.
+    pool_content_ids : List[List[int]]
+        Content ids of each pool.
+
+    Returns
+    -------
+    numpy.ndarray: One boolean per user.
+    """
+    user_ids = np.asarray(user_ids, dtype=np.int64)
+    affected = np.zeros(len(user_ids), dtype=bool)
+    index = load_consumed_index()
+    if index is None or len(index["user_ids"]) == 0 or len(user_ids) == 0:
+        return affected
+
+    # Content ids of the pools, one row per pool (padded with ids no content has)
+    width = max([len(content_ids) for content_ids in pool_content_ids] + [1])
+    pools = np.full((len(pool_content_ids), width), MISSING_CONTENT_ID, dtype=np.int64)
+    for row, content_ids in enumerate(pool_content_ids):
+        pools[row, :len(content_ids)] = content_ids
+
+    # Consumed contents of the users of the index, one row per (user, content) pair
+    positions = np.minimum(np.searchsorted(index["user_ids"], user_ids), len(index["user_ids"]) - 1)
+    users = np.flatnonzero(index["user_ids"][positions] == user_ids)
+    starts = np.asarray(index["offsets"])[positions[users]]
+    lengths = np.asarray(index["offsets"])[positions[users] + 1] - starts
+    pair_users = np.repeat(users, lengths)
+    pair_positions = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(lengths.sum())
+    pair_contents = np.asarray(index["content_ids"])[np.asarray(index["contents"])[pair_positions]]
+
+    pool_rows = pools[np.asarray(user_pools)[pair_users]]
+    affected[pair_users[(pool_rows == pair_contents[:, None]).any(axis=1)]] = True
+    return affected
+
+
+if __name__ == "__main__":
+    import pandas as pd
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    df_interactions = pd.read_csv(os.getenv("INTERACTIONS_URL_DB"), low_memory=False)
+    meta = build_consumed_index(df_interactions)
+    print(f"✅ Index des contenus consultés généré dans {CONSUMED_INDEX_PATH}")
+    print(f"📊 {meta['n_users']} utilisateurs, {meta['n_pairs']} contenus consultés, {meta['bytes'] / 1e6:.1f} Mo")
@@ -0,0 +1,379 @@
+"""
+On-disk index of content embeddings for "similar content" queries.
+
+The index directory holds raw, memory-mapped arrays that stay row-aligned:
+- ids.i64        : content ids, sorted
+- embeddings.f16 : L2-normalized embeddings, float16 (n_contents x dim)
+- types.u8       : content type codes (names in meta.json)
+- ivf_lists.i32  : optional IVF list of each row, with ivf_centroids.npy
+- meta.json      : sizes, type names and update time (written last)
+
+New contents with ids above the current maximum are appended in place,
+anything else (edited or out-of-order contents) rewrites the arrays and
+rebuilds the IVF lists.
+
+Usage:
+    python -m etreprof.ml_package.content_index build --input raw_data/contents_v3.csv [--ivf]
+    python -m etreprof.ml_package.content_index append --input raw_data/new_contents.csv
+"""
+import os
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
+from .preprocessing import clean_markdown
+from .recommender import build_url
+
+ROOT_PATH = os.path.dirname(os.path.abspath(__file__))
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(ROOT_PATH)), 'data')
+CONTENT_INDEX_PATH = os.getenv("CONTENT_INDEX_DIR", os.path.join(DATA_PATH, 'content_index'))
+
+# Below this size an exact scan is fast enough and the IVF lists are not used
+IVF_MIN_CONTENTS = 20_000
+SEARCH_BLOCK_ROWS = 16_384
+
+_INDEX_CACHE = {"path": None, "mtime": None, "index": None}
+
+
+def _normalize(embeddings: np.ndarray) -> np.ndarray:
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return (embeddings / np.where(norms == 0, 1, norms)).astype(np.float16)
+
+
+def _read_meta(index_dir: str) -> Optional[Dict[str, Any]]:
+    meta_path = os.path.join(index_dir, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_meta(index_dir: str, meta: Dict[str, Any]):
+    meta["updated_at"] = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    tmp_path = os.path.join(index_dir, '.meta.json.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(index_dir, 'meta.json'))
+
+
+def _encode_types(types, type_names: list) -> np.ndarray:
+    for content_type in types:
+        if content_type not in type_names:
+            type_names.append(content_type)
+    return np.array([type_names.index(t) for t in types], dtype=np.uint8)
+
+
+def _assign_lists(centroids: np.ndarray, embeddings: np.ndarray) -> np.ndarray:
+    assignments = np.empty(len(embeddings), dtype=np.int32)
+    for start in range(0, len(embeddings), SEARCH_BLOCK_ROWS):
+        block = np.asarray(embeddings[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+        assignments[start:start + SEARCH_BLOCK_ROWS] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+def write_content_index(ids, embeddings, types, index_dir: str = CONTENT_INDEX_PATH,
+                        type_names: Optional[list] = None) -> Dict[str, Any]:
+    """
+    Write a complete index, sorted by content id. Any IVF lists are dropped.
+
+    Parameters
+    ----------
+    ids : array-like of int
+        Content ids (unique).
+    embeddings : numpy.ndarray
+        Content embeddings (n_contents x dim), normalized before storage.
+    types : array-like of str
+        Content types, used to build the content urls.
+    index_dir : str
+        Directory of the index.
+
+    Returns
+    -------
+    Dict[str, Any]: The index metadata.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    ids = np.asarray(ids, dtype=np.int64)
+    order = np.argsort(ids, kind='stable')
+    if len(ids) > 1 and np.any(np.diff(ids[order]) == 0):
+        raise ValueError("Content ids must be unique")
+
+    type_names = list(type_names or [])
+    arrays = {
+        'ids.i64': ids[order],
+        'embeddings.f16': _normalize(embeddings)[order],
+        'types.u8': _encode_types(list(types), type_names)[order]
+    }
+    for filename, array in arrays.items():
+        tmp_path = os.path.join(index_dir, f'.{filename}.tmp')
+        array.tofile(tmp_path)
+        os.replace(tmp_path, os.path.join(index_dir, filename))
+
+    for filename in ['ivf_lists.i32', 'ivf_centroids.npy']:
+        if os.path.exists(os.path.join(index_dir, filename)):
+            os.remove(os.path.join(index_dir, filename))
+
+    meta = {"n_contents": int(len(ids)), "dim": int(arrays['embeddings.f16'].shape[1]),
+            "types": type_names, "ivf_lists": None}
+    _write_meta(index_dir, meta)
+    return meta
+
+
+def append_content_index(ids, embeddings, types, index_dir: str = CONTENT_INDEX_PATH) -> Dict[str, Any]:
+    """
+    Add new contents to an existing index.
+
+    Contents whose ids are all above the current maximum are appended at the end of
+    the files (and assigned to their nearest IVF list), so existing rows are not
+    rewritten. Otherwise the index is merged and rewritten, new embeddings replacing
+    the ones of existing ids.
+    """
+    meta = _read_meta(index_dir)
+    if meta is None:
+        return write_content_index(ids, embeddings, types, index_dir)
+
+    ids = np.asarray(ids, dtype=np.int64)
+    order = np.argsort(ids, kind='stable')
+    ids = ids[order]
+    embeddings = _normalize(embeddings)[order]
+    types = [list(types)[i] for i in order]
+
+    current = load_content_index(index_dir)
+    is_append = len(ids) > 0 and (current["n_contents"] == 0 or ids[0] > current["ids"][-1]) \
+        and not np.any(np.diff(ids) == 0)
+
+    if not is_append:
+        keep = ~np.isin(current["ids"], ids)
+        merged_ids = np.concatenate([current["ids"][keep], ids])
+        merged_embeddings = np.concatenate([np.asarray(current["embeddings"][keep]), embeddings])
+        merged_types = [meta["types"][code] for code in current["types"][keep]] + types
+        new_meta = write_content_index(merged_ids, merged_embeddings, merged_types, index_dir, meta["types"])
+        if meta["ivf_lists"]:
+            new_meta = build_ivf(index_dir, n_lists=meta["ivf_lists"])
+        return new_meta
+
+    type_codes = _encode_types(types, meta["types"])
+    additions = {'ids.i64': ids, 'embeddings.f16': embeddings, 'types.u8': type_codes}
+    if meta["ivf_lists"]:
+        centroids = np.load(os.path.join(index_dir, 'ivf_centroids.npy'))
+        additions['ivf_lists.i32'] = _assign_lists(centroids, embeddings)
+
+    # Files are only extended: readers use n_contents from meta.json, updated last.
+    # Bytes left by an interrupted append are truncated first.
+    for filename, array in additions.items():
+        row_bytes = array.itemsize * (array.shape[1] if array.ndim == 2 else 1)
+        with open(os.path.join(index_dir, filename), 'r+b') as f:
+            f.truncate(meta["n_contents"] * row_bytes)
+            f.seek(0, os.SEEK_END)
+            array.tofile(f)
+
+    meta["n_contents"] += int(len(ids))
+    _write_meta(index_dir, meta)
+    return meta
+
+
+def build_ivf(index_dir: str = CONTENT_INDEX_PATH, n_lists: Optional[int] = None,
+              max_training_rows: int = 50_000, seed: int = 42) -> Dict[str, Any]:
+    """
+    Build the approximate (IVF) index: k-means centroids over the embeddings and the
+    list of every row. Queries then only scan the rows of the closest lists.
+    """
+    from sklearn.cluster import MiniBatchKMeans
+
+    index = load_content_index(index_dir)
+    n_contents = index["n_contents"]
+    n_lists = n_lists or max(1, int(np.sqrt(n_contents)))
+
+    rng = np.random.default_rng(seed)
+    sample = np.sort(rng.choice(n_contents, size=min(n_contents, max_training_rows), replace=False))
+    kmeans = MiniBatchKMeans(n_clusters=n_lists, random_state=seed, n_init=3, batch_size=4096)
+    kmeans.fit(np.asarray(index["embeddings"][sample], dtype=np.float32))
+    centroids = _normalize(kmeans.cluster_centers_).astype(np.float32)
+
+    np.save(os.path.join(index_dir, 'ivf_centroids.npy'), centroids)
+    tmp_path = os.path.join(index_dir, '.ivf_lists.i32.tmp')
+    _assign_lists(centroids, index["embeddings"]).tofile(tmp_path)
+    os.replace(tmp_path, os.path.join(index_dir, 'ivf_lists.i32'))
+
+    meta = _read_meta(index_dir)
+    meta["ivf_lists"] = n_lists
+    _write_meta(index_dir, meta)
+    return meta
+
+
+def load_content_index(index_dir: str = CONTENT_INDEX_PATH) -> Optional[Dict[str, Any]]:
+    """
+    Memory-map the index. It is cached and reloaded only when meta.json changes.
+    Returns None if the index has not been built.
+    """
+    meta_path = os.path.join(index_dir, 'meta.json')
+    try:
+        mtime = os.stat(meta_path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    if _INDEX_CACHE["path"] == index_dir and _INDEX_CACHE["mtime"] == mtime:
+        return _INDEX_CACHE["index"]
+
+    meta = _read_meta(index_dir)
+    n, dim = meta["n_contents"], meta["dim"]
+
+    def memmap(filename, dtype, shape):
+        if n == 0:
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(os.path.join(index_dir, filename), dtype=dtype, mode='r', shape=shape)
+
+    index = {
+        "meta": meta,
+        "n_contents": n,
+        "ids": memmap('ids.i64', np.int64, (n,)),
+        "embeddings": memmap('embeddings.f16', np.float16, (n, dim)),
+        "types": memmap('types.u8', np.uint8, (n,)),
+        "ivf": None
+    }
+
+    if meta["ivf_lists"]:
+        lists = memmap('ivf_lists.i32', np.int32, (n,))
+        # Inverted lists: rows grouped by list, with the offset of every list
+        rows = np.argsort(lists, kind='stable').astype(np.int64)
+        offsets = np.searchsorted(lists[rows], np.arange(meta["ivf_lists"] + 1))
+        index["ivf"] = {
+            "centroids": np.load(os.path.join(index_dir, 'ivf_centroids.npy')),
+            "rows": rows,
+            "offsets": offsets
+        }
+
+    _INDEX_CACHE.update({"path": index_dir, "mtime": mtime, "index": index})
+    return index
+
+
+def search_index(index: Dict[str, Any], query: np.ndarray, k: int = 10, n_probe: int = 8,
+                 exact: Optional[bool] = None, exclude_row: Optional[int] = None):
+    """
+    Return the rows and cosine similarities of the k contents closest to the query.
+
+    Uses the IVF lists when they exist and the index holds at least IVF_MIN_CONTENTS
+    contents (unless exact is given), scanning the n_probe closest lists only.
+    """
+    query = np.asarray(query, dtype=np.float32).ravel()
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+    embeddings = index["embeddings"]
+
+    if exact is None:
+        exact = index["ivf"] is None or index["n_contents"] < IVF_MIN_CONTENTS
+
+    if exact:
+        candidates = None
+        scores = np.empty(index["n_contents"], dtype=np.float32)
+        for start in range(0, index["n_contents"], SEARCH_BLOCK_ROWS):
+            block = np.asarray(embeddings[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+            scores[start:start + SEARCH_BLOCK_ROWS] = block @ query
+    else:
+        ivf = index["ivf"]
+        probes = np.argsort(-(ivf["centroids"] @ query))[:n_probe]
+        candidates = np.sort(np.concatenate(
+            [ivf["rows"][ivf["offsets"][p]:ivf["offsets"][p + 1]] for p in probes]
+        ))
+        scores = np.asarray(embeddings[candidates], dtype=np.float32) @ query
+
+    if exclude_row is not None:
+        if candidates is None:
+            scores[exclude_row] = -np.inf
+        else:
+            scores[candidates == exclude_row] = -np.inf
+
+    k = min(k, len(scores) - (1 if exclude_row is not None else 0))
+    if k <= 0:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top], kind='stable')]
+    rows = top if candidates is None else candidates[top]
+    return rows, scores[top]
+
+
+def find_similar_contents(content_id: int, k: int = 10, index_dir: str = CONTENT_INDEX_PATH) -> Dict[str, Any]:
+    """
+    Find the contents closest to an indexed content.
+
+    Parameters
+    ----------
+    content_id : int
+        The id of the reference content.
+    k : int
+        The number of similar contents to return (default is 10).
+
+    Returns
+    -------
+    Dict[str, Any]: The similar contents with their url and similarity, or an error message.
+    """
+    index = load_content_index(index_dir)
+    if index is None:
+        return {"error": "Content index not built"}
+
+    row = int(np.searchsorted(index["ids"], content_id))
+    if row >= index["n_contents"] or index["ids"][row] != content_id:
+        return {"error": f"Content {content_id} not found in the index"}
+
+    rows, scores = search_index(index, index["embeddings"][row], k=k, exclude_row=row)
+    type_names = index["meta"]["types"]
+
+    similar = []
+    for similar_row, score in zip(rows, scores):
+        similar_id = int(index["ids"][similar_row])
+        content_type = type_names[int(index["types"][similar_row])]
+        similar.append({
+            "id": similar_id,
+            "type": content_type,
+            "url": build_url(similar_id, content_type),
+            "similarity": round(float(score), 4)
+        })
+
+    return {
+        "content_id": content_id,
+        "similar_contents": similar,
+        "index_updated_at": index["meta"]["updated_at"]
+    }
+
+
+def encode_contents(df_contents: pd.DataFrame, encoder, batch_size: int = 32):
+    """
+    Clean and encode the markdown of a contents table.
+    Returns the ids, embeddings and types of the contents with usable text.
+    """
+    documents = df_contents['markdown'].apply(clean_markdown)
+    df_valid = df_contents[documents != '']
+    embeddings = encoder.encode(documents[documents != ''].tolist(), batch_size=batch_size,
+                                show_progress_bar=True, normalize_embeddings=True)
+    return df_valid['id'].astype(np.int64).values, embeddings, df_valid['type'].tolist()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or extend the content embeddings index")
+    parser.add_argument('command', choices=['build', 'append', 'ivf'])
+    parser.add_argument('--input', help="Contents CSV with 'id', 'type' and 'markdown' (build and append)")
+    parser.add_argument('--output', default=CONTENT_INDEX_PATH, help="Index directory")
+    parser.add_argument('--ivf', action='store_true', help="Also build the approximate index after building")
+    parser.add_argument('--n-lists', type=int, help="Number of IVF lists (default: sqrt of the number of contents)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command in ['build', 'append']:
+        if args.input is None:
+            parser.error("--input is required for build and append")
+        from .models import load_embedding_model
+
+        df_contents = pd.read_csv(args.input, usecols=['id', 'type', 'markdown'])
+        ids, embeddings, types = encode_contents(df_contents, load_embedding_model())
+        if args.command == 'build':
+            meta = write_content_index(ids, embeddings, types, args.output)
+        else:
+            meta = append_content_index(ids, embeddings, types, args.output)
+        print(f"✅ {len(ids)} contents indexed - {meta['n_contents']} in the index")
+
+    if args.command == 'ivf' or args.ivf:
+        meta = build_ivf(args.output, n_lists=args.n_lists)
+        print(f"✅ Approximate index built with {meta['ivf_lists']} lists")
+
+    print(f"⏱️ Done in {time.perf_counter() - start:.1f} s")
@@ -1,75 +1,330 @@
 import os
+import time
 import pickle
+import numpy as np
 import pandas as pd
-from typing import Dict
-from bertopic import BERTopic
-from sentence_transformers import SentenceTransformer
+from typing import Dict, List, Optional
 import json
-from .recommender import generate_simple_recommendations
+from .preprocessing import clean_markdown
+from .artifacts import artifact_manager, ArtifactError
+from .clustering_export import model_features
+from .recommender import generate_simple_recommendations, replace_consumed_recommendations, NUM_REPLACEMENTS
+from .reco_table import (
+    get_user_recommendations, load_reco_table, get_segment_recommendations, NIVEAUX, N_LEVEL_MASKS
+)
+from .ranking import generate_personalized_recommendations
+from .consumed_index import consumed_contents, consumed_in_pools
+from .topic_index import lookup_content_topic
 
 ROOT_PATH = os.path.dirname(os.path.abspath(__file__))
-
-# Content classification function
-def classify_content(content: str) -> Dict:
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(ROOT_PATH)), 'data')
+USER_ASSIGNMENTS_PATH = os.getenv("USER_ASSIGNMENTS_PATH", os.path.join(DATA_PATH, 'user_cluster_assignments.csv'))
+BERTOPIC_PATH = os.path.join(ROOT_PATH, 'pickles/bertopic')
+EMBEDDING_MODEL_NAME = 'intfloat/multilingual-e5-large-instruct'
+
+PRIORITY_CHALLENGES = ['transition_ecologique', 'sante_mentale', 'ecole_inclusive', 'cps', 'reussite_tous_eleves']
+# Class names of defi_model.pkl that differ from the contents table columns
+DEFI_CLASS_TO_CHALLENGE = {'competences_psychosociales': 'cps'}
+# Fitted vectorizer of the defi and theme classifiers. It is not packaged, and the shipped
+# defi_model.pkl and theme_model.pkl are uniform DummyClassifier placeholders: until both
+# are replaced by the trained models, defi, priority_challenges and theme are returned as
+# null with "content_classifiers": "unavailable".
+CONTENT_VECTORIZER_PATH = os.path.join(ROOT_PATH, 'pickles/content_vectorizer.pkl')
+
+# The encoder and the classifiers take seconds to load, keep them once loaded
+# (the BERTopic model is a hot-swappable artifact, see artifacts.py).
+# bertopic and sentence_transformers (torch, UMAP, HDBSCAN) are only imported
+# by the loaders, so that importing this module stays cheap.
+_EMBEDDING_MODEL = None
+_CONTENT_CLASSIFIERS = None
+_CONTENT_CLASSIFIERS_LOADED = False
+
+def load_embedding_model():
     """
-    Classify content using BERTopic model trained by Guillaume
-    Returns top 3 topics with confidence scores.
-    Parameters
-    ----------
-    content : str
-        The content to classify.
+    Load the sentence encoder, once per process.
     Returns
     -------
-    Dict
-        A dictionary with the main topic ID, label, and confidence score.
+    SentenceTransformer
+        The multilingual e5 encoder used by the topic model.
+    """
+    global _EMBEDDING_MODEL
+    if _EMBEDDING_MODEL is None:
+        from sentence_transformers import SentenceTransformer
+        _EMBEDDING_MODEL = SentenceTransformer(EMBEDDING_MODEL_NAME, device='cpu')
+    return _EMBEDDING_MODEL
+
+def read_topic_model():
+    """
+    Read the BERTopic model, with the shared sentence encoder, and its topic labels
+    (without the "<id>_" prefix) from BERTOPIC_PATH.
     """
-    bertopic_path = os.path.join(ROOT_PATH, 'pickles/bertopic')
-    topics_json_path = os.path.join(bertopic_path, 'topics.json')
+    from bertopic import BERTopic
 
-    # Load topics.json to get topic labels
-    with open(topics_json_path, 'r', encoding='utf-8') as f:
+    topic_model = BERTopic.load(BERTOPIC_PATH, embedding_model=load_embedding_model())
+    with open(os.path.join(BERTOPIC_PATH, 'topics.json'), 'r', encoding='utf-8') as f:
         topics_data = json.load(f)
+    topic_labels = {
+        topic_id: label.split("_", 1)[1] if "_" in label else label
+        for topic_id, label in topics_data['topic_labels'].items()
+    }
+    return topic_model, topic_labels
 
-    topic_labels = topics_data['topic_labels']
+def validate_topic_model(artifact):
+    """
+    Check that the topic embeddings and the labels describe the same topics.
+    """
+    topic_model, topic_labels = artifact
+    n_topics = len(topic_model.topic_embeddings_)
+    if len(topic_labels) != n_topics:
+        raise ArtifactError(f"{len(topic_labels)} topic labels for {n_topics} topic embeddings")
 
-    # Load the model
-    embedding_model = SentenceTransformer('intfloat/multilingual-e5-large-instruct', device='cpu')
-    topic_model = BERTopic.load(bertopic_path, embedding_model=embedding_model)
+artifact_manager.register("topic_model", paths=lambda: [BERTOPIC_PATH], load=read_topic_model,
+                          validate=validate_topic_model)
 
-    # Prediction
-    topics, scores = topic_model.transform([content])
+def load_topic_model():
+    """
+    Get the active BERTopic model with the shared sentence encoder.
+    The model is loaded once and swapped when its files change (see artifacts.py).
+    Returns
+    -------
+    BERTopic
+        The topic model with its embedding model attached.
+    """
+    return artifact_manager.get("topic_model")[0]
 
-    # Topic principal (le seul assigné par BERTopic)
-    main_topic_id = topics[0]
-    main_confidence = float(scores[0][main_topic_id])  # Similarité du topic assigné
+def load_topic_labels():
+    """
+    Get the topic labels of the active BERTopic model, without the "<id>_" prefix.
+    Returns
+    -------
+    Dict
+        Topic labels by topic ID (as string).
+    """
+    return artifact_manager.get("topic_model")[1]
 
-    # Label du topic principal
-    main_topic_label = topic_labels.get(str(main_topic_id), f"Topic {main_topic_id}")
-    if "_" in main_topic_label:
-        main_topic_label = main_topic_label.split("_", 1)[1]
+def read_content_classifiers():
+    """
+    Read the priority challenge (defi) and theme classifiers with the fitted vectorizer
+    that turns cleaned documents into their input features.
+    Returns
+    -------
+    Tuple or None
+        The defi model, the theme model and the vectorizer, or None when the classifiers
+        cannot classify a content (see CONTENT_VECTORIZER_PATH).
+    """
+    if not os.path.exists(CONTENT_VECTORIZER_PATH):
+        return None
+    with open(CONTENT_VECTORIZER_PATH, 'rb') as f:
+        vectorizer = pickle.load(f)
+    with open(os.path.join(ROOT_PATH, 'pickles/defi_model.pkl'), 'rb') as f:
+        defi_model = pickle.load(f)
+    with open(os.path.join(ROOT_PATH, 'pickles/theme_model.pkl'), 'rb') as f:
+        theme_model = pickle.load(f)
+
+    from sklearn.dummy import DummyClassifier
+    if isinstance(defi_model, DummyClassifier) or isinstance(theme_model, DummyClassifier):
+        return None
+    n_features = len(vectorizer.get_feature_names_out())
+    if defi_model.n_features_in_ != n_features or theme_model.n_features_in_ != n_features:
+        raise ValueError(f"The vectorizer has {n_features} features, the defi and theme models expect "
+                         f"{defi_model.n_features_in_} and {theme_model.n_features_in_}")
+    return defi_model, theme_model, vectorizer
+
+def load_content_classifiers():
+    """
+    Load the priority challenge (defi) and theme classifiers, once per process.
+    Returns
+    -------
+    Tuple or None
+        The defi model, the theme model and their vectorizer, or None when they are unavailable.
+    """
+    global _CONTENT_CLASSIFIERS, _CONTENT_CLASSIFIERS_LOADED
+    if not _CONTENT_CLASSIFIERS_LOADED:
+        _CONTENT_CLASSIFIERS = read_content_classifiers()
+        _CONTENT_CLASSIFIERS_LOADED = True
+    return _CONTENT_CLASSIFIERS
 
-    return {
-        "topic_principal": {
-            "id": int(main_topic_id),
-            "label": main_topic_label,
-            "confidence": round(main_confidence * 100, 1)
+def warmup_classification():
+    """
+    Load every classification model ahead of the first /classify request.
+    Returns
+    -------
+    float
+        The loading time in seconds.
+    """
+    start = time.perf_counter()
+    load_topic_model()
+    load_content_classifiers()
+    return time.perf_counter() - start
+
+# Content classification function
+def classify_contents(contents: List[str], content_ids: Optional[List[Optional[int]]] = None) -> Dict:
+    """
+    Classify a batch of contents: BERTopic topic, priority challenges and theme.
+    The markdown is cleaned once and shared by the three models, and the sparse
+    features are computed once for the whole batch. Without trained defi and theme
+    classifiers (see CONTENT_VECTORIZER_PATH) only the topic is classified.
+    Contents given with their id take their stored topic from the topic index when their
+    markdown did not change (see topic_index.py): the encoder and BERTopic only run on the
+    others, and are not even loaded when every content is found.
+    Parameters
+    ----------
+    contents : List[str]
+        The markdown contents to classify.
+    content_ids : List[Optional[int]], optional
+        The id of each content on the platform (None for a new content).
+    Returns
+    -------
+    Dict
+        "results": one classification per content (see classify_content),
+        "timings_ms": time spent in each component for the whole batch.
+    """
+    timings = {}
+
+    start = time.perf_counter()
+    lookups = [None] * len(contents)
+    if content_ids is not None:
+        lookups = [lookup_content_topic(content_id, content) if content_id is not None else None
+                   for content, content_id in zip(contents, content_ids)]
+    timings["index_lookup"] = time.perf_counter() - start
+    to_model = [i for i, lookup in enumerate(lookups) if lookup is None or lookup["status"] != "hit"]
+
+    start = time.perf_counter()
+    # Model and labels of the same version, even if a new one is swapped in meanwhile
+    topic_model, topic_labels = artifact_manager.get("topic_model") if to_model else (None, {})
+    content_classifiers = load_content_classifiers()
+    timings["model_loading"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    # Texts too short for the cleaner are classified as they are
+    documents = [clean_markdown(content) or str(content).strip() for content in contents]
+    timings["preprocessing"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    topics, scores = {}, {}
+    if to_model:
+        model_topics, model_scores = topic_model.transform([documents[i] for i in to_model])
+        topics = dict(zip(to_model, model_topics))
+        scores = dict(zip(to_model, model_scores))
+    timings["topic"] = time.perf_counter() - start
+
+    if content_classifiers is not None:
+        defi_model, theme_model, vectorizer = content_classifiers
+
+        start = time.perf_counter()
+        features = vectorizer.transform(documents)
+        timings["features"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        defi_probas = defi_model.predict_proba(features)
+        timings["defi"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        theme_probas = theme_model.predict_proba(features)
+        timings["theme"] = time.perf_counter() - start
+
+        defi_classes = [DEFI_CLASS_TO_CHALLENGE.get(c, c) for c in defi_model.classes_]
+    results = []
+    for i in range(len(contents)):
+        if i in topics:
+            topic_id = topics[i]
+            main_confidence = float(scores[i][topic_id])  # Similarité du topic assigné
+            topic_principal = {
+                "id": int(topic_id),
+                "label": topic_labels.get(str(topic_id), f"Topic {topic_id}"),
+                "confidence": round(main_confidence * 100, 1)
+            }
+        else:
+            topic_principal = lookups[i]["topic_principal"]
+
+        result = {
+            "topic_principal": topic_principal,
+            "defi": None,
+            "priority_challenges": None,
+            "theme": None,
+            "content_classifiers": "unavailable",
+            "classification_path": "model" if i in topics else "index"
         }
+        if content_classifiers is not None:
+            challenges = {}
+            for challenge in PRIORITY_CHALLENGES:
+                probability = float(defi_probas[i][defi_classes.index(challenge)]) if challenge in defi_classes else 0.0
+                challenges[challenge] = {"probability": round(probability * 100, 1)}
+            predicted_defi = defi_classes[int(np.argmax(defi_probas[i]))]
+            for challenge in PRIORITY_CHALLENGES:
+                challenges[challenge]["predicted"] = challenge == predicted_defi
+
+            theme_index = int(np.argmax(theme_probas[i]))
+
+            result.update({
+                "defi": predicted_defi if predicted_defi in PRIORITY_CHALLENGES else None,
+                "priority_challenges": challenges,
+                "theme": {
+                    "label": str(theme_model.classes_[theme_index]),
+                    "confidence": round(float(theme_probas[i][theme_index]) * 100, 1)
+                },
+                "content_classifiers": "model"
+            })
+        if lookups[i] is not None:
+            result["index_lookup"] = lookups[i]["status"]
+        results.append(result)
+
+    return {
+        "results": results,
+        "timings_ms": {component: round(seconds * 1000, 2) for component, seconds in timings.items()}
     }
 
+def classify_content(content: str, content_id: Optional[int] = None) -> Dict:
+    """
+    Classify content using BERTopic model trained by Guillaume, and the priority
+    challenge and theme classifiers.
+    Parameters
+    ----------
+    content : str
+        The content to classify.
+    content_id : int, optional
+        The id of the content on the platform: its stored topic is used when its
+        markdown did not change since it was classified.
+    Returns
+    -------
+    Dict
+        A dictionary with the main topic ID, label, and confidence score, the predicted
+        priority challenge ("defi") with the prediction of each of the 5 challenges,
+        the theme ("content_classifiers" is "unavailable" and these three fields are
+        None while the trained classifiers are not packaged), the path taken for the topic ("index" or "model", with the
+        "index_lookup" status when an id is given) and the time spent in each component.
+    """
+    classification = classify_contents([content], [content_id] if content_id is not None else None)
+    return {**classification["results"][0], "timings_ms": classification["timings_ms"]}
+
 # User clustering functions
-def load_clustering_models():
+def clustering_artifact_paths() -> Dict[str, str]:
+    """
+    Paths of the files the clustering models and the cluster catalog are loaded from.
+    """
+    data_path = os.path.join(os.path.dirname(os.path.dirname(ROOT_PATH)), 'data')
+    return {
+        "kmeans": os.path.join(ROOT_PATH, 'pickles/kmeans_model.pkl'),
+        "scaler": os.path.join(ROOT_PATH, 'pickles/scaler_model.pkl'),
+        "metadata": os.path.join(ROOT_PATH, 'pickles/metadata.json'),
+        "profiles": os.path.join(data_path, 'cluster_profiles.csv'),
+        "personas": os.path.join(data_path, 'cluster_personas_lisibles.json')
+    }
+
+def read_clustering_artifacts():
     """
-    Load clustering models and metadata.
+    Read the clustering models, metadata, cluster profiles and personas from their files.
     Returns
     -------
     Tuple
         A tuple containing the KMeans model, scaler, metadata, cluster profiles, and personas.
     """
-    kmeans_path = os.path.join(ROOT_PATH, 'pickles/kmeans_model.pkl')
-    scaler_path = os.path.join(ROOT_PATH, 'pickles/scaler_model.pkl')
-    metadata_path = os.path.join(ROOT_PATH, 'pickles/metadata.json')
-    profiles_path = os.path.join(os.path.dirname(os.path.dirname(ROOT_PATH)), 'data/cluster_profiles.csv')
-    personas_path = os.path.join(os.path.dirname(os.path.dirname(ROOT_PATH)), 'data/cluster_personas_lisibles.json')
+    paths = clustering_artifact_paths()
+    kmeans_path = paths["kmeans"]
+    scaler_path = paths["scaler"]
+    metadata_path = paths["metadata"]
+    profiles_path = paths["profiles"]
+    personas_path = paths["personas"]
 
     # Load models
     with open(kmeans_path, 'rb') as f:
@@ -91,6 +346,55 @@ def load_clustering_models():
 
     return kmeans, scaler, metadata, profiles, personas
 
+def clustering_model_features(metadata: Dict) -> List[str]:
+    """
+    Names of the columns the scaler and the KMeans were fitted on (see clustering_export.model_features).
+    """
+    return model_features(metadata['features_used'], metadata.get('log_transformed_features', []))
+
+def validate_clustering_artifacts(artifacts):
+    """
+    Check that the clustering models, metadata and personas describe the same features and clusters.
+    """
+    kmeans, scaler, metadata, profiles, personas = artifacts
+    expected_features = clustering_model_features(metadata)
+
+    unknown_log_features = [f for f in metadata.get('log_transformed_features', []) if f not in metadata['features_used']]
+    if unknown_log_features:
+        raise ArtifactError(f"Log-transformed features not in features_used: {unknown_log_features}")
+
+    scaler_features = getattr(scaler, 'feature_names_in_', None)
+    if scaler_features is not None and list(scaler_features) != expected_features:
+        raise ArtifactError(f"Scaler features {list(scaler_features)} do not match metadata {expected_features}")
+    if scaler.n_features_in_ != len(expected_features):
+        raise ArtifactError(f"Scaler expects {scaler.n_features_in_} features, metadata lists {len(expected_features)}")
+    if kmeans.cluster_centers_.shape[1] != len(expected_features):
+        raise ArtifactError(f"KMeans expects {kmeans.cluster_centers_.shape[1]} features, metadata lists {len(expected_features)}")
+    if kmeans.n_clusters != metadata.get('n_clusters', kmeans.n_clusters):
+        raise ArtifactError(f"KMeans has {kmeans.n_clusters} clusters, metadata says {metadata['n_clusters']}")
+
+    missing_personas = [k for k in range(kmeans.n_clusters) if str(k) not in personas]
+    if missing_personas:
+        raise ArtifactError(f"No persona for clusters {missing_personas}")
+
+artifact_manager.register(
+    "clustering",
+    paths=lambda: list(clustering_artifact_paths().values()),
+    load=read_clustering_artifacts,
+    validate=validate_clustering_artifacts
+)
+
+def load_clustering_models():
+    """
+    Get the active clustering models and metadata.
+    They are loaded once and swapped when their files change (see artifacts.py).
+    Returns
+    -------
+    Tuple
+        A tuple containing the KMeans model, scaler, metadata, cluster profiles, and personas.
+    """
+    return artifact_manager.get("clustering")
+
 def get_cluster_info():
     """
     Get information about all 5 clusters with real data
@@ -145,11 +449,13 @@ def predict_user_clusters(df_users):
     if missing_features:
         raise ValueError(f"Missing required features for clustering: {missing_features}")
 
-    # Extract features in the correct order
-    X = df_users[features_used].copy()
-
     # Handle any missing values
-    X = X.fillna(0)
+    X = df_users[features_used].fillna(0)
+
+    # Same log transform and column order as during training
+    for feature in metadata.get('log_transformed_features', []):
+        X[f'{feature}_log'] = np.log1p(X.pop(feature))
+    X = X[clustering_model_features(metadata)]
 
     # Apply the same preprocessing as during training
     X_scaled = scaler.transform(X)
@@ -159,47 +465,243 @@ def predict_user_clusters(df_users):
 
     return clusters
 
-# Get user profile by ID
-def get_user_profile(user_id: int):
-    assignments_path = os.path.join(os.path.dirname(os.path.dirname(ROOT_PATH)), 'data/user_cluster_assignments.csv')
-    df_assignments = pd.read_csv(assignments_path)
+# User profiles
+def read_user_assignments():
+    """
+    Read the user cluster assignments as arrays sorted by user id, one row per user
+    (the first row of an id, as the lookup of a single profile did).
+    Returns
+    -------
+    Dict
+        'ids', 'clusters', 'level_masks' (one bit per level of NIVEAUX, maternelle = bit 0),
+        'anciennete', 'degre' (float, NaN when missing) and 'academie' (object, None when missing).
+    """
+    header = pd.read_csv(USER_ASSIGNMENTS_PATH, nrows=0).columns
+    columns = [c for c in ['id', 'cluster', 'anciennete', 'degre', 'academie'] + NIVEAUX if c in header]
+    df = pd.read_csv(USER_ASSIGNMENTS_PATH, usecols=columns)
+    df = df.dropna(subset=['id', 'cluster']).drop_duplicates(subset='id').sort_values('id', kind='stable')
+    df = df.reindex(columns=['id', 'cluster', 'anciennete', 'degre', 'academie'] + NIVEAUX)
+
+    level_masks = np.zeros(len(df), dtype=np.int64)
+    for bit, niveau in enumerate(NIVEAUX):
+        level_masks |= (df[niveau].fillna(0).values == 1).astype(np.int64) << bit
+
+    academie = df['academie'].astype(object)
+    return {
+        "ids": df['id'].values.astype(np.int64),
+        "clusters": df['cluster'].values.astype(np.int64),
+        "level_masks": level_masks,
+        "anciennete": pd.to_numeric(df['anciennete'], errors='coerce').values.astype(np.float64),
+        "degre": pd.to_numeric(df['degre'], errors='coerce').values.astype(np.float64),
+        "academie": academie.where(academie.notna(), None).values
+    }
+
+def validate_user_assignments(assignments):
+    """
+    Check that every assigned cluster exists.
+    """
+    unknown_clusters = np.setdiff1d(assignments["clusters"], np.arange(5))
+    if len(unknown_clusters):
+        raise ArtifactError(f"Unknown clusters in the assignments: {unknown_clusters.tolist()}")
+
+artifact_manager.register(
+    "user_assignments",
+    paths=lambda: [USER_ASSIGNMENTS_PATH],
+    load=read_user_assignments,
+    validate=validate_user_assignments
+)
+
+def load_user_assignments():
+    """
+    Get the active user cluster assignments.
+    They are loaded once and swapped when the file changes (see artifacts.py).
+    """
+    return artifact_manager.get("user_assignments")
+
+def find_user_positions(assignments, user_ids):
+    """
+    Vectorized binary search of user ids in the sorted assignment ids.
+    Returns
+    -------
+    Tuple
+        The position of every id in the assignments, and whether the id was found.
+    """
+    ids = assignments["ids"]
+    user_ids = np.asarray(user_ids, dtype=np.int64)
+    if len(ids) == 0:
+        return np.zeros(len(user_ids), dtype=np.int64), np.zeros(len(user_ids), dtype=bool)
+    positions = np.minimum(np.searchsorted(ids, user_ids), len(ids) - 1)
+    return positions, ids[positions] == user_ids
+
+def niveaux_from_mask(mask: int) -> List[str]:
+    """
+    Teaching levels of a level mask, in the order of NIVEAUX.
+    """
+    return [niveau for bit, niveau in enumerate(NIVEAUX) if mask >> bit & 1]
+
+def user_profile_fields(assignments, position: int, niveaux: List[str]) -> Dict:
+    anciennete = assignments["anciennete"][position]
+    degre = assignments["degre"][position]
+    academie = assignments["academie"][position]
+    return {
+        "anciennete": int(anciennete) if not np.isnan(anciennete) else None,
+        "degre": int(degre) if not np.isnan(degre) else None,
+        "academie": academie if academie is not None else "Non renseignée",
+        "niveaux_enseignes": niveaux
+    }
+
+def cluster_summary(cluster_info, cluster_id: int) -> Dict:
+    return {
+        "id": cluster_id,
+        "name": cluster_info[cluster_id]["name"],
+        "description": cluster_info[cluster_id]["description"]
+    }
 
-    user_data = df_assignments[df_assignments['id'] == user_id]
+def get_user_profile(user_id: int, mode: str = "cluster"):
+    """
+    Get the profile, cluster and recommendations of a user.
+    Parameters
+    ----------
+    user_id : int
+        The ID of the user.
+    mode : str
+        "cluster" for the cluster recommendations, "personalized" to rank contents
+        by the user's topic history (falls back to "cluster" without history).
+    Returns
+    -------
+    Dict
+        The user profile, or a dictionary with an error message.
+    """
+    assignments = load_user_assignments()
+    positions, found = find_user_positions(assignments, [user_id])
 
-    if user_data.empty:
+    if not found[0]:
         return {"error": f"User {user_id} not found"}
 
-    user_row = user_data.iloc[0]
-    cluster_id = int(user_row['cluster'])
+    position = int(positions[0])
+    cluster_id = int(assignments["clusters"][position])
+
+    cluster_info = get_cluster_info()
 
-    cluster_info = get_cluster_info()[cluster_id]
+    # Contents the user already consulted are not recommended again (see consumed_index.py)
+    consumed = consumed_contents(user_id)
 
-    recommendations = generate_simple_recommendations(cluster_id)
+    recommendations = None
+    if mode == "personalized":
+        recommendations = generate_personalized_recommendations(user_id, cluster_id, exclude_ids=consumed)
 
-    niveaux = []
-    if user_row.get('maternelle', 0) == 1:
-        niveaux.append('maternelle')
-    if user_row.get('elementaire', 0) == 1:
-        niveaux.append('elementaire')
-    if user_row.get('college', 0) == 1:
-        niveaux.append('college')
-    if user_row.get('lycee', 0) == 1:
-        niveaux.append('lycee')
-    if user_row.get('lycee_pro', 0) == 1:
-        niveaux.append('lycee_pro')
+    # Serve from the materialized table when it has been built, draw otherwise
+    if recommendations is None:
+        recommendations = get_user_recommendations(user_id)
+        if recommendations is not None and np.isin([r['id'] for r in recommendations['recommendations']], consumed).any():
+            recommendations = None
+    if recommendations is None:
+        recommendations = generate_simple_recommendations(cluster_id, exclude_ids=consumed)
+
+    niveaux = niveaux_from_mask(int(assignments["level_masks"][position]))
 
     return {
         "user_id": user_id,
-        "profile": {
-            "anciennete": int(user_row.get('anciennete', 0)) if pd.notna(user_row.get('anciennete')) else None,
-            "degre": int(user_row.get('degre', 0)) if pd.notna(user_row.get('degre')) else None,
-            "academie": user_row.get('academie') if pd.notna(user_row.get('academie')) else "Non renseignée",
-            "niveaux_enseignes": niveaux
-        },
-        "cluster": {
-            "id": cluster_id,
-            "name": cluster_info["name"],
-            "description": cluster_info["description"]
-        },
+        "profile": user_profile_fields(assignments, position, niveaux),
+        "cluster": cluster_summary(cluster_info, cluster_id),
         "recommendations": recommendations
     }
+
+def get_user_profiles(user_ids: List[int], include_recommendations: bool = True) -> Dict:
+    """
+    Get the profiles of several users at once (cluster recommendations only).
+
+    The ids are looked up with one binary search in the sorted assignments. The cluster
+    description, the level list and the recommendations are built once per (cluster, levels)
+    segment and shared by the profiles of that segment: recommendations come from the
+    materialized table (one row per segment) when it has been built, else from one draw
+    per cluster. The contents a user already consumed are replaced by contents of a larger
+    draw of the cluster, shared by the users of the cluster.
+    Parameters
+    ----------
+    user_ids : List[int]
+        The IDs of the users, duplicates are returned once.
+    include_recommendations : bool
+        Whether to add the recommendations to every profile (default is True).
+    Returns
+    -------
+    Dict
+        'profiles' in the order of the ids, and 'not_found' with the unknown ids.
+    """
+    assignments = load_user_assignments()
+    user_ids = pd.unique(np.asarray(user_ids, dtype=np.int64))
+    positions, found = find_user_positions(assignments, user_ids)
+
+    found_ids, positions = user_ids[found], positions[found]
+    clusters = assignments["clusters"][positions]
+    segments = clusters * N_LEVEL_MASKS + assignments["level_masks"][positions]
+
+    # Recommendation segment of each user in the materialized table, if any
+    table = load_reco_table() if include_recommendations else None
+    if table is not None and len(table["user_ids"]):
+        table_positions = np.minimum(np.searchsorted(table["user_ids"], found_ids), len(table["user_ids"]) - 1)
+        in_table = table["user_ids"][table_positions] == found_ids
+        table_segments = np.where(in_table, np.asarray(table["user_segments"])[table_positions], -1)
+    else:
+        table_segments = np.full(len(found_ids), -1)
+
+    cluster_info = get_cluster_info()
+    clusters_shared = {}
+    niveaux_shared = {}
+    recommendations_shared = {}
+    user_keys = []
+
+    profiles = []
+    for user_id, position, cluster_id, segment, table_segment in zip(
+            found_ids.tolist(), positions.tolist(), clusters.tolist(), segments.tolist(), table_segments.tolist()):
+        if segment not in niveaux_shared:
+            niveaux_shared[segment] = niveaux_from_mask(segment % N_LEVEL_MASKS)
+        if cluster_id not in clusters_shared:
+            clusters_shared[cluster_id] = cluster_summary(cluster_info, cluster_id)
+
+        profile = {
+            "user_id": user_id,
+            "profile": user_profile_fields(assignments, position, niveaux_shared[segment]),
+            "cluster": clusters_shared[cluster_id]
+        }
+
+        if include_recommendations:
+            # Users missing from the table get the draw of their cluster
+            key = ("table", table_segment) if table_segment >= 0 else ("draw", cluster_id)
+            if key not in recommendations_shared:
+                if key[0] == "table":
+                    recommendations_shared[key] = get_segment_recommendations(table, table_segment)
+                else:
+                    recommendations_shared[key] = generate_simple_recommendations(cluster_id)
+            profile["recommendations"] = recommendations_shared[key]
+            user_keys.append(key)
+
+        profiles.append(profile)
+
+    # The contents a user already consumed are replaced in the shared recommendations by
+    # contents of one larger draw per cluster (see consumed_index.py)
+    if include_recommendations and profiles:
+        keys = list(recommendations_shared)
+        key_positions = {key: position for position, key in enumerate(keys)}
+        pool_content_ids = [[r['id'] for r in recommendations_shared[key].get('recommendations', [])]
+                            for key in keys]
+        affected = consumed_in_pools(found_ids, [key_positions[key] for key in user_keys], pool_content_ids)
+        replacements_shared = {}
+        for i in np.flatnonzero(affected).tolist():
+            user_id, cluster_id = int(found_ids[i]), int(clusters[i])
+            consumed = consumed_contents(user_id)
+            if cluster_id not in replacements_shared:
+                replacements_shared[cluster_id] = generate_simple_recommendations(
+                    cluster_id, num_recommendations=NUM_REPLACEMENTS).get('recommendations', [])
+            shared = profiles[i]["recommendations"]
+            user_recommendations = replace_consumed_recommendations(
+                shared['recommendations'], consumed, replacements_shared[cluster_id])
+            if user_recommendations is None:
+                profiles[i]["recommendations"] = generate_simple_recommendations(cluster_id, exclude_ids=consumed)
+            else:
+                profiles[i]["recommendations"] = {**shared, "recommendations": user_recommendations}
+
+    return {
+        "profiles": profiles,
+        "not_found": user_ids[~found].tolist()
+    }
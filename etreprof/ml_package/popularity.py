@@ -0,0 +1,303 @@
+"""
+Content popularity counters per cluster, and popularity-weighted sampling.
+
+The counters hold, for every content, the number of page views and downloads of the
+users of each cluster (and of all users), with an exponential decay: an event counts
+for 1 when it happens and for 1/2 after POPULARITY_HALF_LIFE_DAYS. They are stored as of
+the last event seen, so a new batch of interactions updates them without reading the
+previous ones again: the counts are decayed to the new date, then the events of the
+batch are added.
+
+The recommenders draw contents with a probability proportional to their popularity in
+the cluster (plus a prior so that contents never consulted can still be drawn). The
+draws use alias tables (Vose), built once per pool when the counters or the mapping
+change, so that a weighted draw costs the same as a uniform one.
+"""
+import os
+import json
+import threading
+import numpy as np
+import pandas as pd
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
+from .artifacts import artifact_manager, ArtifactError
+
+ROOT_PATH = os.path.dirname(os.path.abspath(__file__))
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(ROOT_PATH)), 'data')
+POPULARITY_PATH = os.getenv("POPULARITY_DIR", os.path.join(DATA_PATH, 'popularity'))
+HALF_LIFE_DAYS = float(os.getenv("POPULARITY_HALF_LIFE_DAYS", "30"))
+# Weight of a download relative to a page view
+DOWNLOAD_WEIGHT = float(os.getenv("POPULARITY_DOWNLOAD_WEIGHT", "1"))
+# Popularity added to every content, so that contents without views can be drawn
+PRIOR = float(os.getenv("POPULARITY_PRIOR", "1"))
+
+N_CLUSTERS = 5
+# Column of the counters over all users (including users without a cluster)
+ALL_USERS = N_CLUSTERS
+# Interaction type -> counter
+EVENT_COUNTERS = {'page_view': 'views', 'download': 'downloads'}
+
+
+def empty_counters(half_life_days: float = HALF_LIFE_DAYS) -> Dict[str, Any]:
+    return {
+        "content_ids": np.array([], dtype=np.int64),
+        "views": np.zeros((0, N_CLUSTERS + 1)),
+        "downloads": np.zeros((0, N_CLUSTERS + 1)),
+        "meta": {"as_of": None, "half_life_days": half_life_days, "events": 0, "batches": 0}
+    }
+
+
+def _decay(elapsed_ns, half_life_days: float):
+    return np.exp2(-np.asarray(elapsed_ns, dtype=np.float64) / (half_life_days * 86400e9))
+
+
+def update_counters(counters: Dict[str, Any], df_interactions: pd.DataFrame,
+                    user_ids: np.ndarray, user_clusters: np.ndarray) -> Dict[str, Any]:
+    """
+    Add a batch of interactions to the popularity counters.
+
+    The counts are decayed from the date of the counters to the last event of the batch
+    (or kept at their date if the batch is older), then every page view and download of
+    the batch is added with the decay of its age. Applying the batches one by one gives
+    the same counters as applying them all at once.
+
+    Parameters
+    ----------
+    counters : Dict[str, Any]
+        Current counters (see empty_counters), not modified.
+    df_interactions : pandas.DataFrame
+        New interactions with 'user_id', 'type', 'content_id' and 'created_at'.
+    user_ids, user_clusters : numpy.ndarray
+        Sorted user ids and their cluster (user cluster assignments). The events of other
+        users only count for all users.
+
+    Returns
+    -------
+    Dict[str, Any]: The updated counters.
+    """
+    half_life_days = counters["meta"]["half_life_days"]
+    events = df_interactions[df_interactions['type'].isin(list(EVENT_COUNTERS))]
+    content_ids = pd.to_numeric(events['content_id'], errors='coerce').to_numpy(dtype=np.float64)
+    times = pd.to_datetime(events['created_at'], errors='coerce')
+    valid = ~np.isnan(content_ids) & (content_ids % 1 == 0) & times.notna().to_numpy()
+    events, content_ids = events[valid], content_ids[valid].astype(np.int64)
+    times = times[valid].to_numpy(dtype='datetime64[ns]').astype(np.int64)
+
+    # Decay the counts to the new date
+    as_of = counters["meta"]["as_of"]
+    previous_as_of = pd.Timestamp(as_of).value if as_of is not None else None
+    new_as_of = max([t for t in [previous_as_of, int(times.max()) if len(times) else None] if t is not None], default=None)
+    factor = _decay(new_as_of - previous_as_of, half_life_days) if previous_as_of is not None else 1.0
+
+    # Rows of the contents, new contents added
+    all_ids = np.union1d(counters["content_ids"], content_ids)
+    old_rows = np.searchsorted(all_ids, counters["content_ids"])
+    rows = np.searchsorted(all_ids, content_ids)
+
+    # Column of the cluster of each event
+    clusters = np.full(len(events), -1, dtype=np.int64)
+    if len(user_ids):
+        event_users = pd.to_numeric(events['user_id'], errors='coerce').fillna(-1).to_numpy(dtype=np.int64)
+        positions = np.minimum(np.searchsorted(user_ids, event_users), len(user_ids) - 1)
+        known = user_ids[positions] == event_users
+        clusters[known] = user_clusters[positions[known]]
+
+    weights = _decay(new_as_of - times, half_life_days) if len(times) else np.zeros(0)
+    event_types = events['type'].to_numpy()
+    updated = {}
+    for event_type, counter in EVENT_COUNTERS.items():
+        values = np.zeros((len(all_ids), N_CLUSTERS + 1))
+        values[old_rows] = counters[counter] * factor
+        of_type = event_types == event_type
+        in_cluster = of_type & (clusters >= 0)
+        values[:, ALL_USERS] += np.bincount(rows[of_type], weights=weights[of_type], minlength=len(all_ids))
+        cells = rows[in_cluster] * (N_CLUSTERS + 1) + clusters[in_cluster]
+        values += np.bincount(cells, weights=weights[in_cluster], minlength=values.size).reshape(values.shape)
+        updated[counter] = values
+
+    return {
+        "content_ids": all_ids,
+        **updated,
+        "meta": {
+            "as_of": pd.Timestamp(new_as_of).isoformat() if new_as_of is not None else None,
+            "half_life_days": half_life_days,
+            "events": counters["meta"]["events"] + len(events),
+            "batches": counters["meta"]["batches"] + 1
+        }
+    }
+
+
+def write_counters(counters: Dict[str, Any], output_dir: str = POPULARITY_PATH):
+    """
+    Write the counters, every file under a temporary name then swapped in, meta.json last.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    for name in ['content_ids', 'views', 'downloads']:
+        tmp_path = os.path.join(output_dir, f'.{name}.npy.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.save(f, counters[name])
+        os.replace(tmp_path, os.path.join(output_dir, f'{name}.npy'))
+
+    meta = {**counters["meta"], "updated_at": datetime.now(timezone.utc).isoformat(timespec='seconds')}
+    tmp_path = os.path.join(output_dir, '.meta.json.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(output_dir, 'meta.json'))
+
+
+def read_counters(counters_dir: str = POPULARITY_PATH) -> Optional[Dict[str, Any]]:
+    """
+    Read the counters, memory-mapped, or None if they have never been written.
+    """
+    meta_path = os.path.join(counters_dir, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    counters = {name: np.load(os.path.join(counters_dir, f'{name}.npy'), mmap_mode='r')
+                for name in ['content_ids', 'views', 'downloads']}
+    return {**counters, "meta": meta}
+
+
+def validate_counters(counters):
+    """
+    Check that the counters have one row per content and one column per cluster.
+    """
+    if counters is None:
+        return
+    n_contents = len(counters["content_ids"])
+    for name in ['views', 'downloads']:
+        if counters[name].shape != (n_contents, N_CLUSTERS + 1):
+            raise ArtifactError(f"{name} has shape {counters[name].shape}, expected {(n_contents, N_CLUSTERS + 1)}")
+
+artifact_manager.register(
+    "popularity",
+    paths=lambda: [os.path.join(POPULARITY_PATH, 'meta.json')],
+    load=read_counters,
+    validate=validate_counters
+)
+
+
+def popularity_weights(counters: Dict[str, Any], content_ids, column: int) -> np.ndarray:
+    """
+    Sampling weight of each content: prior + decayed views + DOWNLOAD_WEIGHT * decayed downloads
+    by the users of the cluster (column ALL_USERS for all users).
+    """
+    content_ids = pd.to_numeric(pd.Series(content_ids), errors='coerce').fillna(-1).to_numpy(dtype=np.int64)
+    weights = np.full(len(content_ids), PRIOR)
+    if len(counters["content_ids"]):
+        rows = np.minimum(np.searchsorted(counters["content_ids"], content_ids), len(counters["content_ids"]) - 1)
+        known = counters["content_ids"][rows] == content_ids
+        weights[known] += (counters["views"][rows[known], column]
+                           + DOWNLOAD_WEIGHT * counters["downloads"][rows[known], column])
+    return weights
+
+
+class AliasTable:
+    """
+    Alias table (Vose) of a discrete distribution: a draw is one uniform index, one
+    uniform number and one comparison, whatever the number of outcomes.
+    """
+    __slots__ = ("probabilities", "aliases")
+
+    def __init__(self, weights):
+        weights = np.asarray(weights, dtype=np.float64)
+        n = len(weights)
+        scaled = weights * n / weights.sum()
+        self.probabilities = np.ones(n)
+        self.aliases = np.arange(n)
+        small = [i for i in range(n) if scaled[i] < 1]
+        large = [i for i in range(n) if scaled[i] >= 1]
+        while small and large:
+            i, j = small.pop(), large[-1]
+            self.probabilities[i] = scaled[i]
+            self.aliases[i] = j
+            scaled[j] -= 1 - scaled[i]
+            if scaled[j] < 1:
+                small.append(large.pop())
+
+    def __len__(self):
+        return len(self.probabilities)
+
+    def draw(self, rng, size: int) -> np.ndarray:
+        outcomes = rng.integers(0, len(self), size)
+        return np.where(rng.random(size) < self.probabilities[outcomes], outcomes, self.aliases[outcomes])
+
+    def draw_distinct(self, rng, k: int, exclude=()) -> list:
+        """
+        k distinct outcomes (not in exclude), in draw order: repeated outcomes are drawn again.
+        After a few rounds the missing outcomes are taken uniformly among the remaining ones.
+        """
+        selected = []
+        seen = set(exclude)
+        k = min(k, len(self) - len(seen))
+        for _ in range(8):
+            if len(selected) >= k:
+                break
+            for outcome in self.draw(rng, 2 * (k - len(selected)) + 4).tolist():
+                if outcome not in seen:
+                    seen.add(outcome)
+                    selected.append(outcome)
+                    if len(selected) == k:
+                        break
+        if len(selected) < k:
+            remaining = np.setdiff1d(np.arange(len(self)), list(seen))
+            selected.extend(rng.permutation(remaining)[:k - len(selected)].tolist())
+        return selected
+
+
+# Alias tables of the (cluster, pool) draws, for one version of the counters and the mapping
+_SAMPLER_CACHE = {"sources": None, "tables": {}}
+_SAMPLER_LOCK = threading.Lock()
+
+
+def load_popularity() -> Optional[Dict[str, Any]]:
+    """
+    Get the active popularity counters, or None if they have not been computed.
+    They are loaded once and swapped when meta.json changes (see artifacts.py).
+    """
+    try:
+        return artifact_manager.get("popularity")
+    except ArtifactError as e:
+        print(f"❌ Erreur lors du chargement: {e}")
+        return None
+
+
+def popularity_alias_table(pool: str, cluster_id: int, content_ids, df_reco) -> Optional[AliasTable]:
+    """
+    Alias table of the popularity of the contents of a pool of a cluster ('normal' or
+    'priority'), in the order of content_ids. Tables are built on first use and kept until
+    the counters or the recommendations mapping change.
+    Returns None without counters (callers draw uniformly).
+    """
+    counters = load_popularity()
+    if counters is None or len(content_ids) == 0:
+        return None
+    sources = (id(counters), id(df_reco))
+    with _SAMPLER_LOCK:
+        if _SAMPLER_CACHE["sources"] != sources:
+            _SAMPLER_CACHE["sources"] = sources
+            _SAMPLER_CACHE["tables"] = {}
+        table = _SAMPLER_CACHE["tables"].get((pool, cluster_id))
+        if table is None or len(table) != len(content_ids):
+            table = AliasTable(popularity_weights(counters, content_ids, cluster_id))
+            _SAMPLER_CACHE["tables"][(pool, cluster_id)] = table
+    return table
+
+
+if __name__ == "__main__":
+    import sys
+    from .models import load_user_assignments
+
+    if len(sys.argv) < 2:
+        print("Usage: python -m etreprof.ml_package.popularity <interactions batch CSV> [...]")
+        sys.exit(1)
+
+    assignments = load_user_assignments()
+    counters = read_counters() or empty_counters()
+    for batch_path in sys.argv[1:]:
+        df_batch = pd.read_csv(batch_path, low_memory=False)
+        counters = update_counters(counters, df_batch, assignments["ids"], assignments["clusters"])
+    write_counters(counters)
+    print(f"✅ Compteurs de popularité mis à jour dans {POPULARITY_PATH}")
+    print(f"📊 {len(counters['content_ids'])} contenus, {counters['meta']['events']} évènements - au {counters['meta']['as_of']}")
@@ -0,0 +1,29 @@
+import re
+import pandas as pd
+
+
+def clean_markdown(text):
+    """
+    Clean markdown content before topic modeling, as done when the BERTopic model was trained
+    (headers, bold/italic, inline code and links are removed, whitespace is collapsed).
+
+    Parameters
+    ----------
+    text : str
+        The markdown content.
+
+    Returns
+    -------
+    str
+        The cleaned text, or an empty string when fewer than 3 words remain.
+    """
+    if pd.isna(text):
+        return ""
+
+    text = re.sub(r'#+\s*', '', text)  # Headers
+    text = re.sub(r'\*{1,2}([^*]+)\*{1,2}', r'\1', text)  # Bold/italic
+    text = re.sub(r'`([^`]+)`', r'\1', text)  # Code
+    text = re.sub(r'\[([^\]]+)\]\([^)]+\)', r'\1', text)  # Links
+    text = re.sub(r'\s+', ' ', text).strip()
+
+    return text if len(text.split()) >= 3 else ""
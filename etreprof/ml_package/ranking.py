@@ -0,0 +1,269 @@
+import os
+import numpy as np
+import pandas as pd
+from typing import Dict, Any, Optional
+from .recommender import load_recommendations_csv, content_to_recommendation
+from .popularity import ALL_USERS, N_CLUSTERS, load_popularity, popularity_weights
+
+ROOT_PATH = os.path.dirname(os.path.abspath(__file__))
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(ROOT_PATH)), 'data')
+BERTOPIC_PATH = os.path.join(ROOT_PATH, 'pickles/bertopic')
+
+# BERTopic stores the outlier topic -1 in the first row of the topic embeddings
+TOPIC_IDS = list(range(-1, 16))
+TOPIC_COLUMNS = [f'topic_{topic_id}' for topic_id in TOPIC_IDS]
+
+# Most contents of one topic in a ranked list: all the contents of a topic have the same
+# score, so without a cap the best topic of the user would fill the whole list
+MAX_CONTENTS_PER_TOPIC = int(os.getenv("RANKING_MAX_CONTENTS_PER_TOPIC", "2"))
+
+# Loaded once per process (missing files are looked for again at the next call)
+_RANKING_CACHE = {"index": None, "reco": None, "users": None,
+                  "weights": {"sources": None, "columns": {}}}
+
+
+def load_topic_embeddings(bertopic_path: str = BERTOPIC_PATH) -> np.ndarray:
+    """
+    Load the BERTopic topic embeddings (n_topics x embedding_dim) with NumPy only,
+    without loading the BERTopic model nor the sentence encoder.
+    """
+    from safetensors.numpy import load_file
+
+    return load_file(os.path.join(bertopic_path, 'topic_embeddings.safetensors'))['topic_embeddings']
+
+
+def topic_similarity_matrix(topic_embeddings: np.ndarray) -> np.ndarray:
+    """
+    Cosine similarity between topics, clipped at 0 so that unrelated topics do not
+    penalize a content.
+    """
+    norms = np.linalg.norm(topic_embeddings, axis=1, keepdims=True)
+    normalized = topic_embeddings / np.where(norms == 0, 1, norms)
+    return np.clip(normalized @ normalized.T, 0, None).astype(np.float32)
+
+
+def build_ranking_index(df_reco: pd.DataFrame, df_content_topics: pd.DataFrame,
+                        topic_embeddings: np.ndarray) -> Dict[str, Any]:
+    """
+    Precompute the topic vectors and the contents of each topic used for personalized ranking.
+
+    A topic vector is the similarity of the topic to every topic, so a user reading about
+    one topic also gets contents of the closest topics. The contents only have their
+    BERTopic topic (no topic distribution), so all the contents of a topic have the score
+    of their topic: rank_contents orders the topics, then draws contents within each topic.
+
+    Parameters
+    ----------
+    df_reco : pandas.DataFrame
+        Content recommendations mapping with 'id', 'title', 'type', 'cluster_k' and 'priority_challenge'.
+    df_content_topics : pandas.DataFrame
+        Contents with their BERTopic topic ('id', 'reduced topics').
+    topic_embeddings : numpy.ndarray
+        Topic embeddings, one row per topic of TOPIC_IDS.
+
+    Returns
+    -------
+    Dict[str, Any]: Content ids, details, cluster masks, the (n_topics x n_topics) topic vectors
+    and the positions of the contents of each topic (topic_offsets[t]:topic_offsets[t + 1]
+    in topic_contents).
+    """
+    df_topics = df_content_topics[['id', 'reduced topics']].dropna().drop_duplicates(subset='id')
+    df_topics = df_topics.astype({'id': np.int64, 'reduced topics': np.int64})
+    df_candidates = df_reco.dropna(subset=['id']).astype({'id': np.int64}).merge(df_topics, on='id', how='inner')
+    df_candidates = df_candidates[df_candidates['reduced topics'].isin(TOPIC_IDS)].reset_index(drop=True)
+
+    # Topics added by topic_update.py have no column in the recommendation tables yet
+    similarity = topic_similarity_matrix(topic_embeddings[:len(TOPIC_IDS)])
+    topic_rows = df_candidates['reduced topics'].values - TOPIC_IDS[0]
+
+    topic_contents = np.argsort(topic_rows, kind='stable')
+    topic_offsets = np.searchsorted(topic_rows[topic_contents], np.arange(len(TOPIC_IDS) + 1))
+
+    cluster_columns = [c for c in df_candidates.columns if c.startswith('cluster_')]
+    return {
+        "ids": df_candidates['id'].values,
+        "contents": df_candidates[['id', 'title', 'type', 'priority_challenge']].to_dict('records'),
+        "cluster_masks": {
+            int(c.split('_')[1]): (df_candidates[c] == True).values for c in cluster_columns
+        },
+        "topic_vectors": similarity,
+        "topic_contents": topic_contents.astype(np.int64),
+        "topic_offsets": topic_offsets.astype(np.int64)
+    }
+
+
+def user_preference_vector(topic_counts) -> Optional[np.ndarray]:
+    """
+    Turn the topic_* counts of a user into a normalized preference vector.
+    Returns None for users without any topic history.
+    """
+    counts = np.nan_to_num(np.asarray(topic_counts, dtype=np.float32))
+    total = counts.sum()
+    if total <= 0:
+        return None
+    return counts / total
+
+
+def rank_contents(index: Dict[str, Any], preference: np.ndarray, k: int = 5,
+                  candidate_mask: Optional[np.ndarray] = None, max_per_topic: Optional[int] = None,
+                  rng: Optional[np.random.Generator] = None, weights: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Score the topics with one matrix-vector product and return the positions of the
+    k best contents, best first.
+
+    The topics are taken by decreasing score, with at most max_per_topic contents each.
+    Within a topic the contents are drawn with rng, with a probability proportional to
+    their weight (uniform without weights), or taken in index order without rng.
+    """
+    topic_scores = index["topic_vectors"] @ preference
+    offsets = index["topic_offsets"]
+    per_topic = k if max_per_topic is None else max_per_topic
+
+    selected = []
+    for topic in np.argsort(-topic_scores, kind='stable'):
+        if len(selected) >= k:
+            break
+        contents = index["topic_contents"][offsets[topic]:offsets[topic + 1]]
+        if candidate_mask is not None:
+            contents = contents[candidate_mask[contents]]
+        n = min(per_topic, k - len(selected), len(contents))
+        if n <= 0:
+            continue
+        if rng is None:
+            selected.append(contents[:n])
+            continue
+
+        # Weighted draw without replacement: the n highest u ** (1 / weight)
+        keys = rng.random(len(contents))
+        if weights is not None:
+            with np.errstate(divide='ignore'):
+                keys = keys ** (1 / weights[contents])
+        best = np.argpartition(-keys, n - 1)[:n]
+        selected.append(contents[best[np.argsort(-keys[best])]])
+
+    return np.concatenate(selected) if selected else np.array([], dtype=np.int64)
+
+
+def load_ranking_weights(index: Dict[str, Any], cluster_id: int) -> Optional[np.ndarray]:
+    """
+    Popularity of the ranked contents in the cluster (see popularity.py), computed once
+    per version of the counters and of the index. None without counters.
+    """
+    counters = load_popularity()
+    if counters is None:
+        return None
+    column = cluster_id if cluster_id in range(N_CLUSTERS) else ALL_USERS
+    cache = _RANKING_CACHE["weights"]
+    sources = (id(counters), id(index))
+    if cache["sources"] != sources:
+        cache["sources"] = sources
+        cache["columns"] = {}
+    if column not in cache["columns"]:
+        cache["columns"][column] = popularity_weights(counters, index["ids"], column)
+    return cache["columns"][column]
+
+
+def load_ranking_index() -> Optional[Dict[str, Any]]:
+    """
+    Build the ranking index from the recommendation mapping, the content topics and the
+    topic embeddings the first time it is needed, and again when a new recommendation
+    mapping is swapped in. None if the mapping or the content topics table does not exist.
+    """
+    df_reco = load_recommendations_csv()
+    content_topics_path = os.path.join(DATA_PATH, 'content_with_topics.csv')
+    if df_reco is None or not os.path.exists(content_topics_path):
+        return None
+    if _RANKING_CACHE["index"] is None or _RANKING_CACHE["reco"] is not df_reco:
+        df_content_topics = pd.read_csv(content_topics_path)
+        _RANKING_CACHE["index"] = build_ranking_index(df_reco, df_content_topics, load_topic_embeddings())
+        _RANKING_CACHE["reco"] = df_reco
+    return _RANKING_CACHE["index"]
+
+
+def load_user_topics() -> Optional[Dict[str, Any]]:
+    """
+    Load the topic_* counts of every user as a sorted id array and a dense matrix.
+    None if the users table does not exist.
+    """
+    if _RANKING_CACHE["users"] is None:
+        users_path = os.path.join(DATA_PATH, 'users_final_with_clusters.csv')
+        if not os.path.exists(users_path):
+            return None
+        header = pd.read_csv(users_path, nrows=0).columns
+        columns = [c for c in TOPIC_COLUMNS if c in header]
+        df_users = pd.read_csv(users_path, usecols=['id'] + columns).sort_values('id')
+        df_users = df_users.reindex(columns=['id'] + TOPIC_COLUMNS, fill_value=0)
+        _RANKING_CACHE["users"] = {
+            "ids": df_users['id'].values.astype(np.int64),
+            "topics": df_users[TOPIC_COLUMNS].fillna(0).values.astype(np.float32)
+        }
+    return _RANKING_CACHE["users"]
+
+
+def generate_personalized_recommendations(user_id: int, cluster_id: int, num_recommendations: int = 5,
+                                          exclude_ids=None) -> Optional[Dict[str, Any]]:
+    """
+    Rank the contents of the user's cluster pool by closeness to the user's topic history.
+    At most MAX_CONTENTS_PER_TOPIC contents of a topic are recommended, drawn within the
+    topic by popularity in the cluster, so users with the same history get different lists.
+
+    Parameters
+    ----------
+    user_id : int
+        The user to rank contents for.
+    cluster_id : int
+        The cluster of the user, used to restrict the candidates.
+    num_recommendations : int
+        The number of recommendations to return (default is 5).
+    exclude_ids : array-like, optional
+        Content ids not to recommend (contents the user already consumed).
+
+    Returns
+    -------
+    Dict[str, Any] or None: Recommendations in the generate_simple_recommendations format,
+    or None if the user has no topic history or the ranking data is missing (callers fall
+    back to cluster recommendations).
+    """
+    users = load_user_topics()
+    if users is None:
+        return None
+    position = int(np.searchsorted(users["ids"], user_id))
+    if position >= len(users["ids"]) or users["ids"][position] != user_id:
+        return None
+
+    preference = user_preference_vector(users["topics"][position])
+    if preference is None:
+        return None
+
+    index = load_ranking_index()
+    if index is None:
+        return None
+    candidate_mask = index["cluster_masks"].get(cluster_id)
+    if exclude_ids is not None and len(exclude_ids) > 0:
+        not_consumed = ~np.isin(index["ids"], exclude_ids)
+        candidate_mask = not_consumed if candidate_mask is None else candidate_mask & not_consumed
+    top = rank_contents(index, preference, num_recommendations, candidate_mask,
+                        max_per_topic=MAX_CONTENTS_PER_TOPIC, rng=np.random.default_rng(),
+                        weights=load_ranking_weights(index, cluster_id))
+
+    recommendations = []
+    for position in top:
+        content = index["contents"][position]
+        if pd.notna(content['priority_challenge']):
+            rec = content_to_recommendation(
+                content, 'priority_challenge', f'Développement professionnel - {content["priority_challenge"]}'
+            )
+        else:
+            rec = content_to_recommendation(content, 'topic_ranking', 'Proche des thématiques que vous consultez')
+        recommendations.append(rec)
+
+    return {
+        "cluster_id": cluster_id,
+        "total_recommendations": len(recommendations),
+        "recommendations": recommendations,
+        "reasoning": {
+            "strategy": "Classement par similarité entre les topics consultés et les topics des contenus",
+            "available_contents": int(candidate_mask.sum()) if candidate_mask is not None else len(index["ids"])
+        },
+        "system_status": "ok"
+    }
@@ -0,0 +1,193 @@
+"""
+Bulk re-classification of the contents corpus with the BERTopic model.
+
+Streams the contents table, classifies the markdown by batches and writes
+`id, reduced topics, confidence, markdown_hash` to Parquet part files (the hash of the
+classified markdown lets the topic index detect edited contents, see topic_index.py). Progress is checkpointed
+after every part so that a killed run resumes where it stopped.
+
+Usage:
+    python -m etreprof.ml_package.reclassify --input raw_data/contents_v3.csv --output data/reclassification \
+        --export-csv data/content_with_topics.csv
+"""
+import os
+import glob
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from .preprocessing import clean_markdown
+from .topic_index import document_hash
+
+CONTENT_TYPES = ['article', 'fiche_outils', 'guide_pratique']
+CHECKPOINT_FILE = 'checkpoint.json'
+
+
+def _write_json_atomic(path, payload):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(output_dir):
+    """
+    Read the checkpoint of a previous run, or return None if there is none.
+    """
+    checkpoint_path = os.path.join(output_dir, CHECKPOINT_FILE)
+    if not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def classify_batch(topic_model, documents):
+    """
+    Classify a batch of cleaned documents.
+    Returns the topics and the confidence (highest topic probability) of each document.
+    """
+    topics, probabilities = topic_model.transform(documents)
+    probabilities = np.asarray(probabilities)
+    confidences = probabilities.max(axis=1) if probabilities.ndim == 2 else probabilities
+    return np.asarray(topics, dtype=np.int64), confidences.astype(np.float32)
+
+
+def reclassify_contents(input_path, output_dir, topic_model, chunk_size=256, batch_size=32, restart=False):
+    """
+    Classify every content of the contents table and write the results incrementally.
+
+    Parameters
+    ----------
+    input_path : str
+        Path or URL of the contents CSV (columns 'id', 'type', 'markdown').
+    output_dir : str
+        Directory receiving the part-*.parquet files and the checkpoint.
+    topic_model : BERTopic
+        The topic model, with its embedding model.
+    chunk_size : int
+        Number of source rows read, classified and written per part (default is 256).
+    batch_size : int
+        Number of documents encoded at once (default is 32).
+    restart : bool
+        Ignore an existing checkpoint and start from the beginning.
+
+    Returns
+    -------
+    dict
+        The final checkpoint (rows read, parts written, documents classified, elapsed time).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    checkpoint = None if restart else load_checkpoint(output_dir)
+
+    if checkpoint is not None and checkpoint['input'] != input_path:
+        raise ValueError(
+            f"Checkpoint in {output_dir} was created for {checkpoint['input']}, use restart=True to start over"
+        )
+
+    if checkpoint is None:
+        for part in glob.glob(os.path.join(output_dir, 'part-*.parquet')):
+            os.remove(part)
+        checkpoint = {"input": input_path, "rows_read": 0, "parts_written": 0,
+                      "documents_classified": 0, "elapsed_seconds": 0.0, "completed": False}
+    elif checkpoint['completed']:
+        print(f"✅ Reclassification already completed ({checkpoint['documents_classified']} documents)")
+        return checkpoint
+    else:
+        print(f"🔁 Resuming after {checkpoint['rows_read']} rows ({checkpoint['parts_written']} parts written)")
+
+    # Rows already processed are skipped without being parsed
+    reader = pd.read_csv(
+        input_path,
+        usecols=['id', 'type', 'markdown'],
+        chunksize=chunk_size,
+        skiprows=range(1, checkpoint['rows_read'] + 1)
+    )
+
+    run_documents = 0
+    run_start = time.perf_counter()
+
+    for chunk in reader:
+        chunk_start = time.perf_counter()
+        rows_in_chunk = len(chunk)
+
+        chunk = chunk[chunk['type'].isin(CONTENT_TYPES)]
+        documents = chunk['markdown'].apply(clean_markdown)
+        chunk = chunk[documents != '']
+        documents = documents[documents != ''].tolist()
+
+        topics, confidences = [], []
+        for start in range(0, len(documents), batch_size):
+            batch_topics, batch_confidences = classify_batch(topic_model, documents[start:start + batch_size])
+            topics.append(batch_topics)
+            confidences.append(batch_confidences)
+
+        df_part = pd.DataFrame({
+            'id': chunk['id'].astype(np.int64).values,
+            'reduced topics': np.concatenate(topics) if topics else np.array([], dtype=np.int64),
+            'confidence': np.concatenate(confidences) if confidences else np.array([], dtype=np.float32),
+            'markdown_hash': [f'{document_hash(document):016x}' for document in documents]
+        })
+
+        # Part first, checkpoint second: a run killed in between rewrites the same part
+        part_path = os.path.join(output_dir, f"part-{checkpoint['parts_written']:05d}.parquet")
+        df_part.to_parquet(f'{part_path}.tmp', index=False)
+        os.replace(f'{part_path}.tmp', part_path)
+
+        elapsed = time.perf_counter() - chunk_start
+        checkpoint['rows_read'] += rows_in_chunk
+        checkpoint['parts_written'] += 1
+        checkpoint['documents_classified'] += len(df_part)
+        checkpoint['elapsed_seconds'] += elapsed
+        _write_json_atomic(os.path.join(output_dir, CHECKPOINT_FILE), checkpoint)
+
+        run_documents += len(df_part)
+        run_rate = run_documents / max(time.perf_counter() - run_start, 1e-9)
+        print(f"⚡ Part {checkpoint['parts_written']}: {len(df_part)} documents in {elapsed:.1f} s "
+              f"- {run_rate:.1f} docs/s - {checkpoint['documents_classified']} classified")
+
+    checkpoint['completed'] = True
+    _write_json_atomic(os.path.join(output_dir, CHECKPOINT_FILE), checkpoint)
+
+    total_rate = checkpoint['documents_classified'] / max(checkpoint['elapsed_seconds'], 1e-9)
+    print(f"✅ {checkpoint['documents_classified']} documents classified - {total_rate:.1f} docs/s")
+    return checkpoint
+
+
+def read_reclassification(output_dir):
+    """
+    Concatenate the part files of a run into a single DataFrame ('id', 'reduced topics', 'confidence',
+    'markdown_hash').
+    """
+    parts = sorted(glob.glob(os.path.join(output_dir, 'part-*.parquet')))
+    if not parts:
+        return pd.DataFrame(columns=['id', 'reduced topics', 'confidence', 'markdown_hash'])
+    return pd.concat([pd.read_parquet(part) for part in parts], ignore_index=True)
+
+
+if __name__ == "__main__":
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Re-classify the contents corpus with the BERTopic model")
+    parser.add_argument('--input', default=os.getenv("CONTENTS_URL_DB"),
+                        help="Contents CSV path or URL (default: CONTENTS_URL_DB)")
+    parser.add_argument('--output', required=True, help="Output directory for the Parquet parts and the checkpoint")
+    parser.add_argument('--chunk-size', type=int, default=256, help="Source rows per part")
+    parser.add_argument('--batch-size', type=int, default=32, help="Documents encoded at once")
+    parser.add_argument('--restart', action='store_true', help="Ignore the checkpoint and start over")
+    parser.add_argument('--export-csv', help="Write the merged results to this CSV (content_with_topics format)")
+    args = parser.parse_args()
+
+    if args.input is None:
+        parser.error("--input is required when CONTENTS_URL_DB is not set")
+
+    from .models import load_topic_model
+
+    reclassify_contents(args.input, args.output, load_topic_model(),
+                        chunk_size=args.chunk_size, batch_size=args.batch_size, restart=args.restart)
+
+    if args.export_csv:
+        df_results = read_reclassification(args.output)
+        df_results.to_csv(args.export_csv, index=False)
+        print(f"💾 {len(df_results)} contents written to {args.export_csv}")
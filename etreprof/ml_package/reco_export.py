@@ -0,0 +1,168 @@
+"""
+Streaming export of the recommendations of every user.
+
+Rows are produced in user id order from the loaded user cluster assignments, a chunk of
+rows at a time, so the memory used does not grow with the number of users exported.
+The recommendations of a user are those of its (cluster, levels) segment in the
+materialized table, or the draw of its cluster when the table has not been built or does
+not know the user: each pool is computed and serialized once per export and every row
+only appends it to the user's own fields. The contents a user already consumed (see
+consumed_index.py) are replaced by contents of one larger draw of the cluster per export.
+"""
+import io
+import os
+import csv
+import json
+import numpy as np
+from typing import Iterator, List, Optional
+from .models import load_user_assignments, niveaux_from_mask
+from .consumed_index import consumed_contents, consumed_in_pools
+from .recommender import generate_simple_recommendations, replace_consumed_recommendations, NUM_REPLACEMENTS
+from .reco_table import load_reco_table, get_segment_recommendations, N_CLUSTERS, N_LEVEL_MASKS
+
+EXPORT_FORMATS = ['ndjson', 'csv']
+# Rows serialized and sent together
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "10000"))
+# Pools of the users drawn from their cluster come after the segments of the table
+DRAW_POOLS = N_CLUSTERS * N_LEVEL_MASKS
+
+
+def _pool_recommendations(table, pool: int) -> List[dict]:
+    if pool < DRAW_POOLS:
+        return get_segment_recommendations(table, pool)["recommendations"]
+    return generate_simple_recommendations(pool - DRAW_POOLS).get("recommendations", [])
+
+
+def _csv_cells(recommendations: List[dict], num_recommendations: int) -> List:
+    cells = []
+    for k in range(num_recommendations):
+        recommendation = recommendations[k] if k < len(recommendations) else {}
+        cells += [recommendation.get('id', ''), recommendation.get('url', '')]
+    return cells
+
+
+def recommendation_export(export_format: str = 'ndjson', cluster_id: Optional[int] = None,
+                          academie: Optional[str] = None, degre: Optional[int] = None,
+                          chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[str]:
+    """
+    Select the users to export and return the generator of the export.
+
+    The assignments and the materialized table are loaded before the first row, so that
+    loading errors are raised here rather than in the middle of a response.
+
+    Parameters
+    ----------
+    export_format : str
+        'ndjson' (one JSON object per line) or 'csv' (header, then one line per user with
+        a reco_<k>_id and reco_<k>_url column per recommendation).
+    cluster_id, academie, degre : optional
+        Only export the users of this cluster, académie or degré.
+    chunk_rows : int
+        Number of rows per chunk yielded.
+
+    Returns
+    -------
+    Iterator[str]
+        Chunks of the export, rows in user id order.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"export_format must be one of {EXPORT_FORMATS}, got {export_format!r}")
+
+    assignments = load_user_assignments()
+    table = load_reco_table()
+    num_recommendations = table["meta"]["num_recommendations"] if table is not None else 5
+
+    selected = np.ones(len(assignments["ids"]), dtype=bool)
+    if cluster_id is not None:
+        selected &= assignments["clusters"] == cluster_id
+    if academie is not None:
+        selected &= assignments["academie"] == academie
+    if degre is not None:
+        selected &= assignments["degre"] == degre
+    positions = np.flatnonzero(selected)
+
+    def serialize(recommendations):
+        if export_format == 'ndjson':
+            return json.dumps(recommendations, ensure_ascii=False)
+        return _csv_cells(recommendations, num_recommendations)
+
+    def rows():
+        pools = {}
+        pool_recommendations = {}
+        replacements = {}
+        niveaux = {}
+        academies = {}
+
+        if export_format == 'csv':
+            header = ['user_id', 'cluster_id', 'academie', 'degre', 'niveaux_enseignes']
+            for k in range(1, num_recommendations + 1):
+                header += [f'reco_{k}_id', f'reco_{k}_url']
+            yield ','.join(header) + '\r\n'
+
+        for start in range(0, len(positions), chunk_rows):
+            chunk = positions[start:start + chunk_rows]
+            user_ids = assignments["ids"][chunk]
+            clusters = assignments["clusters"][chunk]
+            masks = assignments["level_masks"][chunk]
+
+            # Segment row of the users in the table, cluster draw for the others
+            chunk_pools = DRAW_POOLS + clusters
+            if table is not None and len(table["user_ids"]):
+                table_positions = np.minimum(np.searchsorted(table["user_ids"], user_ids), len(table["user_ids"]) - 1)
+                in_table = table["user_ids"][table_positions] == user_ids
+                chunk_pools = np.where(in_table, np.asarray(table["user_segments"])[table_positions], chunk_pools)
+
+            for pool in np.unique(chunk_pools).tolist():
+                if pool not in pools:
+                    recommendations = _pool_recommendations(table, pool)
+                    pool_recommendations[pool] = recommendations
+                    pools[pool] = serialize(recommendations)
+
+            # The contents a user already consumed are replaced in the pool by contents of
+            # one larger draw of the cluster (see consumed_index.py)
+            known_pools = sorted(pool_recommendations)
+            affected = consumed_in_pools(user_ids, np.searchsorted(known_pools, chunk_pools),
+                                         [[r['id'] for r in pool_recommendations[pool]] for pool in known_pools])
+            row_recommendations = [pools[pool] for pool in chunk_pools.tolist()]
+            for i in np.flatnonzero(affected).tolist():
+                cluster, consumed = int(clusters[i]), consumed_contents(int(user_ids[i]))
+                if cluster not in replacements:
+                    replacements[cluster] = generate_simple_recommendations(
+                        cluster, num_recommendations=NUM_REPLACEMENTS).get("recommendations", [])
+                recommendations = replace_consumed_recommendations(
+                    pool_recommendations[chunk_pools[i]], consumed, replacements[cluster])
+                if recommendations is None:
+                    recommendations = generate_simple_recommendations(cluster, exclude_ids=consumed).get("recommendations", [])
+                row_recommendations[i] = serialize(recommendations)
+
+            for mask in np.unique(masks).tolist():
+                if mask not in niveaux:
+                    mask_niveaux = niveaux_from_mask(mask)
+                    niveaux[mask] = json.dumps(mask_niveaux) if export_format == 'ndjson' else '|'.join(mask_niveaux)
+
+            degre = assignments["degre"][chunk]
+            degres = [None if missing else int(d) for d, missing in zip(degre.tolist(), np.isnan(degre).tolist())]
+            fields = zip(user_ids.tolist(), clusters.tolist(), assignments["academie"][chunk].tolist(),
+                         degres, masks.tolist(), row_recommendations)
+
+            if export_format == 'ndjson':
+                lines = []
+                for user_id, cluster, user_academie, user_degre, mask, recommendations in fields:
+                    if user_academie not in academies:
+                        academies[user_academie] = json.dumps(user_academie, ensure_ascii=False)
+                    lines.append(
+                        f'{{"user_id": {user_id}, "cluster_id": {cluster}, "academie": {academies[user_academie]}, '
+                        f'"degre": {"null" if user_degre is None else user_degre}, '
+                        f'"niveaux_enseignes": {niveaux[mask]}, "recommendations": {recommendations}}}\n'
+                    )
+                yield ''.join(lines)
+            else:
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerows(
+                    [user_id, cluster, user_academie, user_degre, niveaux[mask]] + recommendations
+                    for user_id, cluster, user_academie, user_degre, mask, recommendations in fields
+                )
+                yield buffer.getvalue()
+
+    return rows()
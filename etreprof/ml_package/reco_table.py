@@ -0,0 +1,297 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
+from .recommender import load_recommendations_csv, content_to_recommendation
+
+ROOT_PATH = os.path.dirname(os.path.abspath(__file__))
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(ROOT_PATH)), 'data')
+RECO_TABLE_PATH = os.getenv("RECO_TABLE_DIR", os.path.join(DATA_PATH, 'reco_table'))
+
+N_CLUSTERS = 5
+NIVEAUX = ['maternelle', 'elementaire', 'college', 'lycee', 'lycee_pro']
+N_LEVEL_MASKS = 2 ** len(NIVEAUX)
+EMPTY_SLOT = -1
+SOURCES = ['cluster_matching', 'priority_challenge', 'cluster_matching_extra']
+
+# In-process cache of the memory-mapped table, keyed by the mtime of meta.json
+_TABLE_CACHE = {"mtime": None, "table": None}
+
+
+def segment_index(cluster_id: int, mask: int) -> int:
+    """
+    Row of the segment table holding the recommendations for a (cluster, level mask) pair.
+    The level mask has one bit per teaching level (maternelle = bit 0 ... lycee_pro = bit 4).
+    """
+    return cluster_id * N_LEVEL_MASKS + mask
+
+
+def _draw_segment(rng, normal_ids, priority_ids, num_recommendations):
+    """
+    Seeded equivalent of generate_simple_recommendations: n-1 normal contents,
+    1 priority challenge, completed with normal contents, then shuffled.
+    """
+    num_normal = min(num_recommendations - 1, len(normal_ids))
+    selected = list(rng.choice(normal_ids, size=num_normal, replace=False)) if num_normal > 0 else []
+    sources = ['cluster_matching'] * len(selected)
+
+    if len(priority_ids) > 0 and len(selected) < num_recommendations:
+        selected.append(rng.choice(priority_ids))
+        sources.append('priority_challenge')
+
+    remaining = np.setdiff1d(normal_ids, selected)
+    missing = min(num_recommendations - len(selected), len(remaining))
+    if missing > 0:
+        selected.extend(rng.choice(remaining, size=missing, replace=False))
+        sources.extend(['cluster_matching_extra'] * missing)
+
+    order = rng.permutation(len(selected))
+    return [int(selected[i]) for i in order], [sources[i] for i in order]
+
+
+def build_reco_table(df_assignments: pd.DataFrame, df_reco: pd.DataFrame,
+                     num_recommendations: int = 5, seed: int = 42,
+                     output_dir: str = RECO_TABLE_PATH) -> Dict[str, Any]:
+    """
+    Materialize the recommendations of every (cluster, level segment) and the
+    user -> segment mapping into fixed-width binary files.
+
+    Files written in output_dir:
+    - segment_contents.npy : int64 (n_segments, num_recommendations), -1 padded
+    - segment_sources.npy  : int8 (n_segments, num_recommendations), index in SOURCES
+    - user_ids.npy         : int64 sorted user ids
+    - user_segments.npy    : int16 segment row of each user
+    - contents.json        : content details (title, type, priority_challenge) by id
+    - meta.json            : build timestamp, seed and pool statistics (written last)
+
+    Parameters
+    ----------
+    df_assignments : pandas.DataFrame
+        User cluster assignments with 'id', 'cluster' and the level columns.
+    df_reco : pandas.DataFrame
+        Content recommendations mapping (content_recommendations_mapping.csv).
+    num_recommendations : int
+        Number of recommendations stored per segment (default is 5).
+    seed : int
+        Seed of the sampler, the same inputs and seed give the same table.
+    output_dir : str
+        Directory where the table is written.
+
+    Returns
+    -------
+    Dict[str, Any]: The content of meta.json.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    n_segments = N_CLUSTERS * N_LEVEL_MASKS
+    segment_contents = np.full((n_segments, num_recommendations), EMPTY_SLOT, dtype=np.int64)
+    segment_sources = np.zeros((n_segments, num_recommendations), dtype=np.int8)
+    pools = {}
+
+    df_reco = df_reco[df_reco['id'].notna()]
+    for cluster_id in range(N_CLUSTERS):
+        cluster_column = f'cluster_{cluster_id}'
+        if cluster_column not in df_reco.columns:
+            continue
+        cluster_contents = df_reco[df_reco[cluster_column] == True]
+        normal_ids = cluster_contents.loc[cluster_contents['priority_challenge'].isna(), 'id'].astype(np.int64).values
+        priority_ids = cluster_contents.loc[cluster_contents['priority_challenge'].notna(), 'id'].astype(np.int64).values
+        pools[str(cluster_id)] = {
+            "available_contents": len(cluster_contents),
+            "normal_contents": len(normal_ids),
+            "priority_contents": len(priority_ids)
+        }
+
+        for mask in range(N_LEVEL_MASKS):
+            rng = np.random.default_rng([seed, cluster_id, mask])
+            ids, sources = _draw_segment(rng, normal_ids, priority_ids, num_recommendations)
+            row = segment_index(cluster_id, mask)
+            segment_contents[row, :len(ids)] = ids
+            segment_sources[row, :len(ids)] = [SOURCES.index(s) for s in sources]
+
+    df_users = df_assignments[['id', 'cluster'] + [n for n in NIVEAUX if n in df_assignments.columns]]
+    df_users = df_users.dropna(subset=['id', 'cluster']).drop_duplicates(subset='id').sort_values('id')
+    masks = np.zeros(len(df_users), dtype=np.int64)
+    for bit, niveau in enumerate(NIVEAUX):
+        if niveau in df_users.columns:
+            masks |= (df_users[niveau].fillna(0).astype(int).values == 1).astype(np.int64) << bit
+    user_ids = df_users['id'].astype(np.int64).values
+    user_segments = (df_users['cluster'].astype(np.int64).values * N_LEVEL_MASKS + masks).astype(np.int16)
+
+    used_ids = set(segment_contents[segment_contents != EMPTY_SLOT].tolist())
+    df_used = df_reco[df_reco['id'].astype(np.int64).isin(used_ids)]
+    contents = {
+        str(int(row['id'])): {
+            "title": row['title'] if pd.notna(row['title']) else None,
+            "type": row['type'] if pd.notna(row['type']) else None,
+            "priority_challenge": row['priority_challenge'] if pd.notna(row['priority_challenge']) else None
+        }
+        for _, row in df_used.iterrows()
+    }
+
+    meta = {
+        "generated_at": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        "seed": seed,
+        "num_recommendations": num_recommendations,
+        "n_users": int(len(user_ids)),
+        "n_segments": n_segments,
+        "pools": pools
+    }
+
+    # Write every file under a temporary name then swap it in, meta.json last
+    # so that readers only pick up the new table once it is complete.
+    arrays = {
+        'segment_contents.npy': segment_contents,
+        'segment_sources.npy': segment_sources,
+        'user_ids.npy': user_ids,
+        'user_segments.npy': user_segments
+    }
+    for filename, array in arrays.items():
+        tmp_path = os.path.join(output_dir, f'.{filename}.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp_path, os.path.join(output_dir, filename))
+
+    for filename, payload in [('contents.json', contents), ('meta.json', meta)]:
+        tmp_path = os.path.join(output_dir, f'.{filename}.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(output_dir, filename))
+
+    return meta
+
+
+def reco_table_version(table_dir: str = RECO_TABLE_PATH) -> Optional[int]:
+    """
+    Version of the materialized table (modification time of meta.json, written last),
+    or None if it has not been built.
+    """
+    try:
+        return os.stat(os.path.join(table_dir, 'meta.json')).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def load_reco_table(table_dir: str = RECO_TABLE_PATH) -> Optional[Dict[str, Any]]:
+    """
+    Load the materialized table with memory-mapped arrays.
+    The table is cached and reloaded only when meta.json changes.
+
+    Returns
+    -------
+    Dict[str, Any] or None: The table, or None if it has not been built.
+    """
+    meta_path = os.path.join(table_dir, 'meta.json')
+    mtime = reco_table_version(table_dir)
+    if mtime is None:
+        return None
+
+    if _TABLE_CACHE["mtime"] == mtime and _TABLE_CACHE["table"] is not None:
+        return _TABLE_CACHE["table"]
+
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    with open(os.path.join(table_dir, 'contents.json'), 'r', encoding='utf-8') as f:
+        contents = json.load(f)
+
+    table = {
+        "meta": meta,
+        "contents": contents,
+        "segment_contents": np.load(os.path.join(table_dir, 'segment_contents.npy'), mmap_mode='r'),
+        "segment_sources": np.load(os.path.join(table_dir, 'segment_sources.npy'), mmap_mode='r'),
+        "user_ids": np.load(os.path.join(table_dir, 'user_ids.npy'), mmap_mode='r'),
+        "user_segments": np.load(os.path.join(table_dir, 'user_segments.npy'), mmap_mode='r')
+    }
+    _TABLE_CACHE["mtime"] = mtime
+    _TABLE_CACHE["table"] = table
+    return table
+
+
+def find_user_segment(table: Dict[str, Any], user_id: int) -> Optional[int]:
+    """
+    Binary search of the user in the sorted user id array.
+    Returns the segment row of the user, or None if the user is not in the table.
+    """
+    user_ids = table["user_ids"]
+    position = int(np.searchsorted(user_ids, user_id))
+    if position >= len(user_ids) or user_ids[position] != user_id:
+        return None
+    return int(table["user_segments"][position])
+
+
+def get_segment_recommendations(table: Dict[str, Any], segment: int) -> Dict[str, Any]:
+    """
+    Read one row of the segment table and format it like generate_simple_recommendations.
+    """
+    meta = table["meta"]
+    cluster_id = segment // N_LEVEL_MASKS
+    content_ids = table["segment_contents"][segment]
+    source_codes = table["segment_sources"][segment]
+
+    recommendations = []
+    for content_id, source_code in zip(content_ids, source_codes):
+        if content_id == EMPTY_SLOT:
+            continue
+        details = table["contents"].get(str(int(content_id)), {})
+        content = {
+            'id': int(content_id),
+            'title': details.get('title'),
+            'type': details.get('type'),
+            'priority_challenge': details.get('priority_challenge')
+        }
+        source = SOURCES[int(source_code)]
+        if source == 'priority_challenge':
+            reason = f'Développement professionnel - {content["priority_challenge"]}'
+        elif source == 'cluster_matching_extra':
+            source, reason = 'cluster_matching', 'Contenu additionnel pour votre profil'
+        else:
+            reason = 'Contenu populaire pour votre profil'
+        recommendations.append(content_to_recommendation(content, source, reason))
+
+    return {
+        "cluster_id": cluster_id,
+        "total_recommendations": len(recommendations),
+        "recommendations": recommendations,
+        "reasoning": {
+            "strategy": "Sélection pré-calculée (tirage reproductible) par cluster et niveaux + 1 défi prioritaire",
+            **meta["pools"].get(str(cluster_id), {})
+        },
+        "generated_at": meta["generated_at"],
+        "system_status": "ok"
+    }
+
+
+def get_user_recommendations(user_id: int, table_dir: str = RECO_TABLE_PATH) -> Optional[Dict[str, Any]]:
+    """
+    Serve the recommendations of a user from the materialized table.
+    Returns None if the table or the user is missing, so callers can fall back
+    to generate_simple_recommendations.
+    """
+    table = load_reco_table(table_dir)
+    if table is None:
+        return None
+    segment = find_user_segment(table, user_id)
+    if segment is None:
+        return None
+    return get_segment_recommendations(table, segment)
+
+
+def get_cluster_recommendations(cluster_id: int, table_dir: str = RECO_TABLE_PATH) -> Optional[Dict[str, Any]]:
+    """
+    Serve the recommendations of a cluster (users without any level) from the materialized table.
+    """
+    table = load_reco_table(table_dir)
+    if table is None:
+        return None
+    return get_segment_recommendations(table, segment_index(cluster_id, 0))
+
+
+if __name__ == "__main__":
+    df_assignments = pd.read_csv(os.path.join(DATA_PATH, 'user_cluster_assignments.csv'))
+    df_reco = load_recommendations_csv()
+
+    meta = build_reco_table(df_assignments, df_reco)
+    print(f"✅ Table de recommandations générée dans {RECO_TABLE_PATH}")
+    print(f"📊 {meta['n_users']} utilisateurs, {meta['n_segments']} segments - {meta['generated_at']}")
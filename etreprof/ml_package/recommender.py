@@ -1,28 +1,47 @@
 import os
+import numpy as np
 import pandas as pd
 import random
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
+from .artifacts import artifact_manager, ArtifactError
+from .popularity import popularity_alias_table
 
 ROOT_PATH = os.path.dirname(os.path.abspath(__file__))
+RECOMMENDATIONS_CSV_PATH = os.path.join(os.path.dirname(os.path.dirname(ROOT_PATH)), 'data/content_recommendations_mapping.csv')
+RECOMMENDATIONS_COLUMNS = ['id', 'title', 'type', 'priority_challenge'] + [f'cluster_{k}' for k in range(5)]
+# Contents drawn once per cluster to replace the consumed contents of shared recommendations
+NUM_REPLACEMENTS = int(os.getenv("NUM_REPLACEMENTS", "20"))
+
+def validate_recommendations(df_reco):
+    """
+    Check that a recommendations mapping has the columns the recommenders read.
+    """
+    missing_columns = [c for c in RECOMMENDATIONS_COLUMNS if c not in df_reco.columns]
+    if missing_columns:
+        raise ArtifactError(f"Missing columns in the recommendations mapping: {missing_columns}")
+    if df_reco['id'].isna().all():
+        raise ArtifactError("The recommendations mapping has no content")
+
+artifact_manager.register(
+    "recommendations",
+    paths=lambda: [RECOMMENDATIONS_CSV_PATH],
+    load=lambda: pd.read_csv(RECOMMENDATIONS_CSV_PATH),
+    validate=validate_recommendations
+)
 
 def load_recommendations_csv():
     """
     Load the content recommendations mapping CSV file.
+    The mapping is loaded once and swapped when the file changes (see artifacts.py),
+    callers must not modify it.
     Returns:
     -------
     pd.DataFrame: DataFrame containing content recommendations.
-    If the file does not exist, returns None.
-    If there is an error during loading, returns None and prints the error.
+    If the file does not exist or is invalid, returns None and prints the error.
     """
-    csv_path = os.path.join(os.path.dirname(os.path.dirname(ROOT_PATH)), 'data/content_recommendations_mapping.csv')
-
     try:
-        df_reco = pd.read_csv(csv_path)
-        return df_reco
-    except FileNotFoundError:
-        print(f"❌ Fichier non trouvé: {csv_path}")
-        return None
-    except Exception as e:
+        return artifact_manager.get("recommendations")
+    except ArtifactError as e:
         print(f"❌ Erreur lors du chargement: {e}")
         return None
 
@@ -53,7 +72,37 @@ def build_url(content_id, content_type):
     else:
         return "https://etreprof.fr"
 
-def generate_simple_recommendations(cluster_id: int, num_recommendations: int = 5) -> Dict[str, Any]:
+def content_to_recommendation(content, source: str, reason: str) -> Dict[str, Any]:
+    """
+    Build the recommendation dictionary returned by the API for one content row.
+
+    Parameters
+    ----------
+    content : pd.Series or dict
+        Content row with at least 'id', 'title', 'type' and 'priority_challenge'.
+    source : str
+        Origin of the recommendation ('cluster_matching' or 'priority_challenge').
+    reason : str
+        Human readable reason displayed to the user.
+
+    Returns
+    -------
+    Dict[str, Any]: The recommendation dictionary.
+    """
+    is_priority = source == 'priority_challenge'
+    return {
+        'id': int(content['id']) if pd.notna(content['id']) else None,
+        'title': str(content['title']) if pd.notna(content['title']) else 'Titre non disponible',
+        'type': str(content['type']) if pd.notna(content['type']) else 'contenu',
+        'url': build_url(content['id'], content['type']),
+        'source': source,
+        'reason': reason,
+        'is_priority_challenge': is_priority,
+        'priority_challenge': str(content['priority_challenge']) if is_priority else None
+    }
+
+def generate_simple_recommendations(cluster_id: int, num_recommendations: int = 5,
+                                    exclude_ids=None) -> Dict[str, Any]:
     """
     Generate simple recommendations based on a CSV mapping of content to clusters.
     Parameters
@@ -62,6 +111,9 @@ def generate_simple_recommendations(cluster_id: int, num_recommendations: int =
         The cluster ID for which to generate recommendations (0-4).
     num_recommendations : int
         The number of recommendations to generate (default is 5).
+    exclude_ids : array-like, optional
+        Content ids not to recommend (contents the user already consumed), ignored when
+        fewer than num_recommendations contents of the cluster would remain.
     Returns
     -------
     Dict[str, Any]: A dictionary containing the cluster ID, total recommendations,
@@ -107,62 +159,73 @@ def generate_simple_recommendations(cluster_id: int, num_recommendations: int =
         normal_contents = cluster_contents[cluster_contents['priority_challenge'].isna()].copy()
         priority_contents = cluster_contents[cluster_contents['priority_challenge'].notna()].copy()
 
+        # Contents already consumed are left out, unless too few contents would remain
+        normal_consumed = np.zeros(len(normal_contents), dtype=bool)
+        priority_consumed = np.zeros(len(priority_contents), dtype=bool)
+        if exclude_ids is not None and len(exclude_ids) > 0:
+            normal_consumed = normal_contents['id'].isin(exclude_ids).values
+            priority_consumed = priority_contents['id'].isin(exclude_ids).values
+            if len(cluster_contents) - normal_consumed.sum() - priority_consumed.sum() < num_recommendations:
+                normal_consumed[:] = False
+                priority_consumed[:] = False
+        available_normal = normal_contents[~normal_consumed]
+        available_priority = priority_contents[~priority_consumed]
+
         recommendations = []
 
+        # Draws weighted by the popularity of the contents in the cluster when the
+        # counters have been computed (see popularity.py), uniform otherwise
+        normal_table = popularity_alias_table('normal', cluster_id, normal_contents['id'].values, df_reco)
+        priority_table = popularity_alias_table('priority', cluster_id, priority_contents['id'].values, df_reco)
+        rng = np.random.default_rng()
+
         # 3. Select normal contents randomly
-        num_normal = min(num_recommendations - 1, len(normal_contents))  # Leave space for 1 priority challenge
+        num_normal = min(num_recommendations - 1, len(available_normal))  # Leave space for 1 priority challenge
 
         if num_normal > 0:
-            selected_normal = normal_contents.sample(n=num_normal, random_state=None).reset_index(drop=True)
+            if normal_table is not None:
+                drawn = normal_table.draw_distinct(rng, num_normal, exclude=np.flatnonzero(normal_consumed).tolist())
+                selected_normal = normal_contents.iloc[drawn]
+            else:
+                selected_normal = available_normal.sample(n=num_normal, random_state=None).reset_index(drop=True)
 
             for _, content in selected_normal.iterrows():
-                rec = {
-                    'id': int(content['id']) if pd.notna(content['id']) else None,
-                    'title': str(content['title']) if pd.notna(content['title']) else 'Titre non disponible',
-                    'type': str(content['type']) if pd.notna(content['type']) else 'contenu',
-                    'url': build_url(content['id'], content['type']),
-                    'source': 'cluster_matching',
-                    'reason': f'Contenu populaire pour votre profil',
-                    'is_priority_challenge': False,
-                    'priority_challenge': None
-                }
-                recommendations.append(rec)
+                recommendations.append(
+                    content_to_recommendation(content, 'cluster_matching', 'Contenu populaire pour votre profil')
+                )
 
         # 4. Select one priority challenge if available
-        if len(priority_contents) > 0 and len(recommendations) < num_recommendations:
-            selected_priority = priority_contents.sample(n=1, random_state=None).iloc[0]
-
-            priority_rec = {
-                'id': int(selected_priority['id']) if pd.notna(selected_priority['id']) else None,
-                'title': str(selected_priority['title']) if pd.notna(selected_priority['title']) else 'Titre non disponible',
-                'type': str(selected_priority['type']) if pd.notna(selected_priority['type']) else 'contenu',
-                'url': build_url(selected_priority['id'], selected_priority['type']),
-                'source': 'priority_challenge',
-                'reason': f'Développement professionnel - {selected_priority["priority_challenge"]}',
-                'is_priority_challenge': True,
-                'priority_challenge': str(selected_priority['priority_challenge'])
-            }
-            recommendations.append(priority_rec)
+        if len(available_priority) > 0 and len(recommendations) < num_recommendations:
+            if priority_table is not None:
+                drawn = priority_table.draw_distinct(rng, 1, exclude=np.flatnonzero(priority_consumed).tolist())
+                selected_priority = priority_contents.iloc[drawn[0]]
+            else:
+                selected_priority = available_priority.sample(n=1, random_state=None).iloc[0]
+
+            recommendations.append(
+                content_to_recommendation(
+                    selected_priority,
+                    'priority_challenge',
+                    f'Développement professionnel - {selected_priority["priority_challenge"]}'
+                )
+            )
 
         # 5. Compléter si on n'a pas assez de contenus
         while len(recommendations) < num_recommendations:
             # Prendre du contenu normal supplémentaire s'il y en a
-            remaining_normal = normal_contents[~normal_contents['id'].isin([r['id'] for r in recommendations])]
+            selected_ids = [r['id'] for r in recommendations]
+            remaining_normal = available_normal[~available_normal['id'].isin(selected_ids)]
 
             if len(remaining_normal) > 0:
-                extra_content = remaining_normal.sample(n=1, random_state=None).iloc[0]
-
-                extra_rec = {
-                    'id': int(extra_content['id']) if pd.notna(extra_content['id']) else None,
-                    'title': str(extra_content['title']) if pd.notna(extra_content['title']) else 'Titre non disponible',
-                    'type': str(extra_content['type']) if pd.notna(extra_content['type']) else 'contenu',
-                    'url': build_url(extra_content['id'], extra_content['type']),
-                    'source': 'cluster_matching',
-                    'reason': f'Contenu additionnel pour votre profil',
-                    'is_priority_challenge': False,
-                    'priority_challenge': None
-                }
-                recommendations.append(extra_rec)
+                if normal_table is not None:
+                    excluded = np.flatnonzero(normal_consumed | normal_contents['id'].isin(selected_ids).values).tolist()
+                    extra_content = normal_contents.iloc[normal_table.draw_distinct(rng, 1, exclude=excluded)[0]]
+                else:
+                    extra_content = remaining_normal.sample(n=1, random_state=None).iloc[0]
+
+                recommendations.append(
+                    content_to_recommendation(extra_content, 'cluster_matching', 'Contenu additionnel pour votre profil')
+                )
             else:
                 break
 
@@ -174,7 +237,9 @@ def generate_simple_recommendations(cluster_id: int, num_recommendations: int =
             "total_recommendations": len(recommendations),
             "recommendations": recommendations,
             "reasoning": {
-                "strategy": "Sélection aléatoire basée sur topics populaires + 1 défi prioritaire",
+                "strategy": ("Sélection pondérée par la popularité récente dans le cluster + 1 défi prioritaire"
+                             if normal_table is not None or priority_table is not None
+                             else "Sélection aléatoire basée sur topics populaires + 1 défi prioritaire"),
                 "available_contents": len(cluster_contents),
                 "normal_contents": len(normal_contents),
                 "priority_contents": len(priority_contents)
@@ -188,3 +253,29 @@ def generate_simple_recommendations(cluster_id: int, num_recommendations: int =
             "cluster_id": cluster_id,
             "recommendations": []
         }
+
+
+def replace_consumed_recommendations(recommendations: List[Dict[str, Any]], consumed_ids,
+                                     replacements: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+    """
+    Recommendations shared by many users, for one user: each content the user already
+    consumed is replaced by the first of the replacements (a larger draw of the cluster)
+    neither consumed nor already recommended.
+
+    Returns
+    -------
+    List[Dict[str, Any]] or None: The recommendations of the user, or None when the
+    replacements run out (callers then draw for the user).
+    """
+    consumed = set(np.asarray(consumed_ids).tolist())
+    recommended = {r['id'] for r in recommendations if r['id'] not in consumed}
+    candidates = (r for r in replacements if r['id'] not in consumed and r['id'] not in recommended)
+
+    user_recommendations = []
+    for recommendation in recommendations:
+        if recommendation['id'] in consumed:
+            recommendation = next(candidates, None)
+            if recommendation is None:
+                return None
+        user_recommendations.append(recommendation)
+    return user_recommendations
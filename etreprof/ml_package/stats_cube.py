@@ -0,0 +1,221 @@
+"""
+Aggregate cube of the users for the dashboard statistics.
+
+At recompute time, the users are grouped once by cluster, académie, département, degré
+and establishment flags (maternelle ... autre). Each non-empty cell keeps the number of
+users and, for every feature, the sum and the number of non-missing values. A query
+filters the cells (slice) and adds them up by the requested dimensions (roll-up), so it
+reads the cells only, never the users, and the means of any roll-up are exact.
+
+Files written in STATS_CUBE_DIR:
+- codes.npy  : int32 (n_cells, n_dimensions), code of each dimension value of a cell
+- counts.npy : int64 (n_cells,) users of each cell
+- sums.npy   : float64 (n_cells, n_features) sum of each feature
+- valid.npy  : int64 (n_cells, n_features) non-missing values of each feature
+- meta.json  : dimensions with their values, features, build timestamp (written last)
+"""
+import os
+import json
+import numpy as np
+import pandas as pd
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+from .artifacts import artifact_manager, ArtifactError
+from etreprof.data_processing.user_transforms import niveaux_etablissements
+
+ROOT_PATH = os.path.dirname(os.path.abspath(__file__))
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(ROOT_PATH)), 'data')
+STATS_CUBE_PATH = os.getenv("STATS_CUBE_DIR", os.path.join(DATA_PATH, 'stats_cube'))
+
+CUBE_DIMENSIONS = ['cluster', 'academie', 'departement', 'degre'] + list(niveaux_etablissements)
+# Features averaged in the cube (those present in the users dataframe)
+CUBE_FEATURES = [
+    'anciennete', 'total_interactions', 'diversite_contenus', 'topic_count', 'nb_opened_mail', 'nb_clicked_mail',
+    'activity_level', 'email_engagement', 'content_usage', 'recent_activity', 'past_activity', 'annual_consistency'
+]
+ARRAYS = ['codes', 'counts', 'sums', 'valid']
+
+
+def _json_value(value):
+    """Dimension value as stored in meta.json: None when missing, int when integral."""
+    if pd.isna(value):
+        return None
+    if isinstance(value, (int, float, np.integer, np.floating)) and float(value).is_integer():
+        return int(value)
+    return str(value)
+
+
+def build_stats_cube(df_users: pd.DataFrame, clusters=None, output_dir: str = STATS_CUBE_PATH) -> Dict[str, Any]:
+    """
+    Aggregate the users into the cube and write it to output_dir.
+
+    Parameters
+    ----------
+    df_users : pandas.DataFrame
+        Processed users (main_process_users output) with the dimensions of CUBE_DIMENSIONS.
+    clusters : array-like, optional
+        Cluster of each user (default is the 'cluster' column).
+    output_dir : str
+        Directory where the cube is written.
+
+    Returns
+    -------
+    Dict[str, Any]: The content of meta.json.
+    """
+    df_users = df_users.assign(cluster=clusters) if clusters is not None else df_users
+    features = [f for f in CUBE_FEATURES if f in df_users.columns]
+
+    # Code of every user for each dimension, missing values (and missing columns) get their own code
+    codes, values = [], {}
+    for dimension in CUBE_DIMENSIONS:
+        column = df_users[dimension] if dimension in df_users.columns else pd.Series(np.nan, index=df_users.index)
+        if dimension in niveaux_etablissements:
+            column = column.fillna(0).astype(int)
+        dimension_codes, uniques = pd.factorize(column, use_na_sentinel=False)
+        codes.append(dimension_codes)
+        values[dimension] = [_json_value(v) for v in uniques]
+
+    # Non-empty cells
+    sizes = [max(len(values[d]), 1) for d in CUBE_DIMENSIONS]
+    user_cells, cell_keys = pd.factorize(np.ravel_multi_index(codes, sizes))
+    n_cells = len(cell_keys)
+    feature_values = df_users[features].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+    present = ~np.isnan(feature_values)
+
+    arrays = {
+        'codes': np.stack(np.unravel_index(cell_keys, sizes), axis=1).astype(np.int32),
+        'counts': np.bincount(user_cells, minlength=n_cells).astype(np.int64),
+        'sums': np.stack([np.bincount(user_cells, weights=np.where(present[:, j], feature_values[:, j], 0),
+                                      minlength=n_cells) for j in range(len(features))], axis=1).reshape(n_cells, len(features)),
+        'valid': np.stack([np.bincount(user_cells, weights=present[:, j], minlength=n_cells)
+                           for j in range(len(features))], axis=1).reshape(n_cells, len(features)).astype(np.int64)
+    }
+
+    os.makedirs(output_dir, exist_ok=True)
+    for name, array in arrays.items():
+        tmp_path = os.path.join(output_dir, f'.{name}.npy.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp_path, os.path.join(output_dir, f'{name}.npy'))
+
+    meta = {
+        "generated_at": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        "n_users": int(len(df_users)),
+        "n_cells": int(n_cells),
+        "dimensions": {dimension: values[dimension] for dimension in CUBE_DIMENSIONS},
+        "features": features
+    }
+    tmp_path = os.path.join(output_dir, '.meta.json.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp_path, os.path.join(output_dir, 'meta.json'))
+    return meta
+
+
+def read_stats_cube(cube_dir: str = STATS_CUBE_PATH) -> Optional[Dict[str, Any]]:
+    """
+    Read the cube, memory-mapped, or None if it has not been built.
+    """
+    meta_path = os.path.join(cube_dir, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    cube = {name: np.load(os.path.join(cube_dir, f'{name}.npy'), mmap_mode='r') for name in ARRAYS}
+    return {**cube, "meta": meta}
+
+
+def validate_stats_cube(cube):
+    """
+    Check that the arrays describe the cells and features listed in meta.json.
+    """
+    if cube is None:
+        return
+    n_cells, n_features = cube["meta"]["n_cells"], len(cube["meta"]["features"])
+    expected = {'codes': (n_cells, len(cube["meta"]["dimensions"])), 'counts': (n_cells,),
+                'sums': (n_cells, n_features), 'valid': (n_cells, n_features)}
+    for name, shape in expected.items():
+        if cube[name].shape != shape:
+            raise ArtifactError(f"{name} has shape {cube[name].shape}, expected {shape}")
+
+artifact_manager.register(
+    "stats_cube",
+    paths=lambda: [os.path.join(STATS_CUBE_PATH, 'meta.json')],
+    load=read_stats_cube,
+    validate=validate_stats_cube
+)
+
+
+def load_stats_cube() -> Optional[Dict[str, Any]]:
+    """
+    Get the active cube, or None if it has not been built.
+    It is loaded once and swapped when it is rebuilt (see artifacts.py).
+    """
+    return artifact_manager.get("stats_cube")
+
+
+def query_stats_cube(cube: Dict[str, Any], filters: Dict[str, List[str]], group_by: List[str]) -> Dict[str, Any]:
+    """
+    Slice the cube on filters and roll it up to the group_by dimensions.
+
+    Parameters
+    ----------
+    cube : Dict[str, Any]
+        The cube (see load_stats_cube).
+    filters : Dict[str, List[str]]
+        Accepted values of some dimensions, as strings ('null' for missing values).
+    group_by : List[str]
+        Dimensions kept in the result, the others are added up.
+
+    Returns
+    -------
+    Dict[str, Any]
+        'rows' (one per group, most users first) with the dimension values, 'count' and
+        'means' of the features, 'total' users and 'cells' read.
+    """
+    dimensions = list(cube["meta"]["dimensions"])
+    unknown = [d for d in list(filters) + list(group_by) if d not in dimensions]
+    if unknown:
+        raise ValueError(f"Unknown dimensions {unknown}, available: {dimensions}")
+
+    codes = cube["codes"]
+    selected = np.ones(len(codes), dtype=bool)
+    for dimension, accepted in filters.items():
+        labels = ['null' if v is None else str(v) for v in cube["meta"]["dimensions"][dimension]]
+        accepted_codes = [code for code, label in enumerate(labels) if label in set(accepted)]
+        selected &= np.isin(codes[:, dimensions.index(dimension)], accepted_codes)
+
+    # Group of each selected cell, on a single integer key of the group_by codes
+    columns = [dimensions.index(d) for d in group_by]
+    sizes = [max(len(cube["meta"]["dimensions"][d]), 1) for d in group_by]
+    group_codes = codes[selected][:, columns]
+    if len(columns):
+        group_keys, cell_groups = np.unique(np.ravel_multi_index(group_codes.T, sizes), return_inverse=True)
+        groups = np.stack(np.unravel_index(group_keys, sizes), axis=1)
+    else:
+        groups, cell_groups = np.zeros((1, 0), dtype=np.int64), np.zeros(int(selected.sum()), dtype=np.int64)
+    n_groups = len(groups) if selected.any() else 0
+
+    counts = np.bincount(cell_groups, weights=cube["counts"][selected], minlength=n_groups)
+    features = cube["meta"]["features"]
+    sums = np.stack([np.bincount(cell_groups, weights=cube["sums"][selected, j], minlength=n_groups)
+                     for j in range(len(features))], axis=1) if features else np.zeros((n_groups, 0))
+    valid = np.stack([np.bincount(cell_groups, weights=cube["valid"][selected, j], minlength=n_groups)
+                      for j in range(len(features))], axis=1) if features else np.zeros((n_groups, 0))
+
+    rows = []
+    for g in np.argsort(-counts[:n_groups], kind='stable'):
+        row = {d: cube["meta"]["dimensions"][d][int(groups[g, k])] for k, d in enumerate(group_by)}
+        row["count"] = int(counts[g])
+        row["means"] = {f: round(float(sums[g, j] / valid[g, j]), 4) if valid[g, j] > 0 else None
+                        for j, f in enumerate(features)}
+        rows.append(row)
+
+    return {"rows": rows, "total": int(counts.sum()), "cells": int(selected.sum())}
+
+
+if __name__ == "__main__":
+    df_users = pd.read_csv(os.path.join(DATA_PATH, 'users_final_with_clusters.csv'), low_memory=False)
+    meta = build_stats_cube(df_users)
+    print(f"✅ Cube de statistiques généré dans {STATS_CUBE_PATH}")
+    print(f"📊 {meta['n_users']} utilisateurs, {meta['n_cells']} cellules - {meta['generated_at']}")
@@ -0,0 +1,128 @@
+"""
+Topics of the contents already classified, by content id.
+
+The content_with_topics table (notebook export or reclassify job) is loaded as sorted
+arrays: content ids, topic, confidence and the hash of the cleaned markdown that was
+classified. A content id found with the same markdown hash gets its stored topic
+without running the encoder and BERTopic; an unknown id, or a content whose markdown
+changed since it was classified, goes through the model.
+
+The hash is computed on the cleaned markdown (the text the topic model reads), so an
+edit of the formatting alone does not send a content back to the model. Tables without
+a 'markdown_hash' column (written by reclassify) cannot tell an edited content apart:
+their topics are served by id, but a content sent with its markdown goes to the model.
+"""
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+from typing import Dict, Any, Optional
+from .artifacts import artifact_manager
+from .preprocessing import clean_markdown
+
+ROOT_PATH = os.path.dirname(os.path.abspath(__file__))
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(ROOT_PATH)), 'data')
+CONTENT_TOPICS_PATH = os.getenv("CONTENT_TOPICS_PATH", os.path.join(DATA_PATH, 'content_with_topics.csv'))
+BERTOPIC_PATH = os.path.join(ROOT_PATH, 'pickles/bertopic')
+
+# Stored hash of the contents classified without one
+NO_HASH = 0
+
+
+def document_hash(document: str) -> int:
+    """
+    64-bit hash of a cleaned document.
+    """
+    return int.from_bytes(hashlib.blake2b(document.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def markdown_hash(content: str) -> int:
+    """
+    64-bit hash of a markdown content, cleaned as classify_contents cleans it.
+    """
+    return document_hash(clean_markdown(content) or str(content).strip())
+
+
+def read_topic_index() -> Optional[Dict[str, Any]]:
+    """
+    Read the content topics as arrays sorted by content id, with the topic labels of
+    topics.json. None if the table does not exist. The first row of an id wins, as in
+    user_contents.content_topic_lookup: an id whose first row has no topic has none.
+    """
+    if not os.path.exists(CONTENT_TOPICS_PATH):
+        return None
+    header = pd.read_csv(CONTENT_TOPICS_PATH, nrows=0).columns
+    columns = [c for c in ['id', 'reduced topics', 'confidence', 'markdown_hash'] if c in header]
+    df = pd.read_csv(CONTENT_TOPICS_PATH, usecols=columns, dtype={'markdown_hash': str})
+    df = df.dropna(subset=['id']).drop_duplicates(subset='id').dropna(subset=['reduced topics']).sort_values('id')
+    df = df.reindex(columns=['id', 'reduced topics', 'confidence', 'markdown_hash'])
+
+    with open(os.path.join(BERTOPIC_PATH, 'topics.json'), 'r', encoding='utf-8') as f:
+        topic_labels = json.load(f)['topic_labels']
+    return {
+        "ids": df['id'].values.astype(np.int64),
+        "topics": df['reduced topics'].values.astype(np.int64),
+        "confidences": pd.to_numeric(df['confidence'], errors='coerce').values.astype(np.float32),
+        "hashes": np.array([int(h, 16) if isinstance(h, str) else NO_HASH for h in df['markdown_hash']], dtype=np.uint64),
+        "labels": {topic_id: label.split("_", 1)[1] if "_" in label else label
+                   for topic_id, label in topic_labels.items()}
+    }
+
+artifact_manager.register(
+    "topic_index",
+    paths=lambda: [CONTENT_TOPICS_PATH, os.path.join(BERTOPIC_PATH, 'topics.json')],
+    load=read_topic_index
+)
+
+
+def load_topic_index() -> Optional[Dict[str, Any]]:
+    """
+    Get the active content topics index, or None without content_with_topics table.
+    It is loaded once and swapped when the table changes (see artifacts.py).
+    """
+    return artifact_manager.get("topic_index")
+
+
+def lookup_content_topic(content_id: int, content: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Stored topic of a content.
+
+    Parameters
+    ----------
+    content_id : int
+        The content id.
+    content : str, optional
+        The current markdown of the content, checked against the stored hash.
+
+    Returns
+    -------
+    Dict[str, Any]
+        'status': 'hit' (stored topic usable), 'unknown_id', 'edited' (markdown changed)
+        or 'unverified' (no stored hash to check the markdown against), and for a known id
+        the stored 'topic_principal' (id, label, confidence).
+    """
+    index = load_topic_index()
+    if index is None or len(index["ids"]) == 0:
+        return {"status": "unknown_id"}
+    position = int(np.searchsorted(index["ids"], content_id))
+    if position >= len(index["ids"]) or index["ids"][position] != content_id:
+        return {"status": "unknown_id"}
+
+    topic_id = int(index["topics"][position])
+    confidence = float(index["confidences"][position])
+    lookup = {
+        "status": "hit",
+        "topic_principal": {
+            "id": topic_id,
+            "label": index["labels"].get(str(topic_id), f"Topic {topic_id}"),
+            "confidence": round(confidence * 100, 1) if not np.isnan(confidence) else None
+        }
+    }
+    if content is not None:
+        stored_hash = int(index["hashes"][position])
+        if stored_hash == NO_HASH:
+            lookup["status"] = "unverified"
+        elif stored_hash != markdown_hash(content):
+            lookup["status"] = "edited"
+    return lookup
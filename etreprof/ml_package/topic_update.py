@@ -0,0 +1,349 @@
+"""
+Incremental update of the BERTopic model with newly published contents.
+
+Only the new contents are embedded. Each one is assigned to the closest existing topic
+when its cosine similarity to that topic embedding reaches zeroshot_min_similarity
+(config.json); the others are kept in a buffer. Once the buffer holds enough documents,
+it is clustered (average-linkage agglomerative clustering on cosine distance, cut at
+1 - zeroshot_min_similarity) and every cluster of at least min_topic_size documents
+becomes a new topic: its embedding is the mean of its documents' embeddings and its
+label the top c-TF-IDF words of its documents. The new topics are appended to
+topic_embeddings.safetensors and topics.json, so the existing documents are never
+embedded again and the loaded model (cosine similarity to the topic embeddings) assigns
+new documents to them. The API swaps the updated model in (see artifacts.py).
+
+Files written in TOPIC_BUFFER_DIR (the buffer):
+- ids.npy        : int64 content ids
+- embeddings.npy : float32 normalized embeddings (n x dim)
+- documents.json : cleaned documents (for the labels of the new topics)
+- meta.json      : number of documents, update time (written last)
+
+Usage:
+    python -m etreprof.ml_package.topic_update --input raw_data/contents_v3.csv \
+        --export-csv data/content_with_topics.csv
+"""
+import os
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+from .preprocessing import clean_markdown
+from .topic_index import document_hash
+
+ROOT_PATH = os.path.dirname(os.path.abspath(__file__))
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(ROOT_PATH)), 'data')
+BERTOPIC_PATH = os.path.join(ROOT_PATH, 'pickles/bertopic')
+TOPIC_BUFFER_PATH = os.getenv("TOPIC_BUFFER_DIR", os.path.join(DATA_PATH, 'topic_buffer'))
+# Buffered documents needed before looking for new topics
+TOPIC_BUFFER_MIN_DOCUMENTS = int(os.getenv("TOPIC_BUFFER_MIN_DOCUMENTS", "50"))
+# Words of the label of a new topic, and of its representation
+LABEL_WORDS = 4
+REPRESENTATION_WORDS = 10
+
+CONTENT_TYPES = ['article', 'fiche_outils', 'guide_pratique']
+FRENCH_STOP_WORDS = [
+    'alors', 'après', 'au', 'aussi', 'autre', 'aux', 'avec', 'avoir', 'bien', 'car', 'ce', 'cela', 'ces', 'cet',
+    'cette', 'chaque', 'comme', 'comment', 'dans', 'de', 'des', 'donc', 'du', 'elle', 'elles', 'en', 'encore',
+    'entre', 'est', 'et', 'être', 'faire', 'fait', 'ils', 'je', 'la', 'le', 'les', 'leur', 'leurs', 'lors', 'mais',
+    'même', 'mes', 'mon', 'nos', 'notre', 'nous', 'ont', 'ou', 'où', 'par', 'pas', 'peut', 'plus', 'pour', 'quand',
+    'que', 'qui', 'sa', 'sans', 'se', 'ses', 'si', 'son', 'sont', 'sur', 'tous', 'tout', 'toute', 'toutes', 'très',
+    'un', 'une', 'vos', 'votre', 'vous', 'élèves', 'classe'
+]
+
+
+def _normalize(embeddings) -> np.ndarray:
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.where(norms == 0, 1, norms)
+
+
+def _write_atomic(path: str, write):
+    tmp_path = os.path.join(os.path.dirname(path), f'.{os.path.basename(path)}.tmp')
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _write_json(path: str, payload):
+    def write(tmp_path):
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False, indent=2)
+    _write_atomic(path, write)
+
+
+def read_topic_files(bertopic_path: str = BERTOPIC_PATH) -> Dict[str, Any]:
+    """
+    Read the saved model files the update changes: config, topics.json and topic embeddings.
+    """
+    from safetensors.numpy import load_file
+
+    with open(os.path.join(bertopic_path, 'config.json'), 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    with open(os.path.join(bertopic_path, 'topics.json'), 'r', encoding='utf-8') as f:
+        topics = json.load(f)
+    embeddings = load_file(os.path.join(bertopic_path, 'topic_embeddings.safetensors'))['topic_embeddings']
+    return {"config": config, "topics": topics, "embeddings": embeddings}
+
+
+def assign_topics(embeddings: np.ndarray, topic_embeddings: np.ndarray, min_similarity: float, outliers: int = 1):
+    """
+    Closest topic of every embedding, or -1 when it is below min_similarity to every topic.
+    The first `outliers` rows of topic_embeddings (outlier topic -1) are not candidates.
+
+    Returns
+    -------
+    Tuple
+        The topic ids and the similarity to the closest topic.
+    """
+    if len(embeddings) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    similarities = _normalize(embeddings) @ _normalize(topic_embeddings[outliers:]).T
+    closest = np.argmax(similarities, axis=1)
+    best = similarities[np.arange(len(closest)), closest]
+    return np.where(best >= min_similarity, closest, -1).astype(np.int64), best.astype(np.float32)
+
+
+def cluster_documents(embeddings: np.ndarray, min_similarity: float, min_size: int) -> np.ndarray:
+    """
+    Cluster normalized embeddings: average linkage on cosine distance, cut at 1 - min_similarity.
+    Returns the cluster of every embedding, -1 for the clusters smaller than min_size.
+    """
+    from sklearn.cluster import AgglomerativeClustering
+
+    if len(embeddings) < max(min_size, 2):
+        return np.full(len(embeddings), -1, dtype=np.int64)
+    labels = AgglomerativeClustering(n_clusters=None, metric='cosine', linkage='average',
+                                     distance_threshold=1 - min_similarity).fit_predict(embeddings)
+    sizes = np.bincount(labels)
+    kept = np.flatnonzero(sizes >= min_size)
+    remap = np.full(len(sizes), -1, dtype=np.int64)
+    remap[kept] = np.arange(len(kept))
+    return remap[labels]
+
+
+def topic_words(documents: List[str], labels: np.ndarray, n_words: int = REPRESENTATION_WORDS) -> Dict[int, list]:
+    """
+    Top c-TF-IDF words of every cluster (label -1, the unclustered documents, is a class too
+    so that words common to every document rank low).
+    """
+    from sklearn.feature_extraction.text import CountVectorizer
+
+    classes = np.unique(labels)
+    joined = [' '.join(d for d, label in zip(documents, labels) if label == c) for c in classes]
+    vectorizer = CountVectorizer(stop_words=FRENCH_STOP_WORDS, token_pattern=r'(?u)\b[^\W\d_]{3,}\b')
+    counts = vectorizer.fit_transform(joined).toarray().astype(np.float64)
+    words = vectorizer.get_feature_names_out()
+    tf = counts / np.maximum(counts.sum(axis=1, keepdims=True), 1)
+    idf = np.log(1 + counts.sum(axis=1).mean() / np.maximum(counts.sum(axis=0), 1))
+    scores = tf * idf
+    return {
+        int(c): [[str(words[j]), round(float(scores[row, j]), 4)] for j in np.argsort(-scores[row])[:n_words]]
+        for row, c in enumerate(classes) if c >= 0
+    }
+
+
+def read_buffer(buffer_dir: str = TOPIC_BUFFER_PATH, dim: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Read the buffer of documents far from every topic (empty if it was never written).
+    """
+    if not os.path.exists(os.path.join(buffer_dir, 'meta.json')):
+        return {"ids": np.zeros(0, dtype=np.int64), "embeddings": np.zeros((0, dim or 0), dtype=np.float32),
+                "documents": []}
+    with open(os.path.join(buffer_dir, 'documents.json'), 'r', encoding='utf-8') as f:
+        documents = json.load(f)
+    return {
+        "ids": np.load(os.path.join(buffer_dir, 'ids.npy')),
+        "embeddings": np.load(os.path.join(buffer_dir, 'embeddings.npy')),
+        "documents": documents
+    }
+
+
+def write_buffer(buffer: Dict[str, Any], buffer_dir: str = TOPIC_BUFFER_PATH):
+    """
+    Write the buffer, every file under a temporary name then swapped in, meta.json last.
+    """
+    os.makedirs(buffer_dir, exist_ok=True)
+    for name in ['ids', 'embeddings']:
+        def write(tmp_path, array=buffer[name]):
+            with open(tmp_path, 'wb') as f:
+                np.save(f, array)
+        _write_atomic(os.path.join(buffer_dir, f'{name}.npy'), write)
+    _write_json(os.path.join(buffer_dir, 'documents.json'), buffer["documents"])
+    _write_json(os.path.join(buffer_dir, 'meta.json'), {
+        "n_documents": len(buffer["ids"]),
+        "updated_at": datetime.now(timezone.utc).isoformat(timespec='seconds')
+    })
+
+
+def merge_new_topics(model_files: Dict[str, Any], centroids: np.ndarray, words: List[list], sizes: List[int],
+                     bertopic_path: str = BERTOPIC_PATH) -> List[int]:
+    """
+    Append new topics to the saved model: a row of topic_embeddings.safetensors and the
+    label, size, representation and mapper row of each topic in topics.json (written last).
+    Returns the ids of the new topics.
+    """
+    from safetensors.numpy import save_file
+
+    topics = model_files["topics"]
+    first_id = len(model_files["embeddings"]) - topics.get("_outliers", 1)
+    new_ids = list(range(first_id, first_id + len(centroids)))
+    embeddings = np.vstack([model_files["embeddings"], centroids.astype(model_files["embeddings"].dtype)])
+
+    for topic_id, topic_words_, size in zip(new_ids, words, sizes):
+        key = str(topic_id)
+        topics["topic_labels"][key] = f"{topic_id}_" + ", ".join(w for w, _ in topic_words_[:LABEL_WORDS])
+        topics["topic_sizes"][key] = int(size)
+        topics["topic_representations"][key] = topic_words_
+        if topics.get("topic_mapper"):
+            # Rows map the topics of the fit (first column) to the current topics (last column)
+            mapper = topics["topic_mapper"]
+            mapper.append([max(row[0] for row in mapper) + 1] + [topic_id] * (len(mapper[0]) - 1))
+
+    _write_atomic(os.path.join(bertopic_path, 'topic_embeddings.safetensors'),
+                  lambda tmp_path: save_file({"topic_embeddings": np.ascontiguousarray(embeddings)}, tmp_path))
+    _write_json(os.path.join(bertopic_path, 'topics.json'), topics)
+    model_files["embeddings"] = embeddings
+    return new_ids
+
+
+def update_topic_model(df_contents: pd.DataFrame, encoder, bertopic_path: str = BERTOPIC_PATH,
+                       buffer_dir: str = TOPIC_BUFFER_PATH, min_buffer: int = TOPIC_BUFFER_MIN_DOCUMENTS,
+                       batch_size: int = 32) -> Dict[str, Any]:
+    """
+    Assign new contents to the topics, buffer the others and turn the buffer into new topics.
+
+    Parameters
+    ----------
+    df_contents : pandas.DataFrame
+        The new contents ('id', 'markdown'), not yet in the content topics table.
+    encoder : SentenceTransformer
+        The sentence encoder of the topic model (see models.load_embedding_model).
+    bertopic_path : str
+        Directory of the saved BERTopic model, updated in place.
+    buffer_dir : str
+        Directory of the buffer.
+    min_buffer : int
+        Buffered documents needed before clustering the buffer.
+    batch_size : int
+        Number of documents encoded at once.
+
+    Returns
+    -------
+    Dict[str, Any]
+        'assignments' (content_with_topics rows of the new contents: 'id', 'reduced topics',
+        'confidence', 'markdown_hash', -1 for buffered contents), 'new_topics' (id, label,
+        size), 'buffered' documents left and 'timings' in seconds.
+    """
+    timings = {}
+    model_files = read_topic_files(bertopic_path)
+    min_similarity = model_files["config"].get("zeroshot_min_similarity") or 0.7
+    min_size = model_files["config"].get("min_topic_size", 10)
+    outliers = model_files["topics"].get("_outliers", 1)
+    buffer = read_buffer(buffer_dir, model_files["embeddings"].shape[1])
+
+    start = time.perf_counter()
+    documents = df_contents['markdown'].apply(clean_markdown)
+    df_new = df_contents[(documents != '') & ~df_contents['id'].isin(buffer["ids"])]
+    documents = documents[df_new.index].tolist()
+    ids = df_new['id'].astype(np.int64).values
+    embeddings = _normalize(encoder.encode(documents, batch_size=batch_size, normalize_embeddings=True)) \
+        if documents else np.zeros((0, model_files["embeddings"].shape[1]), dtype=np.float32)
+    timings["embedding"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    topics, similarities = assign_topics(embeddings, model_files["embeddings"], min_similarity, outliers)
+    assignments = pd.DataFrame({
+        'id': ids,
+        'reduced topics': topics,
+        'confidence': similarities,
+        'markdown_hash': [f'{document_hash(d):016x}' for d in documents]
+    })
+    far = topics == -1
+    buffer = {
+        "ids": np.concatenate([buffer["ids"], ids[far]]),
+        "embeddings": np.vstack([buffer["embeddings"], embeddings[far]]),
+        "documents": buffer["documents"] + [d for d, f in zip(documents, far) if f]
+    }
+    timings["assignment"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    new_topics = []
+    if len(buffer["ids"]) >= min_buffer:
+        labels = cluster_documents(buffer["embeddings"], min_similarity, min_size)
+        n_clusters = int(labels.max()) + 1 if len(labels) else 0
+        if n_clusters:
+            words = topic_words(buffer["documents"], labels)
+            centroids = np.vstack([buffer["embeddings"][labels == c].mean(axis=0) for c in range(n_clusters)])
+            sizes = np.bincount(labels[labels >= 0], minlength=n_clusters).tolist()
+            new_ids = merge_new_topics(model_files, centroids, [words[c] for c in range(n_clusters)], sizes,
+                                       bertopic_path)
+
+            # Buffered documents close enough to a new topic leave the buffer with it
+            buffer_topics, buffer_similarities = assign_topics(buffer["embeddings"], model_files["embeddings"],
+                                                               min_similarity, outliers)
+            placed = buffer_topics >= 0
+            df_placed = pd.DataFrame({
+                'id': buffer["ids"][placed],
+                'reduced topics': buffer_topics[placed],
+                'confidence': buffer_similarities[placed],
+                'markdown_hash': [f'{document_hash(d):016x}' for d, p in zip(buffer["documents"], placed) if p]
+            })
+            assignments = pd.concat([assignments[~assignments['id'].isin(df_placed['id'])], df_placed],
+                                    ignore_index=True)
+            buffer = {
+                "ids": buffer["ids"][~placed],
+                "embeddings": buffer["embeddings"][~placed],
+                "documents": [d for d, p in zip(buffer["documents"], placed) if not p]
+            }
+            new_topics = [{"id": topic_id, "label": model_files["topics"]["topic_labels"][str(topic_id)], "size": size}
+                          for topic_id, size in zip(new_ids, sizes)]
+    write_buffer(buffer, buffer_dir)
+    timings["new_topics"] = time.perf_counter() - start
+
+    return {"assignments": assignments, "new_topics": new_topics, "buffered": len(buffer["ids"]), "timings": timings}
+
+
+def append_content_topics(df_assignments: pd.DataFrame, content_topics_path: str):
+    """
+    Add (or replace) the rows of the assignments in a content_with_topics CSV.
+    """
+    if os.path.exists(content_topics_path):
+        df_topics = pd.read_csv(content_topics_path, dtype={'markdown_hash': str})
+        df_topics = pd.concat([df_topics[~df_topics['id'].isin(df_assignments['id'])], df_assignments],
+                              ignore_index=True)
+    else:
+        df_topics = df_assignments
+    _write_atomic(content_topics_path, lambda tmp_path: df_topics.to_csv(tmp_path, index=False))
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Assign new contents to the topics and add the new topics")
+    parser.add_argument('--input', default=os.getenv("CONTENTS_URL_DB"),
+                        help="Contents CSV path or URL (default: CONTENTS_URL_DB)")
+    parser.add_argument('--export-csv', default=os.path.join(DATA_PATH, 'content_with_topics.csv'),
+                        help="content_with_topics CSV: contents already there are skipped, new ones are added")
+    parser.add_argument('--min-buffer', type=int, default=TOPIC_BUFFER_MIN_DOCUMENTS,
+                        help="Buffered documents needed before looking for new topics")
+    args = parser.parse_args()
+    if args.input is None:
+        parser.error("--input is required when CONTENTS_URL_DB is not set")
+
+    from .models import load_embedding_model
+
+    df_contents = pd.read_csv(args.input, usecols=['id', 'type', 'markdown'], low_memory=False)
+    df_contents = df_contents[df_contents['type'].isin(CONTENT_TYPES)].dropna(subset=['id'])
+    if os.path.exists(args.export_csv):
+        known_ids = pd.read_csv(args.export_csv, usecols=['id'])['id']
+        df_contents = df_contents[~df_contents['id'].isin(known_ids)]
+
+    result = update_topic_model(df_contents, load_embedding_model(), min_buffer=args.min_buffer)
+    append_content_topics(result["assignments"], args.export_csv)
+    assigned = int((result["assignments"]['reduced topics'] >= 0).sum())
+    print(f"✅ {len(df_contents)} nouveaux contenus, {assigned} assignés à un topic - {result['buffered']} en attente")
+    for topic in result["new_topics"]:
+        print(f"🆕 Topic {topic['id']}: {topic['label']} ({topic['size']} contenus)")